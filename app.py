@@ -1,23 +1,121 @@
 import os
 import enum
+import json
+import io
+import csv
+import base64
+import hashlib
 import logging
+import bisect
+import calendar
+import threading
+import functools
+from collections import OrderedDict, deque
 import atexit # Import atexit directly
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import socket
+import signal
+import sys
+import time
+import click
+try:
+	import fcntl # POSIX only; used to serialise database initialisation across workers
+except ImportError:
+	fcntl = None
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from apscheduler.schedulers.background import BackgroundScheduler
-from sqlalchemy import Enum # Removed 'event' import as it's no longer used here
+from sqlalchemy import Enum, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 # --- Configuration ---
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'tickets.db') # Path inside the container
+DATABASE_PATH = os.environ.get('DATABASE_PATH', os.path.join(BASE_DIR, 'data', 'tickets.db')) # Path inside the container
+# Archived (old, consumed) tickets live in a separate file ATTACHed as schema 'archive', so the main file can shrink
+ARCHIVE_DATABASE_PATH = os.environ.get('ARCHIVE_DATABASE_PATH', os.path.join(os.path.dirname(DATABASE_PATH), 'tickets-archive.db'))
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-very-secret-key' # TODO: Change in production!
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE_PATH}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DISTRIBUTION_CHUNK_SIZE'] = int(os.environ.get('DISTRIBUTION_CHUNK_SIZE', 5000)) # Rows per bulk INSERT and per distribution transaction
+app.config['DISTRIBUTION_RUN_RETENTION_DAYS'] = int(os.environ.get('DISTRIBUTION_RUN_RETENTION_DAYS', 30)) # How long distribution_run ledger rows are kept
+app.config['DISTRIBUTION_MAX_SLEEP_SECONDS'] = int(os.environ.get('DISTRIBUTION_MAX_SLEEP_SECONDS', 60)) # Longest gap between job runs
+# How often the scheduler checks for ticket types created or rescheduled by other processes (the web workers)
+app.config['DISTRIBUTION_WATCH_SECONDS'] = float(os.environ.get('DISTRIBUTION_WATCH_SECONDS', 2))
+# Default cap on missed periods issued when catching up after downtime (unset = issue them all)
+app.config['DISTRIBUTION_MAX_CATCH_UP_PERIODS'] = int(os.environ['DISTRIBUTION_MAX_CATCH_UP_PERIODS']) if os.environ.get('DISTRIBUTION_MAX_CATCH_UP_PERIODS') else None
+# Only the process holding this lease distributes; others take over once it expires (leader died)
+app.config['DISTRIBUTOR_LEASE_SECONDS'] = int(os.environ.get('DISTRIBUTOR_LEASE_SECONDS', 3 * app.config['DISTRIBUTION_MAX_SLEEP_SECONDS']))
+app.config['CONSUME_BATCH_MAX'] = int(os.environ.get('CONSUME_BATCH_MAX', 500)) # Tickets per POST /api/tickets/consume
+app.config['PAGINATION_MAX_LIMIT'] = int(os.environ.get('PAGINATION_MAX_LIMIT', 1000))
+app.config['STREAM_BATCH_SIZE'] = int(os.environ.get('STREAM_BATCH_SIZE', 500)) # Rows fetched per cursor round trip when streaming
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500)) # Rows validated together and committed per transaction
+app.config['IMPORT_MAX_REPORTED_ERRORS'] = int(os.environ.get('IMPORT_MAX_REPORTED_ERRORS', 1000)) # Rejected rows listed in the result (all are counted)
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+app.config['RESPONSE_CACHE_TTL_SECONDS'] = int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 300))
+# Cache-Control max-age for cached list responses; > 0 lets nginx (proxy_cache) serve them too
+app.config['RESPONSE_CACHE_MAX_AGE'] = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 0))
+# Server-Sent Events (/api/events)
+app.config['EVENT_LOG_RETENTION_SECONDS'] = int(os.environ.get('EVENT_LOG_RETENTION_SECONDS', 3600)) # How far back Last-Event-ID can resume
+app.config['SSE_POLL_SECONDS'] = float(os.environ.get('SSE_POLL_SECONDS', 1.0)) # Picks up events written by other processes
+app.config['SSE_HEARTBEAT_SECONDS'] = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+app.config['SSE_MAX_STREAM_SECONDS'] = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300)) # Clients reconnect (with Last-Event-ID) after this
+# Retention: consumed tickets older than this move to the archive file, leaving daily rollups behind
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000)) # Rows per (short) transaction
+app.config['ARCHIVE_MAX_BATCHES_PER_RUN'] = int(os.environ.get('ARCHIVE_MAX_BATCHES_PER_RUN', 50))
+app.config['ARCHIVE_INTERVAL_SECONDS'] = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600))
+app.config['VACUUM_PAGES_PER_BATCH'] = int(os.environ.get('VACUUM_PAGES_PER_BATCH', 256)) # Freed pages returned to the OS per batch
+# Metrics & profiling (/metrics)
+app.config['DISTRIBUTOR_METRICS_PORT'] = int(os.environ.get('DISTRIBUTOR_METRICS_PORT', 0)) # 0 = `flask distribute` serves no metrics
+app.config['METRICS_BIND_HOST'] = os.environ.get('METRICS_BIND_HOST', '127.0.0.1')
+app.config['PROFILE_SLOW_SECONDS'] = float(os.environ.get('PROFILE_SLOW_SECONDS', 0)) # > 0 samples distribution ticks, logs stacks of slower ones
+app.config['PROFILE_SAMPLE_INTERVAL_SECONDS'] = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_SECONDS', 0.005))
+app.config['PROFILE_TOP_STACKS'] = int(os.environ.get('PROFILE_TOP_STACKS', 10))
+# Shared by the web workers so /metrics reports their sum whichever worker serves it ('' = this process only)
+app.config['METRICS_MULTIPROCESS_DIR'] = os.environ.get('METRICS_MULTIPROCESS_DIR', '')
+app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 1.0)) # Most often a worker rewrites its snapshot
+# The web process stays lean by default: run `flask init-db` and `flask distribute` separately,
+# or set these to 1 for the all-in-one behaviour (schema check on import, scheduler on the first request)
+app.config['INIT_DB_ON_STARTUP'] = os.environ.get('INIT_DB_ON_STARTUP', '0') == '1'
+app.config['START_SCHEDULER_ON_STARTUP'] = os.environ.get('START_SCHEDULER_ON_STARTUP', '0') == '1'
+
+# SQLite tuning, applied to every new connection. WAL lets API readers run while the distributor writes.
+# busy_timeout comes first so the other pragmas wait for locks instead of failing.
+app.config['SQLITE_PRAGMAS'] = {
+	'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+	'auto_vacuum': 'INCREMENTAL', # Takes effect for new databases; existing ones need `flask compact --full` once
+	'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+	'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'), # Safe with WAL; fsyncs only at checkpoints
+	'foreign_keys': 'ON', # Enforces FKs and makes ondelete='CASCADE' work
+	'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -20000)), # Negative means KiB
+	'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+	'pool_size': int(os.environ.get('SQLALCHEMY_POOL_SIZE', 5)),
+	'max_overflow': int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 10)),
+	'pool_timeout': int(os.environ.get('SQLALCHEMY_POOL_TIMEOUT', 30)),
+	'connect_args': {
+		# Driver-level lock wait, matching busy_timeout
+		'timeout': app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000,
+	},
+}
 
 db = SQLAlchemy(app)
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+	"""Applies SQLITE_PRAGMAS to a freshly opened DB-API connection and attaches the archive database."""
+	cursor = dbapi_connection.cursor()
+	for pragma, value in app.config['SQLITE_PRAGMAS'].items():
+		cursor.execute(f"PRAGMA {pragma}={value}")
+	cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_PATH,))
+	cursor.close()
+
+with app.app_context():
+	event.listen(db.engine, 'connect', apply_sqlite_pragmas)
 scheduler = BackgroundScheduler(daemon=True) # Initialize scheduler
 
 # Configure logging
@@ -33,11 +131,190 @@ class FrequencyUnit(enum.Enum):
 	WEEKS = 'weeks'
 	MONTHS = 'months' # Note: Month calculation can be tricky (varying days)
 
+# --- Recurrence ---
+# Ticket types repeat either every N frequency units from an anchor time (exact calendar months,
+# local wall-clock days/weeks) or on a calendar schedule given as a cron expression or an RRULE.
+# Calendar times are interpreted in the ticket type's time zone; all stored datetimes are naive UTC.
+CRON_WEEKDAYS = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT'] # cron numbering: 0 (and 7) = Sunday
+CRON_MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+RRULE_WEEKDAYS = {'SU': 0, 'MO': 1, 'TU': 2, 'WE': 3, 'TH': 4, 'FR': 5, 'SA': 6}
+SCHEDULE_SEARCH_YEARS = 8 # Long enough for 29 February; a schedule with no match in this span never fires
+
+def get_zone(name):
+	"""Returns the tzinfo for an IANA time zone name (UTC for None). Raises ValueError for unknown zones."""
+	if not name:
+		return timezone.utc
+	try:
+		return ZoneInfo(name)
+	except (ZoneInfoNotFoundError, ValueError):
+		raise ValueError(f"Unknown time zone '{name}'")
+
+def utc_to_local(moment, zone):
+	"""Naive UTC -> naive local wall time."""
+	return moment.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+def local_to_utc(moment, zone):
+	"""Naive local wall time -> naive UTC (times skipped by a DST change move forward)."""
+	return moment.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+def add_months(moment, months):
+	"""Adds calendar months, clamping the day to the end of shorter months (31 Jan + 1 month = 28/29 Feb)."""
+	year, month_index = divmod(moment.month - 1 + months, 12)
+	year += moment.year
+	return moment.replace(year=year, month=month_index + 1, day=min(moment.day, calendar.monthrange(year, month_index + 1)[1]))
+
+def parse_cron_value(text, low, names):
+	text = text.strip().upper()
+	if names and text in names:
+		return names.index(text) + low
+	return int(text)
+
+def parse_cron_field(field, low, high, names=None):
+	"""Parses one cron field ('*', '1,15', '9-17', '*/15', 'MON-FRI', ...) into a set of values."""
+	values = set()
+	for part in field.split(','):
+		step = 1
+		if '/' in part:
+			part, step_text = part.split('/', 1)
+			step = int(step_text)
+			if step < 1:
+				raise ValueError(f"Invalid step in '{field}'")
+		if part == '*':
+			start, end = low, high
+		elif '-' in part:
+			start_text, end_text = part.split('-', 1)
+			start, end = parse_cron_value(start_text, low, names), parse_cron_value(end_text, low, names)
+		else:
+			start = parse_cron_value(part, low, names)
+			end = high if step > 1 else start
+		if not low <= start <= end <= high:
+			raise ValueError(f"'{field}' is out of range {low}-{high}")
+		values.update(range(start, end + 1, step))
+	return values
+
+class CalendarSchedule:
+	"""Cron-style schedule matched against local wall time, minute resolution."""
+
+	def __init__(self, minutes, hours, days, months, weekdays, days_restricted=False, weekdays_restricted=False):
+		self.minutes = sorted(minutes)
+		self.hours = set(hours)
+		self.days = set(days) # Negative values count from the end of the month (RRULE BYMONTHDAY=-1)
+		self.months = set(months)
+		self.weekdays = {weekday % 7 for weekday in weekdays} # 0 = Sunday
+		# cron rule: when both day fields are restricted, a day matching either one qualifies
+		self.either_day = days_restricted and weekdays_restricted
+
+	@classmethod
+	def from_cron(cls, expression):
+		"""Parses 'minute hour day-of-month month day-of-week', e.g. '0 9 * * MON'."""
+		fields = expression.split()
+		if len(fields) != 5:
+			raise ValueError("A cron schedule needs 5 fields: minute hour day-of-month month day-of-week")
+		return cls(
+			parse_cron_field(fields[0], 0, 59),
+			parse_cron_field(fields[1], 0, 23),
+			parse_cron_field(fields[2], 1, 31),
+			parse_cron_field(fields[3], 1, 12, CRON_MONTHS),
+			parse_cron_field(fields[4], 0, 7, CRON_WEEKDAYS),
+			days_restricted=fields[2] != '*',
+			weekdays_restricted=fields[4] != '*'
+		)
+
+	@classmethod
+	def from_rrule(cls, expression, anchor=None):
+		"""
+		Parses an RRULE subset: FREQ (MINUTELY..YEARLY) with BYMONTH, BYMONTHDAY (-1 = last day), BYDAY (plain weekdays),
+		BYHOUR and BYMINUTE. Fields the rule leaves open default to the local anchor time, as DTSTART
+		would. Intervals other than 1 are expressed with frequency_value/frequency_unit and anchor_at instead.
+		"""
+		anchor = anchor or datetime(2000, 1, 3) # A Monday at midnight
+		parts = {}
+		for part in expression.upper().removeprefix('RRULE:').split(';'):
+			if not part:
+				continue
+			key, _, value = part.partition('=')
+			parts[key.strip()] = value.strip()
+		unknown = set(parts) - {'FREQ', 'INTERVAL', 'BYMONTH', 'BYMONTHDAY', 'BYDAY', 'BYHOUR', 'BYMINUTE'}
+		if unknown:
+			raise ValueError(f"Unsupported RRULE part(s): {', '.join(sorted(unknown))}")
+		frequencies = ['MINUTELY', 'HOURLY', 'DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY']
+		frequency = parts.get('FREQ')
+		if frequency not in frequencies:
+			raise ValueError(f"RRULE FREQ must be one of: {', '.join(frequencies)}")
+		if parts.get('INTERVAL', '1') != '1':
+			raise ValueError("RRULE INTERVAL other than 1 is not supported; use frequency_value/frequency_unit with anchor_at")
+		level = frequencies.index(frequency)
+
+		def field(key, low, high, default):
+			if key in parts:
+				return parse_cron_field(parts[key], low, high)
+			return default
+
+		weekdays = set(range(7))
+		if 'BYDAY' in parts:
+			try:
+				weekdays = {RRULE_WEEKDAYS[day.strip()] for day in parts['BYDAY'].split(',')}
+			except KeyError:
+				raise ValueError("RRULE BYDAY takes plain weekdays (MO,TU,...), without ordinals")
+		elif level == 3: # WEEKLY repeats on the anchor's weekday
+			weekdays = {(anchor.weekday() + 1) % 7}
+		month_days = {anchor.day} if level >= 4 and 'BYDAY' not in parts else set(range(1, 32))
+		if 'BYMONTHDAY' in parts:
+			month_days = {int(day) for day in parts['BYMONTHDAY'].split(',')}
+			if not all(1 <= abs(day) <= 31 for day in month_days):
+				raise ValueError("RRULE BYMONTHDAY takes days 1 to 31 or -31 to -1")
+		return cls(
+			field('BYMINUTE', 0, 59, set(range(60)) if level == 0 else {anchor.minute}),
+			field('BYHOUR', 0, 23, set(range(24)) if level <= 1 else {anchor.hour}),
+			month_days,
+			field('BYMONTH', 1, 12, {anchor.month} if level == 5 and 'BYDAY' not in parts else set(range(1, 13))),
+			weekdays
+		)
+
+	@classmethod
+	def parse(cls, expression, anchor=None):
+		"""Parses a cron expression or an RRULE (anything containing 'FREQ='). Raises ValueError if it is invalid or never fires."""
+		try:
+			if 'FREQ=' in expression.upper():
+				schedule = cls.from_rrule(expression, anchor)
+			else:
+				schedule = cls.from_cron(expression)
+		except (TypeError, ValueError) as e:
+			raise ValueError(str(e) or "Invalid schedule")
+		if schedule.next_after(datetime(2000, 1, 1)) is None:
+			raise ValueError("The schedule never fires")
+		return schedule
+
+	def matches_day(self, day):
+		if day.month not in self.months:
+			return False
+		day_match = day.day in self.days or day.day - calendar.monthrange(day.year, day.month)[1] - 1 in self.days
+		weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+		return (day_match or weekday_match) if self.either_day else (day_match and weekday_match)
+
+	def next_after(self, moment):
+		"""Returns the first matching local time strictly after `moment` (naive local), or None if none within SCHEDULE_SEARCH_YEARS."""
+		candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+		limit = candidate + timedelta(days=366 * SCHEDULE_SEARCH_YEARS)
+		while candidate < limit:
+			if not self.matches_day(candidate):
+				candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+				continue
+			if candidate.hour not in self.hours:
+				candidate = candidate.replace(minute=0) + timedelta(hours=1)
+				continue
+			minute = next((minute for minute in self.minutes if minute >= candidate.minute), None)
+			if minute is None:
+				candidate = candidate.replace(minute=0) + timedelta(hours=1)
+				continue
+			return candidate.replace(minute=minute)
+		return None
+
 # --- Database Models ---
 class Wallet(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	name = db.Column(db.String(80), unique=True, nullable=False)
-	tickets = db.relationship('IssuedTicket', backref='wallet', lazy=True, cascade="all, delete-orphan")
+	tickets = db.relationship('IssuedTicket', backref='wallet', lazy=True, cascade="all, delete-orphan", passive_deletes=True) # DB cascades; no ORM load on delete
 
 	def to_dict(self):
 		"""Helper method to convert Wallet object to dictionary."""
@@ -56,10 +333,15 @@ class TicketType(db.Model):
 	distribute_quantity = db.Column(db.Integer, nullable=False, default=1)
 	frequency_value = db.Column(db.Integer, nullable=False, default=7)
 	frequency_unit = db.Column(Enum(FrequencyUnit), nullable=False, default=FrequencyUnit.DAYS)
-	target_wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id'), nullable=True)
+	target_wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id'), nullable=True, index=True)
 	target_wallet = db.relationship('Wallet')
 	last_distributed = db.Column(db.DateTime, nullable=True) # Stores UTC time
-	issued_tickets = db.relationship('IssuedTicket', backref='ticket_type', lazy=True, cascade="all, delete-orphan") # Added cascade
+	next_due_at = db.Column(db.DateTime, nullable=True, index=True) # UTC; maintained by update_next_due_at()
+	max_catch_up_periods = db.Column(db.Integer, nullable=True) # Missed periods issued after downtime; None = DISTRIBUTION_MAX_CATCH_UP_PERIODS
+	schedule = db.Column(db.String(200), nullable=True) # Cron expression or RRULE; replaces frequency_value/frequency_unit when set
+	timezone = db.Column(db.String(64), nullable=True) # IANA zone for schedules and day/week/month intervals; None = UTC
+	anchor_at = db.Column(db.DateTime, nullable=True) # UTC; interval periods start at anchor_at + k * frequency
+	issued_tickets = db.relationship('IssuedTicket', backref='ticket_type', lazy=True, cascade="all, delete-orphan", passive_deletes=True) # Added cascade; DB cascades via foreign_keys=ON
 
 	def to_dict(self):
 		"""Helper method to convert TicketType object to dictionary."""
@@ -72,37 +354,152 @@ class TicketType(db.Model):
 			'frequency_unit': self.frequency_unit.value, # Return the string value
 			'target_wallet_id': self.target_wallet_id,
 			'target_wallet_name': self.target_wallet.name if self.target_wallet else None,
-			'last_distributed': self.last_distributed.isoformat() + 'Z' if self.last_distributed else None
+			'last_distributed': self.last_distributed.isoformat() + 'Z' if self.last_distributed else None,
+			'max_catch_up_periods': self.max_catch_up_periods,
+			'schedule': self.schedule,
+			'timezone': self.timezone,
+			'anchor_at': self.anchor_at.isoformat() + 'Z' if self.anchor_at else None,
+			'next_distribution_at': self.next_due_at.isoformat() + 'Z' if self.next_due_at else None
 		}
 
-	def get_frequency_timedelta(self):
-		"""Calculates the timedelta based on frequency settings."""
+	def get_calendar_schedule(self):
+		"""Returns the parsed CalendarSchedule, or None for interval ticket types."""
+		if not self.schedule:
+			return None
+		anchor = utc_to_local(self.anchor_at, get_zone(self.timezone)) if self.anchor_at else None
+		return CalendarSchedule.parse(self.schedule, anchor)
+
+	def get_interval_occurrence(self, index):
+		"""Start of interval period `index` (0 = the anchor), naive UTC. Minutes and hours are exact durations;
+		days, weeks and months follow the local calendar, so they keep their wall-clock time across DST changes."""
+		anchor = self.anchor_at or self.last_distributed
 		unit = self.frequency_unit
 		value = self.frequency_value
 		if unit == FrequencyUnit.MINUTES:
-			return timedelta(minutes=value)
+			return anchor + timedelta(minutes=value * index)
 		elif unit == FrequencyUnit.HOURS:
-			return timedelta(hours=value)
-		elif unit == FrequencyUnit.DAYS:
-			return timedelta(days=value)
+			return anchor + timedelta(hours=value * index)
+		zone = get_zone(self.timezone)
+		anchor_local = utc_to_local(anchor, zone)
+		if unit == FrequencyUnit.DAYS:
+			return local_to_utc(anchor_local + timedelta(days=value * index), zone)
 		elif unit == FrequencyUnit.WEEKS:
-			return timedelta(weeks=value)
+			return local_to_utc(anchor_local + timedelta(weeks=value * index), zone)
 		elif unit == FrequencyUnit.MONTHS:
-			 # Note: This is an approximation using 30 days per month
-			 # For precise month handling, consider dateutil.relativedelta
-			return timedelta(days=value * 30)
+			# Counted from the anchor, so 31 Jan -> 28 Feb -> 31 Mar rather than drifting to the 28th
+			return local_to_utc(add_months(anchor_local, value * index), zone)
 		else:
 			# Should not happen with Enum validation, but good practice
 			raise ValueError(f"Invalid FrequencyUnit: {unit}")
 
+	def get_interval_index(self, moment):
+		"""Index of the last interval period starting at or before `moment` (O(1): estimated, then corrected)."""
+		anchor = self.anchor_at or self.last_distributed
+		unit = self.frequency_unit
+		value = self.frequency_value
+		if unit == FrequencyUnit.MINUTES:
+			index = (moment - anchor) // timedelta(minutes=value)
+		elif unit == FrequencyUnit.HOURS:
+			index = (moment - anchor) // timedelta(hours=value)
+		else:
+			zone = get_zone(self.timezone)
+			anchor_local = utc_to_local(anchor, zone)
+			moment_local = utc_to_local(moment, zone)
+			if unit == FrequencyUnit.MONTHS:
+				index = ((moment_local.year - anchor_local.year) * 12 + moment_local.month - anchor_local.month) // value
+			else:
+				index = (moment_local - anchor_local) // timedelta(days=value * (7 if unit == FrequencyUnit.WEEKS else 1))
+		while self.get_interval_occurrence(index) > moment:
+			index -= 1
+		while self.get_interval_occurrence(index + 1) <= moment:
+			index += 1
+		return index
+
+	def get_occurrences(self, after, until, limit=None):
+		"""
+		Returns (period_starts, skipped): the period start times in (after, until], oldest first, keeping
+		only the newest `limit`; skipped counts the ones dropped.
+		"""
+		schedule = self.get_calendar_schedule()
+		if schedule is None:
+			first = self.get_interval_index(after) + 1
+			last = self.get_interval_index(until)
+			skipped = max(0, last - first + 1 - limit) if limit else 0
+			return [self.get_interval_occurrence(index) for index in range(first + skipped, last + 1)], skipped
+
+		zone = get_zone(self.timezone)
+		kept = deque(maxlen=limit or None)
+		total = 0
+		local = utc_to_local(after, zone)
+		while (local := schedule.next_after(local)) is not None:
+			moment = local_to_utc(local, zone)
+			if moment <= after:
+				continue # Wall time repeated after clocks went back
+			if moment > until:
+				break
+			kept.append(moment)
+			total += 1
+		return list(kept), total - len(kept)
+
+	def get_next_occurrence(self, after):
+		"""Returns the first period start strictly after `after` (naive UTC), or None if the schedule never fires again."""
+		schedule = self.get_calendar_schedule()
+		if schedule is None:
+			return self.get_interval_occurrence(self.get_interval_index(after) + 1)
+		zone = get_zone(self.timezone)
+		local = utc_to_local(after, zone)
+		while (local := schedule.next_after(local)) is not None:
+			moment = local_to_utc(local, zone)
+			if moment > after:
+				return moment
+		return None
+
+	def compute_next_due_at(self, now=None):
+		"""
+		Returns when the type is next due: the first period after last_distributed. A never-distributed type
+		is due at its first scheduled time, at anchor_at if that is in the future, or else immediately.
+		"""
+		now = now or datetime.utcnow()
+		if self.last_distributed is not None:
+			return self.get_next_occurrence(self.last_distributed)
+		if self.schedule:
+			return self.get_next_occurrence(now)
+		if self.anchor_at is not None and self.anchor_at > now:
+			return self.anchor_at
+		return now
+
+	def get_recurrence_key(self):
+		"""Everything compute_next_due_at() depends on besides `now`; types with equal keys are due at the same time."""
+		return (self.schedule, self.timezone, self.anchor_at, self.frequency_value, self.frequency_unit, self.last_distributed)
+
+	def update_next_due_at(self, now=None):
+		"""Recomputes next_due_at (see compute_next_due_at)."""
+		self.next_due_at = self.compute_next_due_at(now)
+		return self.next_due_at
+
 	def __repr__(self):
 		return f'<TicketType {self.name}>'
 
 
 class IssuedTicket(db.Model):
+	__table_args__ = (
+		# Wallet view / grouped counts / consume-by-type: only available tickets, newest or oldest first
+		db.Index(
+			'ix_issued_ticket_wallet_available',
+			'wallet_id', 'issued_date',
+			sqlite_where=db.text('consumed_date IS NULL')
+		),
+		# Archival: finds consumed tickets past the retention age
+		db.Index(
+			'ix_issued_ticket_consumed_date',
+			'consumed_date',
+			sqlite_where=db.text('consumed_date IS NOT NULL')
+		),
+	)
+
 	id = db.Column(db.Integer, primary_key=True)
-	ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_type.id', ondelete='CASCADE'), nullable=False) # Added ondelete
-	wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id', ondelete='CASCADE'), nullable=False) # Added ondelete
+	ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_type.id', ondelete='CASCADE'), nullable=False, index=True) # Added ondelete; indexed for cascade deletes
+	wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id', ondelete='CASCADE'), nullable=False, index=True) # Added ondelete; indexed for cascade deletes
 	issued_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Use UTC
 	consumed_date = db.Column(db.DateTime, nullable=True) # Use UTC
 
@@ -130,6 +527,125 @@ class IssuedTicket(db.Model):
 		wallet_name = self.wallet.name if self.wallet else '[Deleted Wallet]'
 		return f'<IssuedTicket {self.id} ({type_name}) for {wallet_name} - {status}>'
 
+class SchedulerLease(db.Model):
+	"""A named lease with an expiry; the process holding an unexpired lease is the leader for that name."""
+	name = db.Column(db.String(80), primary_key=True)
+	holder = db.Column(db.String(200), nullable=True)
+	expires_at = db.Column(db.DateTime, nullable=True) # UTC
+
+	def __repr__(self):
+		return f'<SchedulerLease {self.name} held by {self.holder} until {self.expires_at}>'
+
+class TableVersion(db.Model):
+	"""Per-table change counter, bumped in the same transaction as writes; keys the response cache."""
+	name = db.Column(db.String(80), primary_key=True)
+	version = db.Column(db.Integer, nullable=False, default=0)
+
+	def __repr__(self):
+		return f'<TableVersion {self.name}={self.version}>'
+
+class EventLog(db.Model):
+	"""
+	Outbox of change events streamed by /api/events. Rows are written in the same transaction as the
+	change they describe, so every process (web workers and the distributor) can publish events.
+	"""
+	id = db.Column(db.Integer, primary_key=True)
+	event_type = db.Column(db.String(40), nullable=False)
+	wallet_id = db.Column(db.Integer, nullable=True) # None = concerns every wallet
+	payload = db.Column(db.Text, nullable=False) # JSON
+	created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True) # UTC; for pruning
+
+	def __repr__(self):
+		return f'<EventLog {self.id} {self.event_type}>'
+
+class WalletBalance(db.Model):
+	"""Per-wallet, per-type ticket totals, kept in step with issued_ticket by distribution and consumption."""
+	__tablename__ = 'wallet_balance'
+	wallet_id = db.Column(db.Integer, db.ForeignKey('wallet.id', ondelete='CASCADE'), primary_key=True)
+	ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_type.id', ondelete='CASCADE'), primary_key=True, index=True) # Indexed for cascade deletes
+	available = db.Column(db.Integer, nullable=False, default=0)
+	issued_total = db.Column(db.Integer, nullable=False, default=0) # Includes archived tickets
+	consumed_total = db.Column(db.Integer, nullable=False, default=0)
+
+	def to_dict(self):
+		"""Helper method to convert WalletBalance object to dictionary."""
+		return {
+			'wallet_id': self.wallet_id,
+			'ticket_type_id': self.ticket_type_id,
+			'available': self.available,
+			'issued_total': self.issued_total,
+			'consumed_total': self.consumed_total,
+		}
+
+	def __repr__(self):
+		return f'<WalletBalance wallet={self.wallet_id} type={self.ticket_type_id}: {self.available}>'
+
+class DistributionRun(db.Model):
+	"""
+	Ledger entry for one period of a ticket type's distribution. Wallets are issued in ascending ID
+	order, one chunk per transaction, and wallet_cursor (the last wallet issued) advances in the same
+	transaction as the chunk's tickets, so an interrupted run resumes after its last committed chunk.
+	"""
+	__tablename__ = 'distribution_run'
+	__table_args__ = (
+		# One run per period: a second claim on the same period (replay, or a racing distributor) fails
+		db.UniqueConstraint('ticket_type_id', 'period_start', name='uq_distribution_run_period'),
+	)
+
+	id = db.Column(db.Integer, primary_key=True)
+	ticket_type_id = db.Column(db.Integer, db.ForeignKey('ticket_type.id', ondelete='CASCADE'), nullable=False) # Cascade deletes use the unique index
+	period_start = db.Column(db.DateTime, nullable=False) # UTC; the issued_date of the period's tickets
+	started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True) # UTC; for pruning
+	completed_at = db.Column(db.DateTime, nullable=True) # UTC; None while wallets remain
+	wallet_cursor = db.Column(db.Integer, nullable=True) # Highest wallet ID issued so far
+	chunk_count = db.Column(db.Integer, nullable=False, default=0)
+	tickets_issued = db.Column(db.Integer, nullable=False, default=0)
+
+	def __repr__(self):
+		status = 'complete' if self.completed_at else f'at wallet {self.wallet_cursor}'
+		return f'<DistributionRun {self.id} type={self.ticket_type_id} period={self.period_start} {status}>'
+
+class ArchivedTicket(db.Model):
+	"""A consumed IssuedTicket moved out of the hot table by archive_consumed_tickets()."""
+	__tablename__ = 'issued_ticket_archive'
+	__table_args__ = {'schema': 'archive'}
+
+	id = db.Column(db.Integer, primary_key=True) # Same ID as the original IssuedTicket
+	ticket_type_id = db.Column(db.Integer, nullable=False) # No FKs: history outlives deleted types/wallets
+	wallet_id = db.Column(db.Integer, nullable=False)
+	issued_date = db.Column(db.DateTime, nullable=False)
+	consumed_date = db.Column(db.DateTime, nullable=False)
+	archived_date = db.Column(db.DateTime, nullable=False)
+
+	def __repr__(self):
+		return f'<ArchivedTicket {self.id}>'
+
+class TicketHistoryDaily(db.Model):
+	"""Daily per-wallet, per-type count of archived tickets, keyed by the day they were consumed."""
+	__table_args__ = (
+		# Wallet history view: the primary key leads with day, so it cannot serve a per-wallet lookup
+		db.Index('ix_ticket_history_daily_wallet_day', 'wallet_id', 'day'),
+		# Ticket type deletes remove the type's rollups
+		db.Index('ix_ticket_history_daily_ticket_type_id', 'ticket_type_id'),
+	)
+
+	day = db.Column(db.Date, primary_key=True)
+	wallet_id = db.Column(db.Integer, primary_key=True)
+	ticket_type_id = db.Column(db.Integer, primary_key=True)
+	consumed_count = db.Column(db.Integer, nullable=False, default=0)
+
+	def to_dict(self):
+		"""Helper method to convert TicketHistoryDaily object to dictionary."""
+		return {
+			'day': self.day.isoformat(),
+			'wallet_id': self.wallet_id,
+			'ticket_type_id': self.ticket_type_id,
+			'consumed_count': self.consumed_count,
+		}
+
+	def __repr__(self):
+		return f'<TicketHistoryDaily {self.day} wallet={self.wallet_id} type={self.ticket_type_id}: {self.consumed_count}>'
+
 # --- Validation Helpers ---
 
 def validate_wallet_name(name, existing_wallet_id=None):
@@ -148,16 +664,27 @@ def validate_wallet_name(name, existing_wallet_id=None):
 
 def validate_ticket_type_data(data, existing_type_id=None):
 	"""Validates data for creating/updating a TicketType. Returns (validated_data, error_response)."""
-	errors = {}
-	validated_data = {}
-
-	# --- Field Extraction (with defaults for update) ---
 	existing_type = None
 	if existing_type_id:
 		existing_type = TicketType.query.get(existing_type_id)
 		if not existing_type:
 			 return None, (jsonify({"error": "Ticket Type not found"}), 404)
 
+	validated_data, errors = validate_ticket_type_fields(data, existing_type)
+	if errors:
+		return None, (jsonify({"errors": errors}), 400)
+
+	return validated_data, None
+
+def validate_ticket_type_fields(data, existing_type=None, check_references=True):
+	"""
+	Validates TicketType fields, taking missing keys from `existing_type`. Returns (validated_data, errors).
+	check_references=False skips the name-uniqueness and target-wallet lookups (bulk import does them per batch).
+	"""
+	errors = {}
+	validated_data = {}
+
+	# --- Field Extraction (with defaults for update) ---
 	def get_value(key, default_value=None):
 		 if key in data:
 			 return data[key]
@@ -173,15 +700,20 @@ def validate_ticket_type_data(data, existing_type_id=None):
 	freq_val = get_value('frequency_value')
 	freq_unit_str = get_value('frequency_unit')
 	target_wallet_id = get_value('target_wallet_id', None)
-
+	max_catch_up = get_value('max_catch_up_periods', None)
+	schedule = get_value('schedule', None)
+	timezone_name = get_value('timezone', None)
+	anchor_at = get_value('anchor_at', None)
 
 	# --- Validation ---
 	if not isinstance(name, str) or not name.strip():
 		errors['name'] = "Invalid 'name' (must be non-empty string)"
+	elif not check_references:
+		validated_data['name'] = name
 	else:
 		name_query = TicketType.query.filter(TicketType.name == name)
-		if existing_type_id is not None:
-			name_query = name_query.filter(TicketType.id != existing_type_id)
+		if existing_type is not None:
+			name_query = name_query.filter(TicketType.id != existing_type.id)
 		if name_query.first():
 			errors['name'] = f"Ticket Type name '{name}' already exists"
 		else:
@@ -216,6 +748,8 @@ def validate_ticket_type_data(data, existing_type_id=None):
 	if target_wallet_id is not None:
 		if not isinstance(target_wallet_id, int):
 			errors['target_wallet_id'] = "Invalid 'target_wallet_id' (must be integer or null)"
+		elif not check_references:
+			validated_data['target_wallet_id'] = target_wallet_id
 		else:
 			target_wallet = Wallet.query.get(target_wallet_id)
 			if not target_wallet:
@@ -225,103 +759,1488 @@ def validate_ticket_type_data(data, existing_type_id=None):
 	else:
 		 validated_data['target_wallet_id'] = None
 
+	if max_catch_up is not None and (not isinstance(max_catch_up, int) or max_catch_up < 1):
+		errors['max_catch_up_periods'] = "Invalid 'max_catch_up_periods' (must be integer >= 1 or null)"
+	else:
+		validated_data['max_catch_up_periods'] = max_catch_up
 
-	if errors:
-		return None, (jsonify({"errors": errors}), 400)
+	zone = timezone.utc
+	if timezone_name is not None and not isinstance(timezone_name, str):
+		errors['timezone'] = "Invalid 'timezone' (must be an IANA time zone name, e.g. 'Europe/Paris', or null)"
+	else:
+		try:
+			zone = get_zone(timezone_name)
+			validated_data['timezone'] = timezone_name or None
+		except ValueError as e:
+			errors['timezone'] = f"Invalid 'timezone': {e}"
+
+	if anchor_at is None or isinstance(anchor_at, datetime): # Unchanged on update (already UTC)
+		validated_data['anchor_at'] = anchor_at
+	elif not isinstance(anchor_at, str):
+		errors['anchor_at'] = "Invalid 'anchor_at' (must be an ISO 8601 date-time or null)"
+	else:
+		try:
+			parsed_anchor = datetime.fromisoformat(anchor_at.removesuffix('Z') + ('+00:00' if anchor_at.endswith('Z') else ''))
+			if parsed_anchor.tzinfo is None:
+				parsed_anchor = parsed_anchor.replace(tzinfo=zone) # Local time in the ticket type's zone
+			validated_data['anchor_at'] = parsed_anchor.astimezone(timezone.utc).replace(tzinfo=None)
+		except ValueError:
+			errors['anchor_at'] = "Invalid 'anchor_at' (must be an ISO 8601 date-time or null)"
 
-	return validated_data, None
+	if schedule is not None and (not isinstance(schedule, str) or not schedule.strip()):
+		errors['schedule'] = "Invalid 'schedule' (must be a cron expression, an RRULE, or null)"
+	elif schedule is not None:
+		anchor = validated_data.get('anchor_at')
+		try:
+			CalendarSchedule.parse(schedule, utc_to_local(anchor, zone) if anchor else None)
+			validated_data['schedule'] = schedule.strip()
+		except ValueError as e:
+			errors['schedule'] = f"Invalid 'schedule': {e}"
+	else:
+		validated_data['schedule'] = None
+
+	return validated_data, errors
+
+# --- Metrics (Prometheus text format) ---
+# Metrics live in process memory. With METRICS_MULTIPROCESS_DIR set, every web worker also writes a
+# snapshot there after requests, and /metrics sums all of them, so a load-balanced scrape sees the same
+# monotonic totals from any worker. The `flask distribute` process serves its own on DISTRIBUTOR_METRICS_PORT.
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def format_metric_labels(labels):
+	"""Formats {name: value} as a Prometheus label set ('' when empty)."""
+	if not labels:
+		return ''
+	escaped = (
+		f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+		for name, value in labels
+	)
+	return '{' + ','.join(escaped) + '}'
+
+class MetricCounter:
+	"""Monotonic counter, optionally split by labels."""
+
+	def __init__(self, name, documentation):
+		self.name = name
+		self.documentation = documentation
+		self.values = {} # sorted label tuple -> value
+		self.lock = threading.Lock()
+
+	def inc(self, amount=1, **labels):
+		key = tuple(sorted(labels.items()))
+		with self.lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+	def snapshot(self):
+		with self.lock:
+			return dict(self.values)
+
+	@staticmethod
+	def merge(total, value):
+		return total + value
+
+	def render(self, values=None):
+		"""Renders this counter, or `values` ({labels: value}, e.g. summed across processes) when given."""
+		values = self.snapshot() if values is None else values
+		lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+		for labels, value in sorted(values.items()):
+			lines.append(f"{self.name}{format_metric_labels(labels)} {value}")
+		return lines
+
+class MetricHistogram:
+	"""Histogram with fixed buckets, optionally split by labels."""
+
+	def __init__(self, name, documentation, buckets=DEFAULT_LATENCY_BUCKETS):
+		self.name = name
+		self.documentation = documentation
+		self.buckets = tuple(buckets)
+		self.series = {} # sorted label tuple -> [bucket counts..., sum, count]
+		self.lock = threading.Lock()
+
+	def observe(self, value, **labels):
+		key = tuple(sorted(labels.items()))
+		with self.lock:
+			series = self.series.get(key)
+			if series is None:
+				series = self.series[key] = [0] * (len(self.buckets) + 2)
+			for index, bound in enumerate(self.buckets):
+				if value <= bound:
+					series[index] += 1
+			series[-2] += value
+			series[-1] += 1
+
+	def time(self, **labels):
+		"""Context manager that observes the wall-clock duration of its block."""
+		return TimedBlock(self, labels)
+
+	def snapshot(self):
+		with self.lock:
+			return {labels: list(series) for labels, series in self.series.items()}
+
+	@staticmethod
+	def merge(total, series):
+		return [a + b for a, b in zip(total, series)]
+
+	def render(self, values=None):
+		"""Renders this histogram, or `values` ({labels: series}, e.g. summed across processes) when given."""
+		values = self.snapshot() if values is None else values
+		lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+		for labels, series in sorted(values.items()):
+			for bound, bucket_count in zip(self.buckets, series):
+				lines.append(f"{self.name}_bucket{format_metric_labels(labels + (('le', bound),))} {bucket_count}")
+			lines.append(f"{self.name}_bucket{format_metric_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+			lines.append(f"{self.name}_sum{format_metric_labels(labels)} {series[-2]}")
+			lines.append(f"{self.name}_count{format_metric_labels(labels)} {series[-1]}")
+		return lines
+
+class TimedBlock:
+	def __init__(self, histogram, labels):
+		self.histogram = histogram
+		self.labels = labels
+
+	def __enter__(self):
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+		return False
+
+class MetricsRegistry:
+	def __init__(self):
+		self.metrics = []
+
+	def register(self, metric):
+		self.metrics.append(metric)
+		return metric
+
+	def snapshot(self):
+		"""Returns {metric name: {labels: value}} for every registered metric."""
+		return {metric.name: metric.snapshot() for metric in self.metrics}
+
+	def render(self, snapshots=None):
+		"""Renders this process's metrics, or the sum of `snapshots` (from snapshot(), one per process) when given."""
+		lines = []
+		for metric in self.metrics:
+			if snapshots is None:
+				lines.extend(metric.render())
+				continue
+			merged = {}
+			for snapshot in snapshots:
+				for labels, value in snapshot.get(metric.name, {}).items():
+					merged[labels] = metric.merge(merged[labels], value) if labels in merged else value
+			lines.extend(metric.render(merged))
+		return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics.register(MetricHistogram('http_request_duration_seconds', "API request latency by route, method and status."))
+DISTRIBUTION_TICK_SECONDS = metrics.register(MetricHistogram('distribution_tick_duration_seconds', "Duration of distribution job ticks."))
+DISTRIBUTION_TICKET_TYPE_SECONDS = metrics.register(MetricHistogram('distribution_ticket_type_duration_seconds', "Time spent distributing one due ticket type."))
+SCHEDULER_LAG_SECONDS = metrics.register(MetricHistogram(
+	'distribution_scheduler_lag_seconds', "Delay between a ticket type falling due and its distribution starting.",
+	buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600)
+))
+SQL_QUERY_SECONDS = metrics.register(MetricHistogram('sql_query_duration_seconds', "SQL statement execution time by operation."))
+TICKETS_ISSUED = metrics.register(MetricCounter('tickets_issued_total', "Tickets issued by distribution (committed)."))
+DISTRIBUTION_RUNS_RESUMED = metrics.register(MetricCounter('distribution_runs_resumed_total', "Interrupted distribution runs picked up again after their last committed chunk."))
+TICKETS_CONSUMED = metrics.register(MetricCounter('tickets_consumed_total', "Tickets consumed (committed)."))
+SLOW_CALLS_PROFILED = metrics.register(MetricCounter('slow_calls_profiled_total', "Calls that exceeded PROFILE_SLOW_SECONDS and had their stacks logged."))
+
+def count_after_commit(counter, amount):
+	"""Adds `amount` to `counter` once the current transaction commits (discarded on rollback)."""
+	if amount:
+		db.session.info.setdefault('metrics_pending', []).append((counter, amount))
+
+@event.listens_for(db.session, 'after_commit')
+def apply_pending_metrics(session):
+	for counter, amount in session.info.pop('metrics_pending', ()):
+		counter.inc(amount)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_pending_metrics(session):
+	session.info.pop('metrics_pending', None)
+
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE'}
+
+def sql_operation(statement):
+	"""Returns the leading SQL keyword of a statement (OTHER for pragmas, DDL, etc.)."""
+	keyword = statement.lstrip()[:6].upper()
+	return keyword if keyword in SQL_OPERATIONS else 'OTHER'
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+	conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+	SQL_QUERY_SECONDS.observe(time.perf_counter() - conn.info['query_started'].pop(), operation=sql_operation(statement))
+
+def discard_query_timer(exception_context):
+	if exception_context.connection is not None and exception_context.connection.info.get('query_started'):
+		exception_context.connection.info['query_started'].pop()
+
+with app.app_context():
+	event.listen(db.engine, 'before_cursor_execute', start_query_timer)
+	event.listen(db.engine, 'after_cursor_execute', stop_query_timer)
+	event.listen(db.engine, 'handle_error', discard_query_timer)
+
+@app.before_request
+def start_request_timer():
+	g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+	"""Records request latency labelled by route pattern (not the raw path, to keep label values bounded)."""
+	started = g.pop('request_started', None)
+	if started is not None:
+		route = request.url_rule.rule if request.url_rule else 'unmatched'
+		HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+		flush_metrics_snapshot()
+	return response
+
+class SlowCallProfiler:
+	"""
+	Sampling profiler for one call: a helper thread records the calling thread's stack every
+	PROFILE_SAMPLE_INTERVAL_SECONDS. If the call took at least PROFILE_SLOW_SECONDS, stop() logs the
+	most frequent stacks in collapsed ("outer;inner count") form, which flame graph tools accept.
+	"""
+
+	MAX_STACK_DEPTH = 40
+
+	def __init__(self, label):
+		self.label = label
+		self.thread_id = threading.get_ident()
+		self.interval = app.config['PROFILE_SAMPLE_INTERVAL_SECONDS']
+		self.samples = {}
+		self.stopped = threading.Event()
+		self.sampler = threading.Thread(target=self.sample, name=f"profiler-{label}", daemon=True)
+		self.sampler.start()
+
+	def sample(self):
+		while not self.stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			stack = []
+			while frame is not None and len(stack) < self.MAX_STACK_DEPTH:
+				stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}")
+				frame = frame.f_back
+			if stack:
+				collapsed = ';'.join(reversed(stack))
+				self.samples[collapsed] = self.samples.get(collapsed, 0) + 1
+
+	def stop(self, elapsed):
+		self.stopped.set()
+		self.sampler.join()
+		if elapsed < app.config['PROFILE_SLOW_SECONDS']:
+			return
+		SLOW_CALLS_PROFILED.inc(call=self.label)
+		hottest = sorted(self.samples.items(), key=lambda item: item[1], reverse=True)[:app.config['PROFILE_TOP_STACKS']]
+		logging.warning(
+			f"Slow {self.label}: {elapsed:.3f}s, {sum(self.samples.values())} stack sample(s). Hottest stacks:\n"
+			+ '\n'.join(f"{stack} {count}" for stack, count in hottest)
+		)
+
+def timed(histogram, profile_label=None):
+	"""
+	Decorator that observes a function's duration in `histogram`. With `profile_label` and
+	PROFILE_SLOW_SECONDS > 0, each call is also sampled by a SlowCallProfiler.
+	"""
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			profiler = SlowCallProfiler(profile_label) if profile_label and app.config['PROFILE_SLOW_SECONDS'] > 0 else None
+			started = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				elapsed = time.perf_counter() - started
+				histogram.observe(elapsed)
+				if profiler:
+					profiler.stop(elapsed)
+		return wrapper
+	return decorator
+
+def get_metrics_snapshot_path(pid=None):
+	return os.path.join(app.config['METRICS_MULTIPROCESS_DIR'], f"metrics-{pid or os.getpid()}.json")
+
+metrics_flush_lock = threading.Lock()
+metrics_flushed_at = 0.0
+
+def flush_metrics_snapshot(force=False):
+	"""
+	Writes this process's metrics to METRICS_MULTIPROCESS_DIR, at most every METRICS_FLUSH_SECONDS unless
+	`force`. The file is replaced atomically, so readers never see a partial one. Files of exited workers
+	stay, which keeps the summed counters monotonic.
+	"""
+	global metrics_flushed_at
+	if not app.config['METRICS_MULTIPROCESS_DIR']:
+		return
+	if not force and time.monotonic() - metrics_flushed_at < app.config['METRICS_FLUSH_SECONDS']:
+		return
+	if not metrics_flush_lock.acquire(blocking=force):
+		return # Another thread of this worker is writing it right now
+	try:
+		metrics_flushed_at = time.monotonic()
+		snapshot = {
+			name: [[labels, value] for labels, value in values.items()] for name, values in metrics.snapshot().items()
+		}
+		path = get_metrics_snapshot_path()
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(f"{path}.tmp", 'w') as f:
+			json.dump(snapshot, f)
+		os.replace(f"{path}.tmp", path)
+	except OSError as e:
+		logging.warning(f"Could not write metrics snapshot: {e}")
+	finally:
+		metrics_flush_lock.release()
+
+@atexit.register
+def flush_metrics_snapshot_at_exit():
+	"""Keeps an exiting worker's last increments. Only processes that served requests have a snapshot (not the CLI or distributor)."""
+	if metrics_flushed_at:
+		flush_metrics_snapshot(force=True)
+
+def read_metrics_snapshots():
+	"""Returns one snapshot per process in METRICS_MULTIPROCESS_DIR, using live values for this process."""
+	snapshots = [metrics.snapshot()]
+	directory = app.config['METRICS_MULTIPROCESS_DIR']
+	own_file = os.path.basename(get_metrics_snapshot_path())
+	try:
+		file_names = os.listdir(directory)
+	except FileNotFoundError:
+		return snapshots
+	for file_name in file_names:
+		if file_name == own_file or not (file_name.startswith('metrics-') and file_name.endswith('.json')):
+			continue
+		try:
+			with open(os.path.join(directory, file_name)) as f:
+				snapshot = json.load(f)
+		except (OSError, ValueError):
+			continue # Being replaced; its previous values are gone for this scrape only
+		snapshots.append({
+			name: {tuple(tuple(pair) for pair in labels): value for labels, value in series}
+			for name, series in snapshot.items()
+		})
+	return snapshots
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+	"""Exposes the metrics in the Prometheus text format, summed across workers if METRICS_MULTIPROCESS_DIR is set."""
+	if app.config['METRICS_MULTIPROCESS_DIR']:
+		body = metrics.render(read_metrics_snapshots())
+	else:
+		body = metrics.render()
+	return Response(body, mimetype='text/plain; version=0.0.4')
+
+def serve_metrics(port, host=None):
+	"""Serves /metrics on a background thread (for processes without a web server, like `flask distribute`)."""
+	from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+	class QuietHandler(WSGIRequestHandler):
+		def log_message(self, format, *args):
+			pass
+
+	def metrics_app(environ, start_response):
+		if environ.get('PATH_INFO') != '/metrics':
+			start_response('404 Not Found', [('Content-Type', 'text/plain')])
+			return [b"Not Found\n"]
+		start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4')])
+		return [metrics.render().encode()]
+
+	server = make_server(host or app.config['METRICS_BIND_HOST'], port, metrics_app, handler_class=QuietHandler)
+	threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+	logging.info(f"Serving distributor metrics on {server.server_address[0]}:{port}/metrics")
+	return server
+
+# --- Distributor Leader Lease ---
+DISTRIBUTOR_LEASE_NAME = 'distributor'
+
+def get_lease_holder_id():
+	"""Identifies this process as a lease holder (computed per call so forked workers differ)."""
+	return f"{socket.gethostname()}:{os.getpid()}"
+
+def acquire_lease(name=DISTRIBUTOR_LEASE_NAME, ttl_seconds=None):
+	"""
+	Acquires or renews a lease for this process with a single conditional UPDATE, which SQLite
+	serialises across processes. Returns True if this process now holds the lease.
+	"""
+	ttl_seconds = ttl_seconds or app.config['DISTRIBUTOR_LEASE_SECONDS']
+	lease_table = SchedulerLease.__table__
+	now = datetime.utcnow()
+	holder = get_lease_holder_id()
+
+	db.session.execute(db.insert(lease_table).prefix_with('OR IGNORE').values(name=name))
+	result = db.session.execute(
+		db.update(lease_table).where(
+			lease_table.c.name == name,
+			db.or_(
+				lease_table.c.holder == holder,
+				lease_table.c.expires_at.is_(None),
+				lease_table.c.expires_at < now
+			)
+		).values(holder=holder, expires_at=now + timedelta(seconds=ttl_seconds))
+	)
+	db.session.commit()
+	return result.rowcount == 1
+
+def release_lease(name=DISTRIBUTOR_LEASE_NAME):
+	"""Expires this process's lease immediately so another process can take over without waiting."""
+	lease_table = SchedulerLease.__table__
+	db.session.execute(
+		db.update(lease_table).where(
+			lease_table.c.name == name,
+			lease_table.c.holder == get_lease_holder_id()
+		).values(expires_at=None)
+	)
+	db.session.commit()
+
+# --- Wallet Balances ---
+
+def adjust_balances(issued=None, consumed=None):
+	"""
+	Applies ticket count changes to wallet_balance in the caller's transaction with one upsert per
+	kind of change. `issued` and `consumed` map (wallet_id, ticket_type_id) to a number of tickets.
+	"""
+	balance_table = WalletBalance.__table__
+	for counts, available_sign, total_column in ((issued, 1, 'issued_total'), (consumed, -1, 'consumed_total')):
+		if not counts:
+			continue
+		upsert = sqlite_insert(balance_table)
+		db.session.execute(upsert.on_conflict_do_update(
+			index_elements=['wallet_id', 'ticket_type_id'],
+			set_={
+				'available': balance_table.c.available + upsert.excluded.available,
+				total_column: balance_table.c[total_column] + upsert.excluded[total_column],
+			}
+		), [{
+			'wallet_id': wallet_id,
+			'ticket_type_id': ticket_type_id,
+			'available': available_sign * count,
+			'issued_total': count if total_column == 'issued_total' else 0,
+			'consumed_total': count if total_column == 'consumed_total' else 0,
+		} for (wallet_id, ticket_type_id), count in counts.items()])
+
+def expected_balances_query():
+	"""
+	Computes balances from the tickets themselves: live issued_ticket rows plus archived tickets,
+	which only survive as ticket_history_daily rollups (archived tickets are always consumed).
+	Scans every ticket, so it is for rebuild/verify only.
+	"""
+	issued_ticket = IssuedTicket.__table__
+	history = TicketHistoryDaily.__table__
+	counted = db.union_all(
+		db.select(
+			issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id,
+			db.func.count().label('issued'), db.func.count(issued_ticket.c.consumed_date).label('consumed')
+		).group_by(issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id),
+		db.select(
+			history.c.wallet_id, history.c.ticket_type_id,
+			db.func.sum(history.c.consumed_count).label('issued'), db.func.sum(history.c.consumed_count).label('consumed')
+		).group_by(history.c.wallet_id, history.c.ticket_type_id)
+	).subquery()
+	issued_total = db.func.sum(counted.c.issued)
+	consumed_total = db.func.sum(counted.c.consumed)
+	return db.select(
+		counted.c.wallet_id, counted.c.ticket_type_id,
+		(issued_total - consumed_total).label('available'),
+		issued_total.label('issued_total'), consumed_total.label('consumed_total')
+	).where(
+		# Deletes remove their rollups, but don't count any a manual delete left behind
+		counted.c.wallet_id.in_(db.select(Wallet.id)),
+		counted.c.ticket_type_id.in_(db.select(TicketType.id))
+	).group_by(counted.c.wallet_id, counted.c.ticket_type_id)
+
+def rebuild_wallet_balances():
+	"""Replaces wallet_balance with balances recomputed from the tickets, in one transaction. Returns the row count."""
+	balance_table = WalletBalance.__table__
+	db.session.execute(db.delete(balance_table))
+	result = db.session.execute(balance_table.insert().from_select(
+		['wallet_id', 'ticket_type_id', 'available', 'issued_total', 'consumed_total'],
+		expected_balances_query()
+	))
+	db.session.commit()
+	return result.rowcount
+
+def find_balance_drift():
+	"""Returns [(wallet_id, ticket_type_id, stored, expected)] for balances that differ from the tickets."""
+	columns = ('available', 'issued_total', 'consumed_total')
+	expected = {
+		(row.wallet_id, row.ticket_type_id): tuple(row[2:]) for row in db.session.execute(expected_balances_query())
+	}
+	stored = {
+		(row.wallet_id, row.ticket_type_id): (row.available, row.issued_total, row.consumed_total)
+		for row in db.session.execute(db.select(WalletBalance.__table__))
+	}
+	drift = []
+	for key in sorted(expected.keys() | stored.keys()):
+		stored_values = stored.get(key, (0, 0, 0))
+		expected_values = expected.get(key, (0, 0, 0))
+		if stored_values != expected_values:
+			drift.append((*key, dict(zip(columns, stored_values)), dict(zip(columns, expected_values))))
+	return drift
 
 # --- Ticket Distribution Job ---
 
-def distribute_tickets_job():
+def issue_tickets_bulk(ticket_type_id, wallet_ids, quantity, issued_dates, chunk_size=None):
+	"""
+	Inserts `quantity` tickets of a type into each wallet for every date in `issued_dates` (one date
+	per distribution period) without building ORM objects. Rows are written with chunked executemany
+	INSERTs of at most `chunk_size` rows, so the cost is one round trip per chunk. The wallets'
+	balances are updated in the same transaction.
+	Returns the number of rows issued.
+	"""
+	chunk_size = chunk_size or app.config['DISTRIBUTION_CHUNK_SIZE']
+	insert_stmt = IssuedTicket.__table__.insert()
+	issued_count = 0
+	rows = []
+	for wallet_id in wallet_ids:
+		for issued_date in issued_dates:
+			for _ in range(quantity):
+				rows.append({
+					'ticket_type_id': ticket_type_id,
+					'wallet_id': wallet_id,
+					'issued_date': issued_date,
+				})
+		if len(rows) >= chunk_size:
+			db.session.execute(insert_stmt, rows)
+			issued_count += len(rows)
+			rows = []
+	if rows:
+		db.session.execute(insert_stmt, rows)
+		issued_count += len(rows)
+	per_wallet = quantity * len(issued_dates)
+	adjust_balances(issued={(wallet_id, ticket_type_id): per_wallet for wallet_id in wallet_ids})
+	return issued_count
+
+def refresh_next_due_at(ticket_types=None, now=None):
+	"""
+	Recomputes next_due_at for the given ticket types (default: all) in one pass and writes them with a
+	single executemany UPDATE rather than one flush per row. Types sharing a recurrence (same schedule,
+	zone, anchor, interval and last distribution) are computed once, so many types on a few schedules
+	cost a few schedule searches. Returns the number of types refreshed.
+	"""
+	now = now or datetime.utcnow()
+	if ticket_types is None:
+		ticket_types = TicketType.query.all()
+	next_due_by_recurrence = {}
+	rows = []
+	for ticket_type in ticket_types:
+		recurrence_key = ticket_type.get_recurrence_key()
+		if recurrence_key not in next_due_by_recurrence:
+			next_due_by_recurrence[recurrence_key] = ticket_type.compute_next_due_at(now)
+		rows.append({'id': ticket_type.id, 'next_due_at': next_due_by_recurrence[recurrence_key]})
+	if rows:
+		db.session.execute(db.update(TicketType), rows)
+		bump_table_versions('ticket_type')
+		db.session.commit()
+	return len(rows)
+
+def get_due_periods(ticket_type, now):
+	"""
+	Returns (period_dates, skipped_periods) for a due ticket type. period_dates holds the start of
+	every period elapsed since last_distributed, oldest first, trimmed to the newest
+	max_catch_up_periods; skipped_periods counts the trimmed ones. A first distribution covers the
+	scheduled times since the first one, the anchored period it fell due in, or next_due_at itself if
+	unanchored. It is derived from next_due_at, not `now`, so a tick that retries an interrupted first
+	run asks for the same period and finds that run in the ledger.
+	"""
+	max_periods = ticket_type.max_catch_up_periods or app.config['DISTRIBUTION_MAX_CATCH_UP_PERIODS']
+	if ticket_type.last_distributed is None:
+		if ticket_type.schedule:
+			return ticket_type.get_occurrences(ticket_type.next_due_at - timedelta(microseconds=1), now, max_periods)
+		if ticket_type.anchor_at is not None:
+			# Periods before the ticket type existed are not owed; later ones are caught up once it has distributed
+			return [ticket_type.get_interval_occurrence(ticket_type.get_interval_index(ticket_type.next_due_at))], 0
+		return [ticket_type.next_due_at], 0
+	return ticket_type.get_occurrences(ticket_type.last_distributed, now, max_periods)
+
+class DistributionConflict(Exception):
+	"""Raised when a distribution run's ledger row was advanced by another process."""
+
+def claim_distribution_runs(ticket_type, period_dates, wallet_cursor, tickets_per_period, completed_at):
+	"""
+	Inserts the ledger rows for a batch of periods in the current transaction. The unique
+	(ticket_type_id, period_start) constraint makes a duplicate claim fail, rolling back its tickets.
+	Returns the run ID of the first period.
+	"""
+	now = datetime.utcnow()
+	rows = [{
+		'ticket_type_id': ticket_type.id,
+		'period_start': period_start,
+		'started_at': now,
+		'completed_at': completed_at,
+		'wallet_cursor': wallet_cursor,
+		'chunk_count': 1,
+		'tickets_issued': tickets_per_period,
+	} for period_start in period_dates]
+	insert_stmt = DistributionRun.__table__.insert()
+	run_id = db.session.execute(insert_stmt, rows[0]).inserted_primary_key[0]
+	if len(rows) > 1:
+		db.session.execute(insert_stmt, rows[1:])
+	return run_id
+
+def advance_distribution_run(run_id, expected_cursor, wallet_cursor, tickets_issued, completed_at):
+	"""
+	Moves a run's cursor past a chunk in the current transaction, but only from the cursor this process
+	last committed, so a chunk can never be issued twice. Raises DistributionConflict otherwise.
+	"""
+	result = db.session.execute(db.update(DistributionRun).where(
+		DistributionRun.id == run_id,
+		DistributionRun.wallet_cursor.is_not_distinct_from(expected_cursor),
+		DistributionRun.completed_at.is_(None)
+	).values(
+		wallet_cursor=wallet_cursor,
+		chunk_count=DistributionRun.chunk_count + 1,
+		tickets_issued=DistributionRun.tickets_issued + tickets_issued,
+		completed_at=completed_at
+	))
+	if result.rowcount != 1:
+		raise DistributionConflict(f"Distribution run {run_id} was advanced by another process")
+
+def distribute_period_batch(ticket_type, target_wallet_ids, period_dates, run=None):
+	"""
+	Issues a batch of periods to `target_wallet_ids` (ascending) in chunks of about
+	DISTRIBUTION_CHUNK_SIZE rows, one short transaction per chunk. The first chunk claims the periods
+	in the ledger and each later chunk advances the run's cursor; the last one also marks the runs
+	complete and advances last_distributed. `run` resumes an interrupted single-period run.
+	Returns the number of tickets issued.
+	"""
+	quantity = ticket_type.distribute_quantity
+	wallets_per_chunk = max(1, app.config['DISTRIBUTION_CHUNK_SIZE'] // (quantity * len(period_dates)))
+	run_id = run.id if run else None
+	wallet_cursor = run.wallet_cursor if run else None
+	first_index = bisect.bisect_right(target_wallet_ids, wallet_cursor) if wallet_cursor is not None else 0
+	remaining_wallet_ids = target_wallet_ids[first_index:]
+	chunks = [
+		remaining_wallet_ids[chunk_start:chunk_start + wallets_per_chunk]
+		for chunk_start in range(0, len(remaining_wallet_ids), wallets_per_chunk)
+	] or [[]] # Still complete a resumed run whose remaining wallets were deleted
+
+	issued_count = 0
+	for index, chunk_wallet_ids in enumerate(chunks):
+		is_last_chunk = index == len(chunks) - 1
+		completed_at = datetime.utcnow() if is_last_chunk else None
+		chunk_count = 0
+		if chunk_wallet_ids:
+			chunk_count = issue_tickets_bulk(ticket_type.id, chunk_wallet_ids, quantity, issued_dates=period_dates)
+		chunk_cursor = chunk_wallet_ids[-1] if chunk_wallet_ids else wallet_cursor
+		if run_id is None:
+			run_id = claim_distribution_runs(ticket_type, period_dates, chunk_cursor, chunk_count // len(period_dates), completed_at)
+		else:
+			advance_distribution_run(run_id, wallet_cursor, chunk_cursor, chunk_count, completed_at)
+		wallet_cursor = chunk_cursor
+
+		if chunk_wallet_ids:
+			# One event per chunk, not per wallet; wallet_id None means every wallet may have received tickets
+			record_event('tickets_issued', {
+				'ticket_type_id': ticket_type.id,
+				'ticket_type_name': ticket_type.name,
+				'tickets_per_wallet': quantity * len(period_dates),
+				'wallet_count': len(chunk_wallet_ids),
+				'issued_dates': [issued_date.isoformat() + 'Z' for issued_date in period_dates]
+			}, wallet_id=ticket_type.target_wallet_id)
+		if is_last_chunk:
+			if ticket_type.anchor_at is None and not ticket_type.schedule:
+				ticket_type.anchor_at = period_dates[0] # Later periods stay phase-locked to the first one
+			ticket_type.last_distributed = period_dates[-1]
+			ticket_type.update_next_due_at()
+			bump_table_versions('ticket_type') # last_distributed is part of the cached ticket type list
+		count_after_commit(TICKETS_ISSUED, chunk_count)
+		db.session.commit()
+		issued_count += chunk_count
+	return issued_count
+
+def distribute_ticket_type(ticket_type, target_wallet_ids, now):
+	"""
+	Issues every due period of a ticket type, recording each period in the distribution_run ledger.
+	Small periods are batched together and large ones split into wallet chunks, so every transaction
+	writes roughly DISTRIBUTION_CHUNK_SIZE rows. An interrupted run resumes after its last committed
+	chunk, and periods the ledger shows as complete are not issued again. last_distributed only ever
+	moves to period starts, which keeps the schedule phase-locked to its anchor.
+	Returns the number of tickets issued.
+	"""
+	period_dates, skipped_periods = get_due_periods(ticket_type, now)
+	if skipped_periods:
+		logging.warning(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Skipping {skipped_periods} missed period(s) beyond the catch-up cap.")
+	elif len(period_dates) > 1:
+		logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Catching up {len(period_dates)} missed period(s).")
+
+	if not period_dates:
+		# Not a whole period yet (e.g. the frequency was just lengthened); just resync the schedule
+		ticket_type.update_next_due_at()
+		bump_table_versions('ticket_type')
+		db.session.commit()
+		return 0
+
+	# Ledger rows for these periods (range lookup on the unique index); usually none
+	runs = {run.period_start: run for run in DistributionRun.query.filter(
+		DistributionRun.ticket_type_id == ticket_type.id,
+		DistributionRun.period_start.between(period_dates[0], period_dates[-1])
+	)}
+	completed_count = sum(1 for period_start in period_dates if period_start in runs and runs[period_start].completed_at)
+	if completed_count:
+		logging.warning(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): {completed_count} period(s) already distributed per the ledger; not issuing them again.")
+
+	rows_per_period = len(target_wallet_ids) * ticket_type.distribute_quantity
+	periods_per_batch = max(1, app.config['DISTRIBUTION_CHUNK_SIZE'] // rows_per_period)
+	issued_count = 0
+	batch_dates = []
+
+	def flush_batch():
+		nonlocal issued_count, batch_dates
+		if batch_dates:
+			issued_count += distribute_period_batch(ticket_type, target_wallet_ids, batch_dates)
+			batch_dates = []
+
+	for period_start in period_dates:
+		run = runs.get(period_start)
+		if run is not None and run.completed_at is not None:
+			continue
+		if run is not None:
+			# Interrupted earlier: finish it on its own, after its last committed chunk
+			flush_batch()
+			logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Resuming run {run.id} for {period_start.isoformat()}Z after wallet {run.wallet_cursor}.")
+			DISTRIBUTION_RUNS_RESUMED.inc()
+			issued_count += distribute_period_batch(ticket_type, target_wallet_ids, [period_start], run=run)
+			continue
+		batch_dates.append(period_start)
+		if len(batch_dates) >= periods_per_batch:
+			flush_batch()
+	flush_batch()
+
+	if ticket_type.last_distributed is None or ticket_type.last_distributed < period_dates[-1]:
+		# Trailing periods were all complete in the ledger already
+		ticket_type.last_distributed = period_dates[-1]
+		ticket_type.update_next_due_at()
+		bump_table_versions('ticket_type')
+		db.session.commit()
+	return issued_count
+
+def prune_distribution_runs(now=None):
+	"""Deletes distribution_run ledger rows started more than DISTRIBUTION_RUN_RETENTION_DAYS ago. Returns the number removed."""
+	cutoff = (now or datetime.utcnow()) - timedelta(days=app.config['DISTRIBUTION_RUN_RETENTION_DAYS'])
+	result = db.session.execute(db.delete(DistributionRun.__table__).where(DistributionRun.__table__.c.started_at < cutoff))
+	db.session.commit()
+	return result.rowcount
+
+@timed(DISTRIBUTION_TICK_SECONDS, profile_label='distribution tick')
+def distribute_tickets_job(dry_run=False):
 	"""
 	Scheduled job to check TicketTypes and distribute tickets based on frequency.
+	Returns a dict mapping ticket type IDs to the number of tickets issued this run.
+	With dry_run=True nothing is written (and no lease is needed); the counts are what would be issued.
 	"""
 	with app.app_context(): # Need app context to access db
-		now = datetime.utcnow()
-		logging.info(f"Running ticket distribution job at {now.isoformat()}Z")
+		# Every worker runs this job; only the lease holder distributes
+		if not dry_run and not acquire_lease():
+			logging.debug("Distributor lease held by another process; skipping this tick.")
+			return {}
 
-		ticket_types_to_process = TicketType.query.all()
-		wallets = None # Cache all wallets if needed
+		now = datetime.utcnow()
 
-		for ticket_type in ticket_types_to_process:
+		# Only due rows are loaded (uses the next_due_at index), so idle ticks are a single indexed lookup
+		ticket_types_to_process = TicketType.query.filter(
+			TicketType.next_due_at <= now
+		).order_by(TicketType.next_due_at).all()
+		wallet_ids = None # Cache all wallet IDs if needed
+		issued_per_type = {} # ticket_type_id -> rows issued this run
+
+		if not ticket_types_to_process:
+			logging.debug(f"Ticket distribution job at {now.isoformat()}Z: nothing due.")
+			if not dry_run:
+				arm_distribution_job(include_overdue=False)
+			return issued_per_type
+
+		log_prefix = "[dry-run] " if dry_run else ""
+		logging.info(f"{log_prefix}Running ticket distribution job at {now.isoformat()}Z ({len(ticket_types_to_process)} ticket type(s) due)")
+
+		for index, ticket_type in enumerate(ticket_types_to_process):
+			# Renew between types so a long run keeps the lease; stop if another process took it over
+			if index > 0 and not dry_run and not acquire_lease():
+				logging.warning("Distributor lease lost mid-run; stopping. The new leader will pick up the remaining types.")
+				break
 			try:
-				should_distribute = False
 				if ticket_type.last_distributed is None:
 					# First time distribution for this type
-					should_distribute = True
 					logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): First distribution.")
 				else:
-					time_since_last = now - ticket_type.last_distributed
-					frequency_delta = ticket_type.get_frequency_timedelta()
-					if time_since_last >= frequency_delta:
-						should_distribute = True
-						logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Frequency met ({time_since_last} >= {frequency_delta}). Distributing.")
-					# else:
-					#     logging.debug(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Frequency not met ({time_since_last} < {frequency_delta}). Skipping.")
-
-
-				if should_distribute:
-					target_wallets = []
-					if ticket_type.target_wallet_id:
-						# Specific target wallet
-						target_wallet = Wallet.query.get(ticket_type.target_wallet_id)
-						if target_wallet:
-							target_wallets.append(target_wallet)
-						else:
-							logging.warning(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Target wallet ID {ticket_type.target_wallet_id} not found. Skipping distribution for this type.")
-							continue # Skip this type if target wallet is gone
+					logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Due since {ticket_type.next_due_at.isoformat()}Z. Distributing.")
+
+				target_wallet_ids = []
+				if ticket_type.target_wallet_id:
+					# Specific target wallet
+					if db.session.query(Wallet.id).filter_by(id=ticket_type.target_wallet_id).first():
+						target_wallet_ids.append(ticket_type.target_wallet_id)
 					else:
-						# Distribute to all wallets
-						if wallets is None: # Lazy load wallets only if needed
-						   wallets = Wallet.query.all()
-						target_wallets = wallets
-
-					if not target_wallets:
-						logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): No target wallets found (either specific target deleted or no wallets exist). Skipping.")
-						continue
-
-					# --- Distribution ---
-					# IMPORTANT: Update last_distributed time *before* creating tickets
-					# to prevent duplicates if the process fails mid-way.
-					original_last_distributed = ticket_type.last_distributed
-					ticket_type.last_distributed = now
-					db.session.add(ticket_type) # Stage the update
-
-					new_tickets_count = 0
-					for wallet in target_wallets:
-						for _ in range(ticket_type.distribute_quantity):
-							new_ticket = IssuedTicket(
-								ticket_type_id=ticket_type.id,
-								wallet_id=wallet.id,
-								issued_date=now # Use the job's start time for consistency
-							)
-							db.session.add(new_ticket)
-							new_tickets_count += 1
-
-					# Commit transaction for this ticket type
-					db.session.commit()
-					logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Successfully distributed {new_tickets_count} tickets across {len(target_wallets)} wallet(s). Updated last_distributed to {now.isoformat()}Z.")
+						logging.warning(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Target wallet ID {ticket_type.target_wallet_id} not found. Skipping distribution for this type.")
+						continue # Skip this type if target wallet is gone
+				else:
+					# Distribute to all wallets
+					if wallet_ids is None: # Lazy load wallet IDs only if needed
+						wallet_ids = [wallet_id for (wallet_id,) in db.session.query(Wallet.id).order_by(Wallet.id)]
+					target_wallet_ids = wallet_ids
+
+				if not target_wallet_ids:
+					logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): No target wallets found (either specific target deleted or no wallets exist). Skipping.")
+					continue
+
+				if dry_run:
+					period_dates, _ = get_due_periods(ticket_type, now)
+					issued_per_type[ticket_type.id] = len(target_wallet_ids) * ticket_type.distribute_quantity * len(period_dates)
+					logging.info(f"{log_prefix}TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Would distribute {issued_per_type[ticket_type.id]} tickets for {len(period_dates)} period(s) across {len(target_wallet_ids)} wallet(s).")
+					continue
+
+				# --- Distribution ---
+				SCHEDULER_LAG_SECONDS.observe((datetime.utcnow() - ticket_type.next_due_at).total_seconds())
+				with DISTRIBUTION_TICKET_TYPE_SECONDS.time():
+					new_tickets_count = distribute_ticket_type(ticket_type, target_wallet_ids, now)
+				issued_per_type[ticket_type.id] = new_tickets_count
+				logging.info(f"TicketType '{ticket_type.name}' (ID: {ticket_type.id}): Successfully distributed {new_tickets_count} tickets across {len(target_wallet_ids)} wallet(s). last_distributed is now {ticket_type.last_distributed.isoformat()}Z.")
 
 			except Exception as e:
-				db.session.rollback() # Rollback changes for *this specific* ticket_type on error
+				db.session.rollback() # Rollback the uncommitted batch of *this specific* ticket_type on error
 				logging.error(f"Error processing TicketType '{ticket_type.name}' (ID: {ticket_type.id}): {e}", exc_info=True)
-				# Optionally, restore the original last_distributed time if needed,
-				# but leaving it updated might prevent immediate retries if the error is persistent.
-				# ticket_type.last_distributed = original_last_distributed # Revert if rollback happens? Consider implications.
-				# db.session.commit() # Commit the revert?
+				# Chunks committed before the error keep their tickets and ledger progress,
+				# so the next run resumes after the last committed chunk.
+
+		logging.info(f"{log_prefix}Ticket distribution job finished. Issued {sum(issued_per_type.values())} tickets across {len(issued_per_type)} ticket type(s).")
+		if not dry_run:
+			prune_event_log(now)
+			prune_distribution_runs(now)
+			arm_distribution_job(include_overdue=False)
+		return issued_per_type
+
+def arm_distribution_job(include_overdue=True):
+	"""
+	Moves the scheduled job's next run to the earliest next_due_at, so due types fire on time
+	instead of waiting for the next interval tick. The interval (DISTRIBUTION_MAX_SLEEP_SECONDS) stays
+	as an upper bound. The job itself passes include_overdue=False: anything still overdue after a run
+	was skipped (e.g. no wallets yet) and is retried on the interval rather than in a tight loop.
+	"""
+	job = scheduler.get_job('distribute_tickets')
+	if not job:
+		return None
+
+	now = datetime.utcnow()
+	next_run = now + timedelta(seconds=app.config['DISTRIBUTION_MAX_SLEEP_SECONDS'])
+	earliest_query = db.session.query(db.func.min(TicketType.next_due_at))
+	if not include_overdue:
+		earliest_query = earliest_query.filter(TicketType.next_due_at > now)
+	earliest_due = earliest_query.scalar()
+	if earliest_due is not None and earliest_due < next_run:
+		next_run = max(earliest_due, now)
+
+	# APScheduler works with aware datetimes; our columns store naive UTC
+	job.modify(next_run_time=next_run.replace(tzinfo=timezone.utc))
+	return next_run
+
+watched_ticket_type_version = None # ticket_type table version the distribution job was last armed for
+
+def watch_ticket_type_changes():
+	"""
+	Re-arms the distribution job when ticket types changed in another process. The web workers'
+	own arm_distribution_job() calls find no job when `flask distribute` runs the scheduler, so
+	without this a new or rescheduled type would wait for the next interval tick. The check is a
+	single primary-key lookup of the ticket_type table version, which every such write bumps.
+	"""
+	global watched_ticket_type_version
+	with app.app_context():
+		(version,) = get_table_versions(['ticket_type'])
+		if version == watched_ticket_type_version:
+			return None
+		watched_ticket_type_version = version
+		return arm_distribution_job()
+
+
+# --- Archival & Compaction ---
+ARCHIVER_LEASE_NAME = 'archiver'
+
+def archive_consumed_tickets(older_than_days=None, batch_size=None, max_batches=None):
+	"""
+	Moves consumed tickets older than `older_than_days` into archive.issued_ticket_archive, adding them
+	to the ticket_history_daily rollups, in short transactions of `batch_size` rows. After each batch
+	an incremental VACUUM returns a few freed pages to the OS, so neither step blocks the API for long.
+	The archive file is a separate database, so its insert is idempotent (INSERT OR IGNORE) and the
+	rollup + delete commit atomically in the main file; a crash between them cannot double count.
+	Returns the number of tickets archived.
+	"""
+	older_than_days = app.config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+	batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+	max_batches = max_batches or app.config['ARCHIVE_MAX_BATCHES_PER_RUN']
+	now = datetime.utcnow()
+	cutoff = now - timedelta(days=older_than_days)
+	issued_ticket = IssuedTicket.__table__
+	history = TicketHistoryDaily.__table__
+	archive = ArchivedTicket.__table__
+
+	archived_count = 0
+	for _ in range(max_batches):
+		moved_ids = [ticket_id for (ticket_id,) in db.session.execute(
+			db.select(issued_ticket.c.id).where(
+				issued_ticket.c.consumed_date.is_not(None),
+				issued_ticket.c.consumed_date < cutoff
+			).order_by(issued_ticket.c.consumed_date).limit(batch_size)
+		)]
+		if not moved_ids:
+			break
+		in_batch = issued_ticket.c.id.in_(moved_ids)
+
+		db.session.execute(
+			archive.insert().prefix_with('OR IGNORE').from_select(
+				['id', 'ticket_type_id', 'wallet_id', 'issued_date', 'consumed_date', 'archived_date'],
+				db.select(
+					issued_ticket.c.id, issued_ticket.c.ticket_type_id, issued_ticket.c.wallet_id,
+					issued_ticket.c.issued_date, issued_ticket.c.consumed_date, db.literal(now, db.DateTime)
+				).where(in_batch)
+			)
+		)
+
+		consumed_day = db.func.date(issued_ticket.c.consumed_date)
+		rollup = sqlite_insert(history).from_select(
+			['day', 'wallet_id', 'ticket_type_id', 'consumed_count'],
+			db.select(consumed_day, issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id, db.func.count()).where(
+				in_batch
+			).group_by(consumed_day, issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id)
+		)
+		db.session.execute(rollup.on_conflict_do_update(
+			index_elements=[history.c.day, history.c.wallet_id, history.c.ticket_type_id],
+			set_={'consumed_count': history.c.consumed_count + rollup.excluded.consumed_count}
+		))
+
+		db.session.execute(db.delete(issued_ticket).where(in_batch))
+		db.session.commit()
+		archived_count += len(moved_ids)
+		incremental_vacuum()
+		if len(moved_ids) < batch_size:
+			break
+
+	if archived_count:
+		logging.info(f"Archived {archived_count} consumed ticket(s) older than {older_than_days} day(s).")
+	return archived_count
+
+def delete_history_rollups(wallet_id=None, ticket_type_id=None):
+	"""
+	Deletes the ticket_history_daily rollups of a wallet or ticket type being deleted, in the caller's
+	transaction. The rollups have no foreign keys, and SQLite hands the highest deleted ID to the next
+	new row, so leftovers would show up in that row's history and balances.
+	"""
+	history = TicketHistoryDaily.__table__
+	if wallet_id is not None:
+		db.session.execute(db.delete(history).where(history.c.wallet_id == wallet_id))
+	if ticket_type_id is not None:
+		db.session.execute(db.delete(history).where(history.c.ticket_type_id == ticket_type_id))
+
+def incremental_vacuum(pages=None):
+	"""Returns up to `pages` free pages of the main database file to the OS (needs auto_vacuum=INCREMENTAL)."""
+	pages = pages or app.config['VACUUM_PAGES_PER_BATCH']
+	with db.engine.connect() as conn:
+		# The pragma frees one page per step; executescript steps it to completion
+		conn.connection.dbapi_connection.executescript(f"PRAGMA main.incremental_vacuum({int(pages)})")
+
+def archive_tickets_job():
+	"""Scheduled job: archives one run's worth of old consumed tickets, in whichever process gets the lease."""
+	with app.app_context():
+		if not acquire_lease(ARCHIVER_LEASE_NAME):
+			return 0
+		try:
+			return archive_consumed_tickets()
+		except Exception as e:
+			db.session.rollback()
+			logging.error(f"Error archiving consumed tickets: {e}", exc_info=True)
+			return 0
+		finally:
+			release_lease(ARCHIVER_LEASE_NAME)
+
+# --- List Responses (pagination & streaming) ---
+
+def encode_cursor(values):
+	"""Encodes the sort key of the last returned row as an opaque cursor string."""
+	values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+	return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, order_columns):
+	"""Decodes a cursor back into sort key values typed for `order_columns`. Raises ValueError if invalid."""
+	try:
+		values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	except (ValueError, TypeError) as e:
+		raise ValueError(f"Malformed cursor: {e}")
+	if not isinstance(values, list) or len(values) != len(order_columns):
+		raise ValueError("Cursor does not match this list")
+	decoded = []
+	for column, value in zip(order_columns, values):
+		if isinstance(column.type, db.DateTime):
+			if not isinstance(value, str):
+				raise ValueError("Cursor does not match this list")
+			value = datetime.fromisoformat(value) # Raises ValueError if malformed
+		elif isinstance(column.type, db.Integer):
+			if not isinstance(value, int) or isinstance(value, bool):
+				raise ValueError("Cursor does not match this list")
+		elif not isinstance(value, str):
+			raise ValueError("Cursor does not match this list")
+		decoded.append(value)
+	return decoded
+
+def list_response(query, order_columns, serialize, descending=False):
+	"""
+	Returns a list endpoint response for `query`, ordered by `order_columns` (the last one must be unique).
+	- ?limit=N&after=<cursor> pages with keyset pagination; the cursor for the next page is sent in
+	  the X-Next-Cursor header (absent on the last page). Without ?limit the whole list is returned.
+	- ?format=ndjson streams one JSON object per line from a server-side cursor instead of
+	  building the full list in memory.
+	"""
+	limit = request.args.get('limit')
+	if limit is not None:
+		try:
+			limit = int(limit)
+		except ValueError:
+			limit = 0
+		if not 1 <= limit <= app.config['PAGINATION_MAX_LIMIT']:
+			return jsonify({"error": f"Invalid 'limit' (must be integer between 1 and {app.config['PAGINATION_MAX_LIMIT']})"}), 400
+
+	after = request.args.get('after')
+	if after is not None:
+		try:
+			after_values = decode_cursor(after, order_columns)
+		except ValueError as e:
+			return jsonify({"error": f"Invalid 'after': {e}"}), 400
+		sort_key = db.tuple_(*order_columns) if len(order_columns) > 1 else order_columns[0]
+		sort_value = db.tuple_(*after_values) if len(order_columns) > 1 else after_values[0]
+		query = query.filter(sort_key < sort_value if descending else sort_key > sort_value)
+
+	query = query.order_by(*[column.desc() if descending else column for column in order_columns])
+
+	response_format = request.args.get('format', 'json')
+	if response_format == 'ndjson':
+		if limit is not None:
+			query = query.limit(limit)
+
+		def generate():
+			for row in query.yield_per(app.config['STREAM_BATCH_SIZE']):
+				yield json.dumps(serialize(row)) + '\n'
+		return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+	elif response_format != 'json':
+		return jsonify({"error": "Invalid 'format' (must be 'json' or 'ndjson')"}), 400
+
+	if limit is None:
+		return jsonify([serialize(row) for row in query.all()])
+
+	rows = query.limit(limit + 1).all() # One extra row tells us whether there is a next page
+	response = jsonify([serialize(row) for row in rows[:limit]])
+	if len(rows) > limit:
+		last_row = rows[limit - 1]
+		response.headers['X-Next-Cursor'] = encode_cursor([getattr(last_row, column.key) for column in order_columns])
+	return response
+
+# --- Change Events (Server-Sent Events) ---
+
+event_notifier = threading.Condition() # Wakes this process's SSE streams as soon as an event commits
+
+def record_event(event_type, payload, wallet_id=None):
+	"""Adds an event to the outbox in the caller's transaction; it is published when that commits."""
+	db.session.execute(db.insert(EventLog.__table__).values(
+		event_type=event_type,
+		wallet_id=wallet_id,
+		payload=json.dumps(payload),
+		created_at=datetime.utcnow()
+	))
+	db.session.info['events_pending'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def notify_event_streams(session):
+	"""Wakes local SSE streams after a commit that recorded events (other processes are found by polling)."""
+	if session.info.pop('events_pending', False):
+		with event_notifier:
+			event_notifier.notify_all()
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_pending_events(session):
+	session.info.pop('events_pending', None)
+
+def fetch_events(after_id, wallet_id=None, limit=100):
+	"""Returns events newer than `after_id` (for one wallet plus broadcasts, if `wallet_id` is given)."""
+	event_log = EventLog.__table__
+	query = db.select(event_log).where(event_log.c.id > after_id)
+	if wallet_id is not None:
+		query = query.where(db.or_(event_log.c.wallet_id == wallet_id, event_log.c.wallet_id.is_(None)))
+	return db.session.execute(query.order_by(event_log.c.id).limit(limit)).all()
+
+def prune_event_log(now=None):
+	"""Deletes events older than EVENT_LOG_RETENTION_SECONDS. Returns the number of rows removed."""
+	cutoff = (now or datetime.utcnow()) - timedelta(seconds=app.config['EVENT_LOG_RETENTION_SECONDS'])
+	result = db.session.execute(db.delete(EventLog.__table__).where(EventLog.__table__.c.created_at < cutoff))
+	db.session.commit()
+	return result.rowcount
+
+def format_sse(event_row):
+	"""Formats an event_log row as a Server-Sent Events message."""
+	data = json.loads(event_row.payload)
+	data['wallet_id'] = event_row.wallet_id
+	data['created_at'] = event_row.created_at.isoformat() + 'Z'
+	return f"id: {event_row.id}\nevent: {event_row.event_type}\ndata: {json.dumps(data)}\n\n"
+
+# --- Response Cache ---
+
+class ResponseCache:
+	"""A small thread-safe LRU of response bodies (and the headers they need) with a TTL."""
+
+	def __init__(self, max_entries, ttl_seconds):
+		self.max_entries = max_entries
+		self.ttl_seconds = ttl_seconds
+		self._entries = OrderedDict() # key -> (expires_at, body, mimetype, headers)
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			if entry[0] < time.monotonic():
+				del self._entries[key]
+				return None
+			self._entries.move_to_end(key)
+			return entry[1:]
+
+	def set(self, key, body, mimetype, headers=None):
+		with self._lock:
+			self._entries[key] = (time.monotonic() + self.ttl_seconds, body, mimetype, headers or {})
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_TTL_SECONDS'])
+
+def bump_table_versions(*table_names):
+	"""
+	Marks tables as changed, invalidating cached responses that depend on them in every process.
+	Runs inside the caller's transaction, so the bump commits (or rolls back) with the write.
+	"""
+	table_version = TableVersion.__table__
+	for table_name in table_names:
+		db.session.execute(
+			sqlite_insert(table_version).values(name=table_name, version=1).on_conflict_do_update(
+				index_elements=[table_version.c.name],
+				set_={'version': table_version.c.version + 1}
+			)
+		)
+
+def get_table_versions(table_names):
+	"""Returns the current version of each table (0 if never written) in one query."""
+	versions = dict(db.session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(table_names)))
+	return tuple(versions.get(table_name, 0) for table_name in table_names)
+
+CACHED_RESPONSE_HEADERS = ('X-Next-Cursor',) # Part of a list page's content; replayed on cache hits
+
+def cached_response(*table_names):
+	"""
+	Caches a GET view's JSON response, keyed by the request URL and the versions of `table_names`.
+	Responses carry an ETag derived from the same key, so clients revalidate with If-None-Match and
+	get 304 Not Modified without the list being queried or serialised. Streamed responses bypass it.
+	"""
+	def decorator(view):
+		@functools.wraps(view)
+		def wrapper(*args, **kwargs):
+			if request.args.get('format') == 'ndjson':
+				return view(*args, **kwargs)
+
+			versions = get_table_versions(table_names)
+			etag = hashlib.sha1(f"{request.full_path}|{versions}".encode()).hexdigest()
+			cache_control = f"public, max-age={app.config['RESPONSE_CACHE_MAX_AGE']}, must-revalidate"
+
+			if request.if_none_match.contains(etag):
+				response = make_response('', 304)
+			else:
+				cached = response_cache.get(etag)
+				if cached is not None:
+					body, mimetype, headers = cached
+					response = Response(body, mimetype=mimetype, headers=headers)
+				else:
+					response = make_response(view(*args, **kwargs))
+					if response.status_code != 200:
+						return response
+					headers = {name: response.headers[name] for name in CACHED_RESPONSE_HEADERS if name in response.headers}
+					response_cache.set(etag, response.get_data(), response.mimetype, headers)
+			response.set_etag(etag)
+			response.headers['Cache-Control'] = cache_control
+			return response
+		return wrapper
+	return decorator
+
+# --- Bulk Import & Export ---
+BULK_FORMATS = ('ndjson', 'csv')
+TICKET_TYPE_INTEGER_FIELDS = ('distribute_quantity', 'frequency_value', 'target_wallet_id', 'max_catch_up_periods')
+
+def read_import_rows(lines, import_format, integer_fields=()):
+	"""
+	Yields (line_number, row, error) for each record of an NDJSON or CSV (header row first) text
+	stream; exactly one of row and error is set. Empty CSV cells become None and `integer_fields`
+	are converted to int where they parse (validation reports the rest).
+	"""
+	line_number = 0
+	try:
+		if import_format == 'ndjson':
+			for line_number, line in enumerate(lines, start=1):
+				if not line.strip():
+					continue
+				try:
+					row = json.loads(line)
+				except ValueError as e:
+					yield line_number, None, f"Invalid JSON: {e}"
+					continue
+				if not isinstance(row, dict):
+					yield line_number, None, "Each line must be a JSON object"
+					continue
+				yield line_number, row, None
+			return
+
+		reader = csv.DictReader(lines)
+		for record in reader:
+			line_number = reader.line_num
+			row = {key: value if value != '' else None for key, value in record.items() if key is not None}
+			for field in integer_fields:
+				try:
+					row[field] = int(row[field]) if row.get(field) is not None else row.get(field)
+				except ValueError:
+					pass
+			yield line_number, row, None
+	except (UnicodeDecodeError, csv.Error) as e:
+		yield line_number + 1, None, f"Unreadable input, import stopped: {e}"
+
+def iter_batches(iterable, size):
+	"""Yields lists of up to `size` items from `iterable`."""
+	batch = []
+	for item in iterable:
+		batch.append(item)
+		if len(batch) >= size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+class ImportResult:
+	"""Counts created rows and collects per-row errors (up to IMPORT_MAX_REPORTED_ERRORS) for a bulk import."""
+
+	def __init__(self):
+		self.created_count = 0
+		self.error_count = 0
+		self.errors = []
+
+	def reject(self, line_number, error):
+		"""Records a rejected row; `error` is a message, or a dict of messages by field."""
+		self.error_count += 1
+		if len(self.errors) < app.config['IMPORT_MAX_REPORTED_ERRORS']:
+			key = 'errors' if isinstance(error, dict) else 'error'
+			self.errors.append({'line': line_number, key: error})
 
-		logging.info("Ticket distribution job finished.")
+	def to_dict(self):
+		return {'created': self.created_count, 'rejected': self.error_count, 'errors': self.sorted_errors()}
 
+	def sorted_errors(self):
+		return sorted(self.errors, key=lambda error: error['line']) # Batches report validation before conflicts
+
+def import_wallets(records):
+	"""
+	Creates wallets from read_import_rows() records, IMPORT_BATCH_SIZE rows at a time: one query per
+	batch finds names that already exist, then the batch's valid rows are written with one
+	executemany INSERT and committed. Returns an ImportResult.
+	"""
+	result = ImportResult()
+	seen_names = set()
+	for batch in iter_batches(records, app.config['IMPORT_BATCH_SIZE']):
+		candidates = [] # (line_number, name)
+		for line_number, row, error in batch:
+			name = row.get('name') if row is not None else None
+			if error is None:
+				if not isinstance(name, str) or not name.strip():
+					error = "Wallet name is required and must be a non-empty string"
+				elif name in seen_names:
+					error = f"Wallet name '{name}' appears more than once in the import"
+			if error:
+				result.reject(line_number, error)
+				continue
+			seen_names.add(name)
+			candidates.append((line_number, name))
+		if not candidates:
+			continue
+
+		existing_names = {name for (name,) in db.session.query(Wallet.name).filter(Wallet.name.in_([name for _, name in candidates]))}
+		rows = []
+		for line_number, name in candidates:
+			if name in existing_names:
+				result.reject(line_number, f"Wallet name '{name}' already exists")
+			else:
+				rows.append({'line_number': line_number, 'name': name})
+		if not rows:
+			continue
+		try:
+			db.session.execute(Wallet.__table__.insert(), [{'name': row['name']} for row in rows])
+			bump_table_versions('wallet')
+			db.session.commit()
+		except IntegrityError:
+			db.session.rollback() # A wallet with one of these names was created meanwhile
+			for row in rows:
+				result.reject(row['line_number'], "Batch conflicted with a concurrent change; not imported")
+			continue
+		result.created_count += len(rows)
+	return result
+
+def import_ticket_types(records):
+	"""
+	Creates ticket types from read_import_rows() records, IMPORT_BATCH_SIZE rows at a time. Fields are
+	validated like POST /api/ticket-types, but name conflicts and target wallets are looked up with
+	one query each per batch. A row may name its target wallet with target_wallet_name (which takes
+	precedence over target_wallet_id), so exports from another instance import cleanly.
+	Returns an ImportResult.
+	"""
+	result = ImportResult()
+	seen_names = set()
+	now = datetime.utcnow()
+	for batch in iter_batches(records, app.config['IMPORT_BATCH_SIZE']):
+		candidates = [] # (line_number, validated_data, target_wallet_name)
+		for line_number, row, error in batch:
+			if error:
+				result.reject(line_number, error)
+				continue
+			validated_data, errors = validate_ticket_type_fields(row, check_references=False)
+			target_wallet_name = row.get('target_wallet_name')
+			if target_wallet_name is not None and not isinstance(target_wallet_name, str):
+				errors['target_wallet_name'] = "Invalid 'target_wallet_name' (must be string or null)"
+			if not errors and validated_data['name'] in seen_names:
+				errors['name'] = f"Ticket Type name '{validated_data['name']}' appears more than once in the import"
+			if errors:
+				result.reject(line_number, errors)
+				continue
+			seen_names.add(validated_data['name'])
+			candidates.append((line_number, validated_data, target_wallet_name))
+		if not candidates:
+			continue
+
+		names = [validated_data['name'] for _, validated_data, _ in candidates]
+		existing_names = {name for (name,) in db.session.query(TicketType.name).filter(TicketType.name.in_(names))}
+		wallet_ids = {validated_data['target_wallet_id'] for _, validated_data, _ in candidates if validated_data['target_wallet_id'] is not None}
+		wallet_names = {target_wallet_name for _, _, target_wallet_name in candidates if target_wallet_name}
+		wallet_ids_by_name = {}
+		known_wallet_ids = set()
+		if wallet_ids or wallet_names:
+			for wallet_id, wallet_name in db.session.query(Wallet.id, Wallet.name).filter(
+				db.or_(Wallet.id.in_(wallet_ids), Wallet.name.in_(wallet_names))
+			):
+				wallet_ids_by_name[wallet_name] = wallet_id
+				known_wallet_ids.add(wallet_id)
+
+		new_types = []
+		for line_number, validated_data, target_wallet_name in candidates:
+			if validated_data['name'] in existing_names:
+				result.reject(line_number, {'name': f"Ticket Type name '{validated_data['name']}' already exists"})
+				continue
+			if target_wallet_name:
+				if target_wallet_name not in wallet_ids_by_name:
+					result.reject(line_number, {'target_wallet_name': f"Target wallet '{target_wallet_name}' not found"})
+					continue
+				validated_data['target_wallet_id'] = wallet_ids_by_name[target_wallet_name]
+			elif validated_data['target_wallet_id'] is not None and validated_data['target_wallet_id'] not in known_wallet_ids:
+				result.reject(line_number, {'target_wallet_id': f"Target wallet ID {validated_data['target_wallet_id']} not found"})
+				continue
+			new_type = TicketType(**validated_data)
+			new_type.update_next_due_at(now)
+			new_types.append((line_number, new_type))
+		if not new_types:
+			continue
+		try:
+			db.session.add_all([new_type for _, new_type in new_types])
+			db.session.flush() # One multi-row INSERT; assigns the IDs for the event
+			# One event per batch rather than per ticket type
+			record_event('ticket_type_changed', {
+				'action': 'imported',
+				'ticket_type_ids': [new_type.id for _, new_type in new_types],
+				'ticket_type': None
+			})
+			bump_table_versions('ticket_type')
+			db.session.commit()
+		except IntegrityError:
+			db.session.rollback() # A type with one of these names was created (or a target wallet deleted) meanwhile
+			for line_number, _ in new_types:
+				result.reject(line_number, "Batch conflicted with a concurrent change; not imported")
+			continue
+		result.created_count += len(new_types)
+	if result.created_count:
+		arm_distribution_job()
+	return result
+
+IMPORTERS = {
+	'wallets': (import_wallets, ()),
+	'ticket-types': (import_ticket_types, TICKET_TYPE_INTEGER_FIELDS),
+}
+
+def export_wallets():
+	for wallet in Wallet.query.order_by(Wallet.id).yield_per(app.config['STREAM_BATCH_SIZE']):
+		yield wallet.to_dict()
+
+def export_ticket_types():
+	query = TicketType.query.options(db.joinedload(TicketType.target_wallet)).order_by(TicketType.id)
+	for ticket_type in query.yield_per(app.config['STREAM_BATCH_SIZE']):
+		yield ticket_type.to_dict()
+
+def export_tickets(wallet_id=None, since=None):
+	"""
+	Yields the full ticket history: live tickets, then archived ones, each in ID order. Rows are
+	fetched STREAM_BATCH_SIZE at a time, so memory stays flat however long the history is.
+	"""
+	for archived, model in ((False, IssuedTicket), (True, ArchivedTicket)):
+		# Outer joins: archived rows may outlive their ticket type or wallet
+		query = db.session.query(
+			model.id, model.ticket_type_id, TicketType.name.label('ticket_type_name'),
+			model.wallet_id, Wallet.name.label('wallet_name'), model.issued_date, model.consumed_date
+		).outerjoin(TicketType, TicketType.id == model.ticket_type_id).outerjoin(Wallet, Wallet.id == model.wallet_id)
+		if wallet_id is not None:
+			query = query.filter(model.wallet_id == wallet_id)
+		if since is not None:
+			query = query.filter(model.issued_date >= since)
+		for row in query.order_by(model.id).yield_per(app.config['STREAM_BATCH_SIZE']):
+			yield {
+				'id': row.id,
+				'ticket_type_id': row.ticket_type_id,
+				'ticket_type_name': row.ticket_type_name,
+				'wallet_id': row.wallet_id,
+				'wallet_name': row.wallet_name,
+				'issued_date': row.issued_date.isoformat() + 'Z',
+				'consumed_date': row.consumed_date.isoformat() + 'Z' if row.consumed_date else None,
+				'archived': archived,
+			}
+
+EXPORTERS = {
+	'wallets': export_wallets,
+	'ticket-types': export_ticket_types,
+	'tickets': export_tickets,
+}
+
+def format_export_rows(rows, export_format):
+	"""Yields `rows` (dicts) as NDJSON lines, or as CSV with a header taken from the first row, in ~64 KB chunks."""
+	buffer = io.StringIO()
+	writer = None
+	for row in rows:
+		if export_format == 'ndjson':
+			buffer.write(json.dumps(row) + '\n')
+		else:
+			if writer is None:
+				writer = csv.DictWriter(buffer, fieldnames=list(row), lineterminator='\n')
+				writer.writeheader()
+			writer.writerow(row)
+		if buffer.tell() >= 65536:
+			yield buffer.getvalue()
+			buffer.seek(0)
+			buffer.truncate()
+	if buffer.tell():
+		yield buffer.getvalue()
 
 # --- API Routes ---
 
 # Wallets
 @app.route('/api/wallets', methods=['GET'])
+@cached_response('wallet')
 def get_wallets():
-	"""Returns a list of all wallets."""
-	wallets = Wallet.query.order_by(Wallet.name).all() # Added ordering
-	return jsonify([wallet.to_dict() for wallet in wallets])
+	"""Returns a list of all wallets, ordered by name (supports ?limit=&after= and ?format=ndjson)."""
+	return list_response(Wallet.query, [Wallet.name], Wallet.to_dict)
 
 @app.route('/api/wallets', methods=['POST'])
 def add_wallet():
@@ -337,6 +2256,7 @@ def add_wallet():
 
 	new_wallet = Wallet(name=name)
 	db.session.add(new_wallet)
+	bump_table_versions('wallet')
 	db.session.commit()
 	logging.info(f"Wallet '{new_wallet.name}' (ID: {new_wallet.id}) created.")
 	return jsonify(new_wallet.to_dict()), 201 # 201 Created
@@ -356,8 +2276,11 @@ def delete_wallet(wallet_id):
 		}), 400 # Bad Request or 409 Conflict
 
 	wallet_name = wallet.name # Store name for logging before deletion
-	# cascade="all, delete-orphan" on Wallet.tickets relationship handles IssuedTicket deletion
+	# ondelete='CASCADE' (enforced by PRAGMA foreign_keys=ON) deletes the IssuedTickets in SQL;
+	# passive_deletes=True stops the ORM from loading them first
 	db.session.delete(wallet)
+	delete_history_rollups(wallet_id=wallet_id)
+	bump_table_versions('wallet')
 	db.session.commit()
 	logging.info(f"Wallet '{wallet_name}' (ID: {wallet_id}) and associated issued tickets deleted.")
 	return jsonify({"message": f"Wallet '{wallet_name}' deleted successfully"}), 200
@@ -380,16 +2303,20 @@ def update_wallet(wallet_id):
 
 	old_name = wallet.name
 	wallet.name = new_name
+	bump_table_versions('wallet')
 	db.session.commit()
 	logging.info(f"Wallet ID {wallet_id} name updated from '{old_name}' to '{new_name}'.")
 	return jsonify(wallet.to_dict()), 200
 
 # Ticket Types
 @app.route('/api/ticket-types', methods=['GET'])
+@cached_response('ticket_type', 'wallet') # to_dict() includes target_wallet_name
 def get_ticket_types():
-	"""Returns a list of all ticket types."""
-	ticket_types = TicketType.query.order_by(TicketType.name).all() # Added ordering
-	return jsonify([tt.to_dict() for tt in ticket_types])
+	"""Returns a list of all ticket types, ordered by name (supports ?limit=&after= and ?format=ndjson)."""
+	query = TicketType.query.options(
+		db.joinedload(TicketType.target_wallet) # to_dict() reads target_wallet.name
+	)
+	return list_response(query, [TicketType.name], TicketType.to_dict)
 
 @app.route('/api/ticket-types', methods=['POST'])
 def add_ticket_type():
@@ -404,11 +2331,18 @@ def add_ticket_type():
 		return error_response
 
 	new_type = TicketType(**validated_data)
+	new_type.update_next_due_at()
 	db.session.add(new_type)
+	db.session.flush() # Assigns the ID for the event
+	record_event('ticket_type_changed', {'action': 'created', 'ticket_type_id': new_type.id, 'ticket_type': new_type.to_dict()})
+	bump_table_versions('ticket_type')
 	db.session.commit()
+	arm_distribution_job()
 	logging.info(f"Ticket Type '{new_type.name}' (ID: {new_type.id}) created.")
 	return jsonify(new_type.to_dict()), 201
 
+RESCHEDULING_FIELDS = {'frequency_value', 'frequency_unit', 'schedule', 'timezone', 'anchor_at'}
+
 @app.route('/api/ticket-types/<int:type_id>', methods=['PUT'])
 def update_ticket_type(type_id):
 	"""Updates an existing ticket type."""
@@ -432,7 +2366,18 @@ def update_ticket_type(type_id):
 			setattr(ticket_type, key, value)
 
 	if updated_fields:
+		if RESCHEDULING_FIELDS.intersection(updated_fields):
+			ticket_type.update_next_due_at()
+		db.session.flush() # So to_dict() sees a changed target_wallet
+		record_event('ticket_type_changed', {
+			'action': 'updated',
+			'ticket_type_id': type_id,
+			'updated_fields': updated_fields,
+			'ticket_type': ticket_type.to_dict()
+		})
+		bump_table_versions('ticket_type')
 		db.session.commit()
+		arm_distribution_job()
 		logging.info(f"Ticket Type '{ticket_type.name}' (ID: {type_id}) updated fields: {', '.join(updated_fields)}.")
 	else:
 		logging.info(f"Ticket Type '{ticket_type.name}' (ID: {type_id}) update requested, but no changes detected.")
@@ -448,67 +2393,496 @@ def delete_ticket_type(type_id):
 		return jsonify({"error": "Ticket Type not found"}), 404
 
 	type_name = ticket_type.name # Store for logging
-	# cascade="all, delete-orphan" on TicketType.issued_tickets handles IssuedTicket deletion
-	# Also added ondelete='CASCADE' to FKs in IssuedTicket for good measure
+	# ondelete='CASCADE' on IssuedTicket.ticket_type_id (enforced by PRAGMA foreign_keys=ON) deletes
+	# the IssuedTickets in SQL; passive_deletes=True on TicketType.issued_tickets skips the ORM load
 	db.session.delete(ticket_type)
+	delete_history_rollups(ticket_type_id=type_id)
+	record_event('ticket_type_changed', {'action': 'deleted', 'ticket_type_id': type_id, 'ticket_type': None})
+	bump_table_versions('ticket_type')
 	db.session.commit()
 	logging.info(f"Ticket Type '{type_name}' (ID: {type_id}) and associated issued tickets deleted.")
 	return jsonify({"message": f"Ticket type '{type_name}' deleted successfully"}), 200
 
+# Change events
+def parse_event_stream_request():
+	"""
+	Reads ?wallet_id= and Last-Event-ID (or ?since=) for an event stream. Returns (wallet_id, last_event_id, None),
+	or (None, None, error response). Also used by the ASGI entry point, which streams events itself.
+	"""
+	wallet_id = request.args.get('wallet_id')
+	if wallet_id is not None:
+		try:
+			wallet_id = int(wallet_id)
+		except ValueError:
+			return None, None, (jsonify({"error": "Invalid 'wallet_id' (must be integer)"}), 400)
+
+	last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+	if last_event_id is not None:
+		try:
+			last_event_id = int(last_event_id)
+		except ValueError:
+			return None, None, (jsonify({"error": "Invalid 'Last-Event-ID'/'since' (must be integer)"}), 400)
+	else:
+		# New subscribers only get events from now on
+		last_event_id = db.session.query(db.func.max(EventLog.id)).scalar() or 0
+	db.session.rollback() # Don't hold a read transaction while streaming
+	return wallet_id, last_event_id, None
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+	"""
+	Streams tickets_issued, ticket_consumed and ticket_type_changed events as Server-Sent Events.
+	?wallet_id= limits the stream to one wallet (plus events concerning all wallets). Streams end after
+	SSE_MAX_STREAM_SECONDS so a worker is never held forever; EventSource reconnects automatically and
+	resumes from Last-Event-ID (or ?since=), as long as the event is still within the retention window.
+	"""
+	wallet_id, last_event_id, error = parse_event_stream_request()
+	if error:
+		return error
+
+	def generate():
+		after_id = last_event_id
+		deadline = time.monotonic() + app.config['SSE_MAX_STREAM_SECONDS']
+		last_write = time.monotonic()
+		yield "retry: 3000\n\n"
+		while time.monotonic() < deadline:
+			events = fetch_events(after_id, wallet_id)
+			db.session.rollback() # End the read transaction between polls so WAL checkpoints can proceed
+			for event_row in events:
+				after_id = event_row.id
+				yield format_sse(event_row)
+			if events:
+				last_write = time.monotonic()
+				continue # There may be more; poll again right away
+			if time.monotonic() - last_write >= app.config['SSE_HEARTBEAT_SECONDS']:
+				yield ": keep-alive\n\n"
+				last_write = time.monotonic()
+			with event_notifier:
+				event_notifier.wait(timeout=app.config['SSE_POLL_SECONDS'])
+
+	response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+	response.headers['Cache-Control'] = 'no-cache'
+	response.headers['X-Accel-Buffering'] = 'no' # Tell nginx not to buffer the stream
+	return response
+
 # Issued Tickets (within a wallet context)
 @app.route('/api/wallets/<int:wallet_id>/tickets', methods=['GET'])
 def get_wallet_tickets(wallet_id):
-	"""Gets available (unconsumed) tickets for a specific wallet."""
+	"""
+	Gets available (unconsumed) tickets for a specific wallet (supports ?limit=&after= and ?format=ndjson).
+	With ?group=type, returns one aggregated row per ticket type instead of every ticket.
+	"""
 	wallet = Wallet.query.get(wallet_id)
 	if not wallet:
 		return jsonify({"error": "Wallet not found"}), 404
 
+	group = request.args.get('group')
+	if group == 'type':
+		return jsonify(get_wallet_ticket_counts(wallet.id))
+	elif group is not None:
+		return jsonify({"error": "Invalid 'group' (must be 'type')"}), 400
+
 	# Filter for tickets belonging to this wallet AND not consumed
-	available_tickets = IssuedTicket.query.filter_by(
+	# The wallet is already in the session, so only the ticket types need eager loading for to_dict()
+	available_tickets = IssuedTicket.query.options(
+		db.joinedload(IssuedTicket.ticket_type)
+	).filter_by(
 		wallet_id=wallet.id,
 		consumed_date=None
-	).order_by(IssuedTicket.issued_date.desc()).all() # Order by newest first
+	)
+
+	# Newest first; id breaks ties between tickets issued in the same distribution
+	return list_response(
+		available_tickets,
+		[IssuedTicket.issued_date, IssuedTicket.id],
+		lambda ticket: ticket.to_dict(include_wallet=True),
+		descending=True
+	)
+
+def get_wallet_ticket_counts(wallet_id):
+	"""Counts a wallet's available tickets per type with a single GROUP BY query."""
+	rows = db.session.query(
+		IssuedTicket.ticket_type_id,
+		TicketType.name,
+		db.func.count(IssuedTicket.id),
+		db.func.min(IssuedTicket.issued_date),
+		db.func.max(IssuedTicket.issued_date),
+	).join(TicketType, TicketType.id == IssuedTicket.ticket_type_id).filter(
+		IssuedTicket.wallet_id == wallet_id,
+		IssuedTicket.consumed_date.is_(None)
+	).group_by(IssuedTicket.ticket_type_id, TicketType.name).order_by(TicketType.name).all()
+
+	return [{
+		'ticket_type_id': ticket_type_id,
+		'name': name,
+		'available_count': available_count,
+		'oldest_issued': oldest_issued.isoformat() + 'Z',
+		'newest_issued': newest_issued.isoformat() + 'Z',
+	} for ticket_type_id, name, available_count, oldest_issued, newest_issued in rows]
+
+@app.route('/api/wallets/<int:wallet_id>/history', methods=['GET'])
+def get_wallet_history(wallet_id):
+	"""Returns daily consumed counts per ticket type for the wallet's archived tickets (optional ?since=YYYY-MM-DD)."""
+	query = TicketHistoryDaily.query.filter_by(wallet_id=wallet_id)
+	since = request.args.get('since')
+	if since is not None:
+		try:
+			query = query.filter(TicketHistoryDaily.day >= datetime.strptime(since, '%Y-%m-%d').date())
+		except ValueError:
+			return jsonify({"error": "Invalid 'since' (must be YYYY-MM-DD)"}), 400
+	history = query.order_by(TicketHistoryDaily.day, TicketHistoryDaily.ticket_type_id).all()
+	return jsonify([row.to_dict() for row in history])
+
+def serialize_balance(row):
+	return {
+		'wallet_id': row.wallet_id,
+		'wallet_name': row.wallet_name,
+		'ticket_type_id': row.ticket_type_id,
+		'ticket_type_name': row.ticket_type_name,
+		'available': row.available,
+		'issued_total': row.issued_total,
+		'consumed_total': row.consumed_total,
+	}
+
+def balances_query():
+	return db.session.query(
+		WalletBalance.wallet_id, Wallet.name.label('wallet_name'),
+		WalletBalance.ticket_type_id, TicketType.name.label('ticket_type_name'),
+		WalletBalance.available, WalletBalance.issued_total, WalletBalance.consumed_total
+	).join(Wallet, Wallet.id == WalletBalance.wallet_id).join(TicketType, TicketType.id == WalletBalance.ticket_type_id)
+
+@app.route('/api/wallets/<int:wallet_id>/balances', methods=['GET'])
+def get_wallet_balances(wallet_id):
+	"""Returns the wallet's ticket balance per type from wallet_balance (no ticket rows are read)."""
+	rows = balances_query().filter(WalletBalance.wallet_id == wallet_id).order_by(TicketType.name).all()
+	if not rows and not db.session.query(Wallet.id).filter_by(id=wallet_id).first():
+		return jsonify({"error": "Wallet not found"}), 404
+	return jsonify([serialize_balance(row) for row in rows])
 
-	return jsonify([ticket.to_dict(include_wallet=True) for ticket in available_tickets])
+@app.route('/api/balances', methods=['GET'])
+def get_all_balances():
+	"""Dashboard view: every wallet's balance per type (supports ?limit=&after= and ?format=ndjson)."""
+	return list_response(
+		balances_query(),
+		[WalletBalance.wallet_id, WalletBalance.ticket_type_id],
+		serialize_balance
+	)
 
 # Action: Consume Ticket
+def consume_tickets_by_id(ticket_ids, consumed_date):
+	"""
+	Consumes the given tickets with one conditional UPDATE, so a ticket can only be consumed once even
+	under concurrent requests. Returns {ticket_id: wallet_id} for the tickets this call consumed.
+	"""
+	issued_ticket = IssuedTicket.__table__
+	result = db.session.execute(
+		db.update(issued_ticket).where(
+			issued_ticket.c.id.in_(ticket_ids),
+			issued_ticket.c.consumed_date.is_(None)
+		).values(consumed_date=consumed_date).returning(issued_ticket.c.id, issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id)
+	)
+	consumed = {}
+	consumed_per_balance = {}
+	for ticket_id, wallet_id, ticket_type_id in result:
+		consumed[ticket_id] = wallet_id
+		consumed_per_balance[(wallet_id, ticket_type_id)] = consumed_per_balance.get((wallet_id, ticket_type_id), 0) + 1
+	adjust_balances(consumed=consumed_per_balance)
+	record_consumed_events(consumed, consumed_date)
+	return consumed
+
+def consume_oldest_tickets(wallet_id, ticket_type_id, count, consumed_date):
+	"""
+	Consumes up to `count` of a wallet's oldest available tickets of a type with a single
+	UPDATE ... WHERE id IN (SELECT ... LIMIT count). Returns the consumed IDs, oldest first.
+	"""
+	issued_ticket = IssuedTicket.__table__
+	oldest_available = db.select(issued_ticket.c.id).where(
+		issued_ticket.c.wallet_id == wallet_id,
+		issued_ticket.c.ticket_type_id == ticket_type_id,
+		issued_ticket.c.consumed_date.is_(None)
+	).order_by(issued_ticket.c.issued_date, issued_ticket.c.id).limit(count)
+	result = db.session.execute(
+		db.update(issued_ticket).where(
+			issued_ticket.c.id.in_(oldest_available),
+			issued_ticket.c.consumed_date.is_(None)
+		).values(consumed_date=consumed_date).returning(issued_ticket.c.id)
+	)
+	consumed_ids = sorted(ticket_id for (ticket_id,) in result) # IDs grow with issue order
+	if consumed_ids:
+		adjust_balances(consumed={(wallet_id, ticket_type_id): len(consumed_ids)})
+	record_consumed_events({ticket_id: wallet_id for ticket_id in consumed_ids}, consumed_date)
+	return consumed_ids
+
+def record_consumed_events(consumed, consumed_date):
+	"""Records one ticket_consumed event per wallet for {ticket_id: wallet_id} and counts the tickets once committed."""
+	count_after_commit(TICKETS_CONSUMED, len(consumed))
+	ticket_ids_by_wallet = {}
+	for ticket_id, wallet_id in consumed.items():
+		ticket_ids_by_wallet.setdefault(wallet_id, []).append(ticket_id)
+	for wallet_id, ticket_ids in ticket_ids_by_wallet.items():
+		record_event('ticket_consumed', {
+			'ticket_ids': sorted(ticket_ids),
+			'consumed_date': consumed_date.isoformat() + 'Z'
+		}, wallet_id=wallet_id)
+
+def load_tickets_for_response(ticket_ids):
+	"""Loads tickets with the relationships to_dict(include_wallet=True) needs, in one query."""
+	return IssuedTicket.query.options(
+		db.joinedload(IssuedTicket.ticket_type),
+		db.joinedload(IssuedTicket.wallet)
+	).filter(IssuedTicket.id.in_(ticket_ids)).order_by(IssuedTicket.id).all()
+
 @app.route('/api/tickets/<int:ticket_id>/consume', methods=['POST'])
 def consume_ticket(ticket_id):
 	"""Marks a specific ticket as consumed."""
-	ticket = IssuedTicket.query.get(ticket_id)
-	if not ticket:
+	consumed_ids = consume_tickets_by_id([ticket_id], datetime.utcnow())
+	tickets = load_tickets_for_response([ticket_id])
+	if not tickets:
+		db.session.rollback()
 		return jsonify({"error": "Ticket not found"}), 404
 
-	if ticket.consumed_date is not None:
+	if ticket_id not in consumed_ids:
+		db.session.rollback()
 		return jsonify({"error": "Ticket already consumed"}), 409 # Conflict
 
-	ticket.consumed_date = datetime.utcnow()
+	# Serialise before commit; commit expires the instance and would reload it and its relationships
+	ticket_data = tickets[0].to_dict(include_wallet=True)
 	db.session.commit()
-	logging.info(f"Ticket ID {ticket_id} (Type: {ticket.ticket_type.name if ticket.ticket_type else 'N/A'}, Wallet: {ticket.wallet.name if ticket.wallet else 'N/A'}) consumed.")
-	return jsonify(ticket.to_dict(include_wallet=True)), 200 # Return the updated ticket
+	logging.info(f"Ticket ID {ticket_id} (Type: {ticket_data['ticket_type_name']}, Wallet: {ticket_data['wallet_name']}) consumed.")
+	return jsonify(ticket_data), 200 # Return the updated ticket
+
+# Action: Consume a batch of tickets
+@app.route('/api/tickets/consume', methods=['POST'])
+def consume_tickets_batch():
+	"""
+	Consumes several tickets in one round trip. Accepts either {"ticket_ids": [...]} or
+	{"wallet_id": ..., "ticket_type_id": ..., "count": ...} (the oldest available tickets of that type).
+	Returns the outcome for each ticket.
+	"""
+	data = request.get_json(silent=True)
+	if not isinstance(data, dict):
+		return jsonify({"error": "Invalid JSON data"}), 400
+
+	max_batch = app.config['CONSUME_BATCH_MAX']
+	errors = {}
+	now = datetime.utcnow()
+
+	if 'ticket_ids' in data:
+		ticket_ids = data['ticket_ids']
+		if (not isinstance(ticket_ids, list) or not ticket_ids or len(ticket_ids) > max_batch
+				or not all(isinstance(ticket_id, int) and not isinstance(ticket_id, bool) for ticket_id in ticket_ids)):
+			errors['ticket_ids'] = f"Invalid 'ticket_ids' (must be a list of 1 to {max_batch} integers)"
+			return jsonify({"errors": errors}), 400
+
+		consumed_ids = consume_tickets_by_id(ticket_ids, now)
+		# Only tickets that were not consumed now need telling apart (already consumed vs. missing)
+		unconsumed_ids = set(ticket_ids) - consumed_ids.keys()
+		existing_ids = set()
+		if unconsumed_ids:
+			existing_ids = {ticket_id for (ticket_id,) in db.session.query(IssuedTicket.id).filter(IssuedTicket.id.in_(unconsumed_ids))}
+		db.session.commit()
+
+		results = []
+		for ticket_id in dict.fromkeys(ticket_ids): # De-duplicate, keep request order
+			if ticket_id in consumed_ids:
+				status = 'consumed'
+			elif ticket_id in existing_ids:
+				status = 'already_consumed'
+			else:
+				status = 'not_found'
+			results.append({'ticket_id': ticket_id, 'status': status})
+		logging.info(f"Batch consume: {len(consumed_ids)} of {len(results)} ticket(s) consumed.")
+		return jsonify({
+			'consumed_count': len(consumed_ids),
+			'consumed_date': now.isoformat() + 'Z',
+			'results': results
+		}), 200
+
+	wallet_id = data.get('wallet_id')
+	ticket_type_id = data.get('ticket_type_id')
+	count = data.get('count', 1)
+	if not isinstance(wallet_id, int) or isinstance(wallet_id, bool):
+		errors['wallet_id'] = "Invalid 'wallet_id' (must be integer)"
+	if not isinstance(ticket_type_id, int) or isinstance(ticket_type_id, bool):
+		errors['ticket_type_id'] = "Invalid 'ticket_type_id' (must be integer)"
+	if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= max_batch:
+		errors['count'] = f"Invalid 'count' (must be integer between 1 and {max_batch})"
+	if errors:
+		errors['body'] = "Provide either 'ticket_ids' or 'wallet_id' + 'ticket_type_id' (+ optional 'count')"
+		return jsonify({"errors": errors}), 400
+
+	consumed_ids = consume_oldest_tickets(wallet_id, ticket_type_id, count, now)
+	db.session.commit()
+	logging.info(f"Batch consume: {len(consumed_ids)} of {count} requested ticket(s) consumed (Type ID: {ticket_type_id}, Wallet ID: {wallet_id}).")
+	return jsonify({
+		'requested_count': count,
+		'consumed_count': len(consumed_ids),
+		'consumed_date': now.isoformat() + 'Z',
+		'results': [{'ticket_id': ticket_id, 'status': 'consumed'} for ticket_id in consumed_ids]
+	}), 200
+
+# Action: Consume the oldest available ticket of a type
+@app.route('/api/wallets/<int:wallet_id>/ticket-types/<int:type_id>/consume', methods=['POST'])
+def consume_ticket_by_type(wallet_id, type_id):
+	"""Marks the oldest available ticket of a type in a wallet as consumed."""
+	consumed_ids = consume_oldest_tickets(wallet_id, type_id, 1, datetime.utcnow())
+	if not consumed_ids:
+		db.session.rollback()
+		if not Wallet.query.get(wallet_id):
+			return jsonify({"error": "Wallet not found"}), 404
+		return jsonify({"error": "No available tickets of this type in this wallet"}), 404
+
+	ticket_data = load_tickets_for_response(consumed_ids)[0].to_dict(include_wallet=True) # Serialise before commit expires the instance
+	db.session.commit()
+	logging.info(f"Ticket ID {ticket_data['id']} (Type ID: {type_id}, Wallet ID: {wallet_id}) consumed by type.")
+	return jsonify(ticket_data), 200
+
+# Bulk import & export
+def get_bulk_format(default):
+	"""Returns the ?format= of a bulk request, else one implied by the Content-Type, else `default`."""
+	if 'format' in request.args:
+		return request.args['format']
+	if request.mimetype == 'text/csv':
+		return 'csv'
+	if request.mimetype == 'application/x-ndjson':
+		return 'ndjson'
+	return default
+
+@app.route('/api/<any(wallets, "ticket-types"):kind>/import', methods=['POST'])
+def bulk_import(kind):
+	"""
+	Creates wallets or ticket types from an NDJSON or CSV request body (?format= or the Content-Type).
+	Returns the number created and the rejected rows with their line numbers; valid rows are imported
+	even when others are rejected.
+	"""
+	import_format = get_bulk_format('ndjson')
+	if import_format not in BULK_FORMATS:
+		return jsonify({"error": "Invalid 'format' (must be 'ndjson' or 'csv')"}), 400
+	importer, integer_fields = IMPORTERS[kind]
+	# Read the body as a stream so large files are never held in memory
+	lines = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+	result = importer(read_import_rows(lines, import_format, integer_fields))
+	logging.info(f"Bulk import of {kind}: {result.created_count} created, {result.error_count} rejected.")
+	return jsonify(result.to_dict()), 200
+
+@app.route('/api/export/<any(wallets, "ticket-types", tickets):kind>', methods=['GET'])
+def bulk_export(kind):
+	"""
+	Streams every wallet, ticket type, or ticket (live and archived) as NDJSON or CSV (?format=).
+	Tickets can be filtered with ?wallet_id= and ?since=YYYY-MM-DD (issued on or after).
+	"""
+	export_format = request.args.get('format', 'ndjson')
+	if export_format not in BULK_FORMATS:
+		return jsonify({"error": "Invalid 'format' (must be 'ndjson' or 'csv')"}), 400
+	filters = {}
+	if kind == 'tickets':
+		if 'wallet_id' in request.args:
+			try:
+				filters['wallet_id'] = int(request.args['wallet_id'])
+			except ValueError:
+				return jsonify({"error": "Invalid 'wallet_id' (must be integer)"}), 400
+		if 'since' in request.args:
+			try:
+				filters['since'] = datetime.strptime(request.args['since'], '%Y-%m-%d')
+			except ValueError:
+				return jsonify({"error": "Invalid 'since' (must be YYYY-MM-DD)"}), 400
+	rows = EXPORTERS[kind](**filters)
+	response = Response(
+		stream_with_context(format_export_rows(rows, export_format)),
+		mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson'
+	)
+	response.headers['Content-Disposition'] = f"attachment; filename={kind}.{export_format}"
+	return response
 
 # --- Initialization ---
+# Stored in each database file's header (PRAGMA user_version). Bump it whenever the models,
+# ADDED_COLUMNS or indexes change, so the next init-db runs create_all() and the migrations once.
+SCHEMA_VERSION = 5
+
+def read_schema_versions():
+	"""Returns the (main, archive) schema versions: one header read per file, no table reflection."""
+	with db.engine.connect() as conn:
+		return tuple(conn.exec_driver_sql(f"PRAGMA {schema}.user_version").scalar() for schema in ('main', 'archive'))
+
 def initialize_database():
-	"""Creates database tables if they don't exist."""
+	"""Creates tables and applies migrations, unless the stored schema version shows the database is current."""
 	with app.app_context():
 		logging.info(f"Ensuring database exists at: {DATABASE_PATH}")
 		data_dir = os.path.dirname(DATABASE_PATH)
 		if not os.path.exists(data_dir):
 			 logging.info(f"Creating data directory: {data_dir}")
-			 os.makedirs(data_dir)
-		db.create_all()
-		logging.info("Database tables checked/created.")
+			 os.makedirs(data_dir, exist_ok=True) # Another worker may create it concurrently
+		current = (SCHEMA_VERSION, SCHEMA_VERSION)
+		if read_schema_versions() == current:
+			logging.info(f"Database schema is current (version {SCHEMA_VERSION}).")
+			return
+		# Several gunicorn workers import the app at once; an advisory file lock keeps
+		# create_all()/migrations from racing each other
+		with open(f"{DATABASE_PATH}.init.lock", 'w') as lock_file:
+			if fcntl:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+			if read_schema_versions() != current: # Another process may have finished while we waited
+				db.create_all()
+				migrate_database()
+				with db.engine.begin() as conn:
+					for schema in ('main', 'archive'):
+						conn.exec_driver_sql(f"PRAGMA {schema}.user_version={SCHEMA_VERSION}")
+		logging.info(f"Database tables checked/created (schema version {SCHEMA_VERSION}).")
+
+# (table, column, DDL type) for columns added to tables that existing databases already have
+ADDED_COLUMNS = [
+	('ticket_type', 'next_due_at', 'DATETIME'),
+	('ticket_type', 'max_catch_up_periods', 'INTEGER'),
+	('ticket_type', 'schedule', 'VARCHAR(200)'),
+	('ticket_type', 'timezone', 'VARCHAR(64)'),
+	('ticket_type', 'anchor_at', 'DATETIME'),
+]
+
+def migrate_database():
+	"""Applies additive schema changes that create_all() cannot make to existing tables."""
+	inspector = db.inspect(db.engine)
+	for table_name, column_name, column_ddl in ADDED_COLUMNS:
+		existing_columns = {column['name'] for column in inspector.get_columns(table_name)}
+		if column_name not in existing_columns:
+			logging.info(f"Migrating: adding {table_name}.{column_name}")
+			with db.engine.begin() as conn:
+				conn.execute(db.text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}"))
+
+	# create_all() only creates indexes together with new tables, so add any declared ones that are missing
+	for table in db.metadata.sorted_tables:
+		for index in table.indexes:
+			index.create(bind=db.engine, checkfirst=True)
+
+	# Interval types distributed before anchor_at existed stay in phase with their last distribution
+	db.session.execute(db.update(TicketType).where(
+		TicketType.anchor_at.is_(None), TicketType.last_distributed.is_not(None), TicketType.schedule.is_(None)
+	).values(anchor_at=TicketType.last_distributed))
+	db.session.commit()
+	# Recompute every schedule: new columns, or recurrence rules changed with the schema version
+	logging.info(f"Migrating: computed next_due_at for {refresh_next_due_at()} ticket type(s)")
+
+	# Rollups of wallets and types deleted before deletes removed them; SQLite reuses the highest
+	# deleted ID, so a new wallet or type would otherwise inherit their history and balances
+	db.session.execute(db.delete(TicketHistoryDaily.__table__).where(db.or_(
+		TicketHistoryDaily.wallet_id.not_in(db.select(Wallet.id)),
+		TicketHistoryDaily.ticket_type_id.not_in(db.select(TicketType.id))
+	)))
+	db.session.commit()
+
+	# Databases from before wallet_balance existed have tickets but no balances yet
+	if not db.session.query(WalletBalance.wallet_id).first() and db.session.query(IssuedTicket.id).first():
+		logging.info(f"Migrating: built {rebuild_wallet_balances()} wallet balance row(s)")
 
 # --- Scheduler Setup ---
 def start_scheduler():
 	"""Adds the job and starts the scheduler."""
 	# Check if job already exists to prevent duplicates during hot reload
 	if not scheduler.get_job('distribute_tickets'):
-		 # Run every 60 seconds
+		 # Run periodically as a safety net; arm_distribution_job() pulls the next run forward
 		scheduler.add_job(
 			func=distribute_tickets_job,
 			trigger='interval',
-			seconds=60, # Adjust interval as needed
+			seconds=app.config['DISTRIBUTION_MAX_SLEEP_SECONDS'], # Upper bound; arm_distribution_job() fires earlier when something is due
 			id='distribute_tickets',
 			name='Distribute Tickets Regularly',
 			replace_existing=True
@@ -517,12 +2891,194 @@ def start_scheduler():
 	else:
 		logging.info("Ticket distribution job already scheduled.")
 
+	if not scheduler.get_job('watch_ticket_types'):
+		scheduler.add_job(
+			func=watch_ticket_type_changes,
+			trigger='interval',
+			seconds=app.config['DISTRIBUTION_WATCH_SECONDS'],
+			id='watch_ticket_types',
+			name='Re-arm Distribution On Ticket Type Changes',
+			replace_existing=True
+		)
+
+	if not scheduler.get_job('archive_tickets'):
+		scheduler.add_job(
+			func=archive_tickets_job,
+			trigger='interval',
+			seconds=app.config['ARCHIVE_INTERVAL_SECONDS'],
+			id='archive_tickets',
+			name='Archive Old Consumed Tickets',
+			replace_existing=True
+		)
+		logging.info("Ticket archival job added to scheduler.")
+
 	if not scheduler.running:
 		scheduler.start()
 		logging.info("Scheduler started.")
+		with app.app_context():
+			arm_distribution_job()
 	else:
 		logging.info("Scheduler already running.")
 
+def shutdown_scheduler():
+	"""Stops the scheduler and hands the distributor lease over immediately if this process held it."""
+	if scheduler.running:
+		scheduler.shutdown()
+	try:
+		with app.app_context():
+			release_lease()
+	except Exception as e:
+		logging.warning(f"Could not release distributor lease on shutdown: {e}")
+
+scheduler_start_lock = threading.Lock()
+
+def ensure_scheduler_started():
+	"""
+	Starts this process's scheduler once. Runs before the first request when START_SCHEDULER_ON_STARTUP
+	is set, so importing the app (CLI, tests, a preloading gunicorn master) never starts threads;
+	it can also be called from a gunicorn post_fork hook.
+	"""
+	if scheduler.running:
+		return
+	with scheduler_start_lock:
+		if scheduler.running:
+			return
+		logging.info("Starting ticket distribution scheduler...")
+		start_scheduler()
+		atexit.register(shutdown_scheduler)
+
+# --- Distributor CLI ---
+@app.cli.command('init-db')
+def init_db_command():
+	"""Creates tables and applies migrations."""
+	initialize_database()
+
+@app.cli.command('distribute')
+@click.option('--once', is_flag=True, help="Run a single distribution tick and exit.")
+@click.option('--dry-run', is_flag=True, help="Report what would be distributed without writing (implies --once).")
+def distribute_command(once, dry_run):
+	"""Runs the ticket distributor as a dedicated process, or a single tick with --once."""
+	if dry_run:
+		# A dry run must not write, so it won't migrate either; a stale schema would misreport
+		with app.app_context():
+			schema_versions = read_schema_versions()
+		if schema_versions != (SCHEMA_VERSION, SCHEMA_VERSION):
+			raise click.ClickException(
+				f"Database schema versions {schema_versions} are not {SCHEMA_VERSION}; run `flask init-db` before a dry run."
+			)
+	else:
+		initialize_database()
+	if once and not dry_run:
+		with app.app_context():
+			if not acquire_lease():
+				lease = db.session.get(SchedulerLease, DISTRIBUTOR_LEASE_NAME)
+				raise click.ClickException(
+					f"Distributor lease is held by {lease.holder} until {lease.expires_at.isoformat()}Z; nothing was distributed."
+				)
+	if once or dry_run:
+		issued_per_type = distribute_tickets_job(dry_run=dry_run)
+		if not dry_run:
+			with app.app_context():
+				release_lease() # Let the long-running distributor resume right away
+		verb = "Would issue" if dry_run else "Issued"
+		for ticket_type_id, count in issued_per_type.items():
+			click.echo(f"Ticket type {ticket_type_id}: {count}")
+		click.echo(f"{verb} {sum(issued_per_type.values())} ticket(s) across {len(issued_per_type)} ticket type(s).")
+		return
+
+	# Turn SIGTERM (docker stop) into a clean exit so the lease is released
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	if app.config['DISTRIBUTOR_METRICS_PORT']:
+		serve_metrics(app.config['DISTRIBUTOR_METRICS_PORT'])
+	start_scheduler()
+	logging.info("Distributor running; press Ctrl+C to stop.")
+	try:
+		while scheduler.running:
+			time.sleep(1)
+	except (KeyboardInterrupt, SystemExit):
+		pass
+	finally:
+		shutdown_scheduler()
+
+@app.cli.command('reschedule')
+def reschedule_command():
+	"""Recomputes next_due_at for every ticket type (e.g. after time zone rules changed)."""
+	with app.app_context():
+		refreshed_count = refresh_next_due_at()
+		arm_distribution_job()
+	click.echo(f"Rescheduled {refreshed_count} ticket type(s).")
+
+@app.cli.command('check-balances')
+@click.option('--repair', is_flag=True, help="Rebuild wallet_balance from the tickets if any balance drifted.")
+def check_balances_command(repair):
+	"""Fails if wallet_balance disagrees with the tickets; --repair rebuilds it."""
+	with app.app_context():
+		drift = find_balance_drift()
+		for wallet_id, ticket_type_id, stored, expected in drift[:50]:
+			click.echo(f"Wallet {wallet_id}, type {ticket_type_id}: stored {stored}, expected {expected}")
+		if not drift:
+			click.echo("All wallet balances match the tickets.")
+			return
+		if repair:
+			click.echo(f"{len(drift)} balance(s) drifted; rebuilt {rebuild_wallet_balances()} balance row(s).")
+			return
+	raise click.ClickException(f"{len(drift)} balance(s) drifted. Run with --repair to rebuild them.")
+
+@app.cli.command('archive')
+@click.option('--older-than-days', type=int, default=None, help="Retention age (default: ARCHIVE_AFTER_DAYS).")
+@click.option('--max-batches', type=int, default=None, help="Batches to run (default: ARCHIVE_MAX_BATCHES_PER_RUN).")
+def archive_command(older_than_days, max_batches):
+	"""Archives consumed tickets past the retention age and compacts the database incrementally."""
+	with app.app_context():
+		archived_count = archive_consumed_tickets(older_than_days=older_than_days, max_batches=max_batches)
+	click.echo(f"Archived {archived_count} ticket(s).")
+
+@app.cli.command('compact')
+@click.option('--full', is_flag=True, help="Run a full VACUUM (blocks writers; also enables incremental vacuum on older databases).")
+def compact_command(full):
+	"""Returns free pages of the main database file to the OS."""
+	with app.app_context():
+		if full:
+			with db.engine.connect() as conn:
+				# auto_vacuum only changes on an empty database or through a full VACUUM
+				conn.exec_driver_sql("PRAGMA main.auto_vacuum=INCREMENTAL")
+				conn.exec_driver_sql("VACUUM main")
+		else:
+			incremental_vacuum()
+		with db.engine.connect() as conn:
+			page_count = conn.exec_driver_sql("PRAGMA main.page_count").scalar()
+			free_pages = conn.exec_driver_sql("PRAGMA main.freelist_count").scalar()
+	click.echo(f"Main database: {page_count} page(s), {free_pages} free.")
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(list(IMPORTERS)))
+@click.argument('source', type=click.File('r', encoding='utf-8-sig', lazy=False))
+@click.option('--format', 'import_format', type=click.Choice(BULK_FORMATS), default=None, help="Default: csv for .csv files, else ndjson.")
+def import_command(kind, source, import_format):
+	"""Bulk-creates wallets or ticket types from an NDJSON or CSV file ('-' for stdin)."""
+	import_format = import_format or ('csv' if source.name.endswith('.csv') else 'ndjson')
+	importer, integer_fields = IMPORTERS[kind]
+	with app.app_context():
+		result = importer(read_import_rows(source, import_format, integer_fields))
+	for error in result.sorted_errors():
+		click.echo(f"Line {error['line']}: {error.get('error') or json.dumps(error.get('errors'))}", err=True)
+	click.echo(f"Created {result.created_count} {kind}, rejected {result.error_count} row(s).")
+	if result.error_count:
+		raise click.ClickException(f"{result.error_count} row(s) rejected.")
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(list(EXPORTERS)))
+@click.option('--format', 'export_format', type=click.Choice(BULK_FORMATS), default='ndjson')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help="Default: stdout.")
+@click.option('--wallet-id', type=int, default=None, help="Tickets only: one wallet's history.")
+@click.option('--since', type=click.DateTime(['%Y-%m-%d']), default=None, help="Tickets only: issued on or after this date.")
+def export_command(kind, export_format, output, wallet_id, since):
+	"""Streams every wallet, ticket type or ticket (live and archived) as NDJSON or CSV."""
+	filters = {'wallet_id': wallet_id, 'since': since} if kind == 'tickets' else {}
+	with app.app_context():
+		for chunk in format_export_rows(EXPORTERS[kind](**filters), export_format):
+			output.write(chunk)
+
 # --- Removed problematic SQLAlchemy event listener ---
 # @event.listens_for(db.engine, "connect")
 # def setup_scheduler_shutdown(dbapi_connection, connection_record):
@@ -554,10 +3110,8 @@ def start_scheduler():
 # 	app.run(host='0.0.0.0', port=8000, debug=True, use_reloader=False)
 
 # --- Initialization ---
-logging.info("Initializing database...")
-initialize_database()
-logging.info("Starting ticket distribution scheduler...")
-start_scheduler()
-logging.info("Registering scheduler shutdown hook...")
-atexit.register(lambda: scheduler.shutdown())
-logging.info("Scheduler shutdown hook registered.")
\ No newline at end of file
+if app.config['INIT_DB_ON_STARTUP']:
+	logging.info("Initializing database...")
+	initialize_database()
+if app.config['START_SCHEDULER_ON_STARTUP']:
+	app.before_request(ensure_scheduler_started)
\ No newline at end of file
@@ -0,0 +1,273 @@
+"""
+ASGI entry point: serves the same Flask app (routes, models, validation) from an event loop.
+
+	uvicorn asgi:application --host 127.0.0.1 --port 8000
+
+Requests run on a bounded thread pool (ASGI_MAX_THREADS), so SQLite I/O never blocks the loop and
+at most that many requests use database connections at once; the rest wait on the loop. Streamed
+bodies (?format=ndjson) are handed to the loop through a small bounded queue. Request bodies are
+read from the loop on demand as the app consumes them, so a large upload (bulk import) is never held
+in memory; the request's pool thread waits for the client while it uploads, as a gunicorn thread would.
+
+/api/events is served natively: between polls a stream only waits on the loop, and each poll
+borrows a pool thread briefly, so open streams cost no threads.
+"""
+import io
+import os
+import sys
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import ClientDisconnected
+from app import (
+	app, db, fetch_events, format_sse, parse_event_stream_request, scheduler, shutdown_scheduler
+)
+
+app.config['ASGI_MAX_THREADS'] = int(os.environ.get(
+	'ASGI_MAX_THREADS',
+	# One thread per pooled connection the engine allows
+	app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] + app.config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow']
+))
+
+executor = None # Created at lifespan startup (or first request), after any fork
+
+def get_executor():
+	global executor
+	if executor is None:
+		executor = ThreadPoolExecutor(max_workers=app.config['ASGI_MAX_THREADS'], thread_name_prefix='asgi')
+	return executor
+
+async def run_in_pool(func, *args):
+	return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+
+class RequestBody(io.RawIOBase):
+	"""
+	Blocking file object over a request body that arrives as ASGI http.request messages. It is read on
+	a pool thread and pulls the next message from the loop only when the app wants more bytes.
+	"""
+
+	def __init__(self, receive, loop):
+		self._receive = receive
+		self._loop = loop
+		self._pending = memoryview(b'')
+		self._more_body = True
+
+	def readable(self):
+		return True
+
+	def readinto(self, buffer):
+		while not self._pending and self._more_body:
+			message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+			if message['type'] == 'http.disconnect':
+				raise ClientDisconnected()
+			self._pending = memoryview(message.get('body', b''))
+			self._more_body = message.get('more_body', False)
+		size = min(len(buffer), len(self._pending))
+		buffer[:size] = self._pending[:size]
+		self._pending = self._pending[size:]
+		return size
+
+def build_environ(scope, body_stream):
+	"""Translates an ASGI HTTP scope and a file object for its request body into a WSGI environ."""
+	server = scope.get('server') or ('localhost', 80)
+	client = scope.get('client') or ('', 0)
+	environ = {
+		'REQUEST_METHOD': scope['method'],
+		'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+		'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+		'QUERY_STRING': scope['query_string'].decode('latin-1'),
+		'SERVER_NAME': server[0],
+		'SERVER_PORT': str(server[1]),
+		'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+		'REMOTE_ADDR': client[0],
+		'wsgi.version': (1, 0),
+		'wsgi.url_scheme': scope.get('scheme', 'http'),
+		'wsgi.input': body_stream,
+		'wsgi.input_terminated': True, # The stream ends with the body, so chunked uploads (no Content-Length) work
+		'wsgi.errors': sys.stderr,
+		'wsgi.multithread': True,
+		'wsgi.multiprocess': True,
+		'wsgi.run_once': False,
+	}
+	for name, value in scope['headers']:
+		name = name.decode('latin-1').upper().replace('-', '_')
+		value = value.decode('latin-1')
+		if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+			key = name
+		else:
+			key = f"HTTP_{name}"
+		environ[key] = f"{environ[key]},{value}" if key in environ else value
+	return environ
+
+async def read_body(receive):
+	body = bytearray()
+	while True:
+		message = await receive()
+		if message['type'] == 'http.disconnect':
+			return None
+		body.extend(message.get('body', b''))
+		if not message.get('more_body'):
+			return bytes(body)
+
+def encode_headers(headers):
+	return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+async def send_response(send, status, headers, body):
+	await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(headers)})
+	await send({'type': 'http.response.body', 'body': body})
+
+def run_wsgi(environ, loop, queue, cancelled):
+	"""
+	Runs the Flask app for one request on a pool thread and hands ('start', status, headers), then each
+	body chunk, then None to the loop through `queue`. The body is iterated on this one thread because
+	streamed responses keep their request context on it.
+	"""
+	def put(item):
+		asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+	def write(data):
+		raise RuntimeError("The WSGI write() callable is not supported; return the body instead")
+
+	response_start = {}
+
+	def start_response(status, headers, exc_info=None):
+		response_start['status'] = int(status.split(' ', 1)[0])
+		response_start['headers'] = headers
+		return write
+
+	try:
+		iterable = app(environ, start_response)
+		try:
+			put(('start', response_start['status'], response_start['headers']))
+			for chunk in iterable:
+				if cancelled.is_set():
+					break
+				if chunk:
+					put(chunk)
+		finally:
+			if hasattr(iterable, 'close'):
+				iterable.close() # Runs Flask's teardown (session cleanup) for streamed responses
+	except Exception as e:
+		put(e)
+		return
+	put(None)
+
+async def serve_wsgi(scope, receive, send):
+	loop = asyncio.get_running_loop()
+	queue = asyncio.Queue(maxsize=8) # Bounds how far a streamed body runs ahead of the client
+	cancelled = threading.Event()
+	body_stream = io.BufferedReader(RequestBody(receive, loop))
+	worker = loop.run_in_executor(get_executor(), run_wsgi, build_environ(scope, body_stream), loop, queue, cancelled)
+	finished = False
+	try:
+		item = await queue.get()
+		if isinstance(item, Exception):
+			raise item
+		_, status, headers = item
+		await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(headers)})
+		while True:
+			item = await queue.get()
+			if isinstance(item, Exception):
+				raise item
+			if item is None:
+				break
+			await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+		finished = True
+		await send({'type': 'http.response.body', 'body': b''})
+	finally:
+		if not finished:
+			# Client went away (or the app failed): stop the worker and unblock its pending put()
+			cancelled.set()
+			while not worker.done():
+				try:
+					await asyncio.wait_for(queue.get(), timeout=0.1)
+				except asyncio.TimeoutError:
+					pass
+
+def open_event_stream(environ):
+	"""Validates an /api/events request. Returns (wallet_id, last_event_id, None) or (None, None, (status, headers, body))."""
+	with app.request_context(environ):
+		wallet_id, last_event_id, error = parse_event_stream_request()
+		if error:
+			response = app.make_response(error)
+			return None, None, (response.status_code, list(response.headers.items()), response.get_data())
+	return wallet_id, last_event_id, None
+
+def poll_events(after_id, wallet_id):
+	"""Returns [(event_id, SSE message)] for events newer than `after_id`."""
+	with app.app_context():
+		messages = [(event_row.id, format_sse(event_row)) for event_row in fetch_events(after_id, wallet_id)]
+		db.session.rollback()
+	return messages
+
+async def serve_event_stream(scope, receive, send):
+	"""Native counterpart of stream_events(): same validation, message format, heartbeat and stream lifetime."""
+	body = await read_body(receive)
+	if body is None:
+		return
+	wallet_id, after_id, error = await run_in_pool(open_event_stream, build_environ(scope, io.BytesIO(body)))
+	if error:
+		await send_response(send, *error)
+		return
+
+	disconnected = asyncio.Event()
+
+	async def watch_disconnect():
+		while (await receive())['type'] != 'http.disconnect':
+			pass
+		disconnected.set()
+
+	watcher = asyncio.ensure_future(watch_disconnect())
+	loop = asyncio.get_running_loop()
+	try:
+		await send({'type': 'http.response.start', 'status': 200, 'headers': encode_headers([
+			('Content-Type', 'text/event-stream; charset=utf-8'),
+			('Cache-Control', 'no-cache'),
+			('X-Accel-Buffering', 'no'), # Tell nginx not to buffer the stream
+		])})
+		await send({'type': 'http.response.body', 'body': b"retry: 3000\n\n", 'more_body': True})
+		deadline = loop.time() + app.config['SSE_MAX_STREAM_SECONDS']
+		last_write = loop.time()
+		while loop.time() < deadline and not disconnected.is_set():
+			messages = await run_in_pool(poll_events, after_id, wallet_id)
+			for after_id, message in messages:
+				await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+			if messages:
+				last_write = loop.time()
+				continue # There may be more; poll again right away
+			if loop.time() - last_write >= app.config['SSE_HEARTBEAT_SECONDS']:
+				await send({'type': 'http.response.body', 'body': b": keep-alive\n\n", 'more_body': True})
+				last_write = loop.time()
+			try:
+				await asyncio.wait_for(disconnected.wait(), timeout=app.config['SSE_POLL_SECONDS'])
+			except asyncio.TimeoutError:
+				pass
+		if not disconnected.is_set():
+			await send({'type': 'http.response.body', 'body': b''})
+	finally:
+		watcher.cancel()
+
+async def serve_lifespan(receive, send):
+	while True:
+		message = await receive()
+		if message['type'] == 'lifespan.startup':
+			get_executor()
+			await send({'type': 'lifespan.startup.complete'})
+		elif message['type'] == 'lifespan.shutdown':
+			if scheduler.running:
+				shutdown_scheduler()
+			get_executor().shutdown(wait=True)
+			await send({'type': 'lifespan.shutdown.complete'})
+			return
+
+async def application(scope, receive, send):
+	if scope['type'] == 'lifespan':
+		await serve_lifespan(receive, send)
+	elif scope['type'] == 'http':
+		if scope['path'] == '/api/events' and scope['method'] == 'GET':
+			await serve_event_stream(scope, receive, send)
+		else:
+			await serve_wsgi(scope, receive, send)
+	else:
+		logging.warning(f"Unsupported ASGI scope type: {scope['type']}")
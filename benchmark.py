@@ -0,0 +1,426 @@
+"""
+Benchmark harness for the API and the ticket distributor at realistic data sizes.
+
+Builds a synthetic dataset in a scratch directory (never the real database), then measures:
+- distribute_tickets_job tick time and its Python memory peak (tracemalloc)
+- GET /api/wallets/<id>/tickets latency (p50/p90/p99)
+- consume throughput with concurrent clients (Flask test client, one per thread), by type and by ticket ID
+- database file growth across the run
+- import-to-ready time of a fresh process against the seeded database, guarded by --startup-budget-ms
+
+Results are written as JSON; pass --baseline to compare against an earlier result.
+
+	python benchmark.py --output results.json
+	python benchmark.py --wallets 1000 --ticket-types 50 --tickets 100000 --baseline results.json
+	python benchmark.py --startup-only
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import threading
+import subprocess
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Higher is better for these results; every other number is lower-is-better (times, sizes, memory)
+HIGHER_IS_BETTER = {'consume_ops_per_second', 'consume_by_id_ops_per_second'}
+# Workload descriptions, not performance; shown in comparisons but never flagged as regressions
+DESCRIPTIVE = {'distribution_tickets_issued', 'distribution_ticket_types_processed', 'wallet_tickets_mean_rows', 'startup_threads_after_import'}
+
+# Runs in a fresh interpreter: import the app (schema version check included), then serve one request
+STARTUP_PROBE = """
+import json, threading, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+threads_after_import = threading.active_count()
+status = app.app.test_client().get('/api/wallets').status_code
+ready = time.perf_counter()
+print(json.dumps({
+	'import_ms': (imported - started) * 1000,
+	'ready_ms': (ready - started) * 1000,
+	'threads_after_import': threads_after_import,
+	'status': status,
+}))
+"""
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Benchmarks the Impulse Tickets API and distributor on synthetic data.")
+	parser.add_argument('--wallets', type=int, default=10000)
+	parser.add_argument('--ticket-types', type=int, default=500)
+	parser.add_argument('--tickets', type=int, default=2000000, help="Historical IssuedTicket rows to seed.")
+	parser.add_argument('--consumed-fraction', type=float, default=0.3, help="Share of seeded tickets already consumed.")
+	parser.add_argument('--due-fraction', type=float, default=0.05, help="Share of ticket types due at the benchmark tick.")
+	parser.add_argument('--targeted-fraction', type=float, default=0.5, help="Share of ticket types aimed at a single wallet.")
+	parser.add_argument('--history-days', type=int, default=180, help="Seeded tickets are spread over this many days.")
+	parser.add_argument('--latency-requests', type=int, default=500)
+	parser.add_argument('--page-limit', type=int, default=0, help="?limit for the wallet tickets requests (0 = full list, like the UI).")
+	parser.add_argument('--consume-clients', type=int, default=8)
+	parser.add_argument('--consume-ops', type=int, default=2000, help="Total consume requests across all clients.")
+	parser.add_argument('--startup-runs', type=int, default=5, help="Fresh processes started to time import-to-ready.")
+	parser.add_argument('--startup-budget-ms', type=float, default=1500, help="Fail if the median import-to-ready time exceeds this.")
+	parser.add_argument('--startup-only', action='store_true', help="Only run the startup benchmark (against an empty database).")
+	parser.add_argument('--seed', type=int, default=42)
+	parser.add_argument('--workdir', help="Scratch directory for the database (default: a temporary directory, removed afterwards).")
+	parser.add_argument('--output', help="Write results JSON here.")
+	parser.add_argument('--baseline', help="Results JSON to compare against.")
+	parser.add_argument('--max-regression', type=float, default=None, help="Exit non-zero if any result is this many percent worse than the baseline.")
+	return parser.parse_args()
+
+def load_app(workdir):
+	"""Imports app.py against a scratch database; configuration is read from the environment at import."""
+	os.environ['DATABASE_PATH'] = os.path.join(workdir, 'tickets.db')
+	os.environ['ARCHIVE_DATABASE_PATH'] = os.path.join(workdir, 'tickets-archive.db')
+	os.environ['INIT_DB_ON_STARTUP'] = '0'
+	os.environ['START_SCHEDULER_ON_STARTUP'] = '0'
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	import app as app_module
+	app_module.logging.getLogger().setLevel(app_module.logging.WARNING) # Per-type INFO lines would dominate the tick time
+	app_module.initialize_database()
+	return app_module
+
+def database_size(app_module):
+	"""Bytes used by the main database file plus its WAL."""
+	return sum(
+		os.path.getsize(path) for path in (app_module.DATABASE_PATH, app_module.DATABASE_PATH + '-wal')
+		if os.path.exists(path)
+	)
+
+def percentile(values, fraction):
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def seed_dataset(app_module, args, rng, now):
+	"""Inserts wallets, ticket types with mixed frequencies and the historical tickets. Returns the ticket type rows."""
+	db = app_module.db
+	units = list(app_module.FrequencyUnit)
+	unit_values = {
+		app_module.FrequencyUnit.MINUTES: (5, 15, 30),
+		app_module.FrequencyUnit.HOURS: (1, 6, 12),
+		app_module.FrequencyUnit.DAYS: (1, 3, 7),
+		app_module.FrequencyUnit.WEEKS: (1, 2),
+		app_module.FrequencyUnit.MONTHS: (1,),
+	}
+	chunk_size = 50000
+
+	db.session.execute(app_module.Wallet.__table__.insert(), [{'name': f"wallet-{index}"} for index in range(args.wallets)])
+	wallet_ids = [wallet_id for (wallet_id,) in db.session.query(app_module.Wallet.id).order_by(app_module.Wallet.id)]
+
+	ticket_types = []
+	due_count = int(args.ticket_types * args.due_fraction)
+	for index in range(args.ticket_types):
+		ticket_type = app_module.TicketType(
+			name=f"type-{index}",
+			distribute_quantity=rng.randint(1, 3),
+			frequency_value=rng.choice(unit_values[units[index % len(units)]]),
+			frequency_unit=units[index % len(units)],
+			target_wallet_id=rng.choice(wallet_ids) if rng.random() < args.targeted_fraction else None,
+		)
+		# The first due_count types are exactly one period overdue; the rest were distributed just now
+		ticket_type.anchor_at = now
+		if index < due_count:
+			ticket_type.anchor_at = ticket_type.get_interval_occurrence(-1) - timedelta(seconds=1)
+		ticket_type.last_distributed = ticket_type.anchor_at
+		ticket_type.update_next_due_at()
+		ticket_types.append(ticket_type)
+	db.session.add_all(ticket_types)
+	db.session.commit()
+	ticket_type_ids = [ticket_type.id for ticket_type in ticket_types]
+
+	insert_stmt = app_module.IssuedTicket.__table__.insert()
+	history_seconds = args.history_days * 86400
+	for chunk_start in range(0, args.tickets, chunk_size):
+		rows = []
+		for _ in range(min(chunk_size, args.tickets - chunk_start)):
+			issued_date = now - timedelta(seconds=rng.randrange(history_seconds))
+			consumed = rng.random() < args.consumed_fraction
+			rows.append({
+				'ticket_type_id': rng.choice(ticket_type_ids),
+				'wallet_id': rng.choice(wallet_ids),
+				'issued_date': issued_date,
+				'consumed_date': issued_date + timedelta(seconds=rng.randrange(3600)) if consumed else None,
+			})
+		db.session.execute(insert_stmt, rows)
+		db.session.commit()
+	app_module.rebuild_wallet_balances() # Seeded tickets bypass the balance upkeep
+	return wallet_ids, ticket_type_ids
+
+def snapshot_schedule(app_module):
+	"""Returns what a distribution tick changes, so the tick can be undone and repeated."""
+	db = app_module.db
+	max_ticket_id = db.session.query(db.func.max(app_module.IssuedTicket.id)).scalar() or 0
+	max_run_id = db.session.query(db.func.max(app_module.DistributionRun.id)).scalar() or 0
+	schedule = db.session.query(
+		app_module.TicketType.id, app_module.TicketType.last_distributed, app_module.TicketType.next_due_at,
+		app_module.TicketType.anchor_at
+	).all()
+	return max_ticket_id, max_run_id, schedule
+
+def restore_schedule(app_module, snapshot):
+	"""Undoes a tick: its tickets, its distribution_run ledger rows (or the replay would skip every period), the schedule and the balances."""
+	db = app_module.db
+	max_ticket_id, max_run_id, schedule = snapshot
+	db.session.execute(db.delete(app_module.IssuedTicket.__table__).where(app_module.IssuedTicket.__table__.c.id > max_ticket_id))
+	db.session.execute(db.delete(app_module.DistributionRun.__table__).where(app_module.DistributionRun.__table__.c.id > max_run_id))
+	db.session.execute(app_module.TicketType.__table__.update().where(
+		app_module.TicketType.__table__.c.id == db.bindparam('type_id')
+	), [
+		{'type_id': type_id, 'last_distributed': last_distributed, 'next_due_at': next_due_at, 'anchor_at': anchor_at}
+		for type_id, last_distributed, next_due_at, anchor_at in schedule
+	])
+	db.session.commit()
+	app_module.rebuild_wallet_balances() # Commits; balances count the tickets that remain
+
+def benchmark_distribution(app_module):
+	"""Times one tick, then undoes it and repeats it under tracemalloc for the memory peak."""
+	results = {}
+	with app_module.app.app_context():
+		snapshot = snapshot_schedule(app_module)
+	size_before = database_size(app_module)
+
+	started = time.perf_counter()
+	issued_per_type = app_module.distribute_tickets_job()
+	results['distribution_tick_seconds'] = time.perf_counter() - started
+	results['distribution_tickets_issued'] = sum(issued_per_type.values())
+	results['distribution_ticket_types_processed'] = len(issued_per_type)
+	results['db_growth_distribution_bytes'] = database_size(app_module) - size_before
+
+	with app_module.app.app_context():
+		restore_schedule(app_module, snapshot)
+	tracemalloc.start()
+	replayed_per_type = app_module.distribute_tickets_job()
+	results['distribution_memory_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	if replayed_per_type != issued_per_type:
+		# Otherwise the memory peak belongs to a different (usually idle) tick and baselines mean nothing
+		raise RuntimeError(
+			f"Replayed tick issued {sum(replayed_per_type.values())} tickets, the first one {sum(issued_per_type.values())}; "
+			"restore_schedule() no longer undoes everything a tick changes."
+		)
+	return results
+
+def benchmark_wallet_tickets(app_module, args, rng, wallet_ids):
+	client = app_module.app.test_client()
+	query = f"?limit={args.page_limit}" if args.page_limit else ''
+	latencies = []
+	rows = 0
+	for _ in range(args.latency_requests):
+		started = time.perf_counter()
+		response = client.get(f"/api/wallets/{rng.choice(wallet_ids)}/tickets{query}")
+		response.get_data()
+		latencies.append(time.perf_counter() - started)
+		rows += len(response.get_json())
+	return {
+		'wallet_tickets_p50_ms': percentile(latencies, 0.50) * 1000,
+		'wallet_tickets_p90_ms': percentile(latencies, 0.90) * 1000,
+		'wallet_tickets_p99_ms': percentile(latencies, 0.99) * 1000,
+		'wallet_tickets_mean_ms': statistics.fmean(latencies) * 1000,
+		'wallet_tickets_mean_rows': rows / len(latencies),
+	}
+
+def run_consume_clients(app_module, args, paths):
+	"""POSTs to each path once, split into contiguous slices across args.consume_clients concurrent clients. Returns (seconds, status counts)."""
+	ops_per_client = len(paths) // args.consume_clients
+	status_counts = {}
+	lock = threading.Lock()
+
+	def run_client(client_index):
+		client = app_module.app.test_client()
+		local_counts = {}
+		for path in paths[client_index * ops_per_client:(client_index + 1) * ops_per_client]:
+			response = client.post(path)
+			local_counts[response.status_code] = local_counts.get(response.status_code, 0) + 1
+		with lock:
+			for status, count in local_counts.items():
+				status_counts[str(status)] = status_counts.get(str(status), 0) + count
+
+	threads = [threading.Thread(target=run_client, args=(index,)) for index in range(args.consume_clients)]
+	started = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return time.perf_counter() - started, status_counts
+
+def benchmark_consume(app_module, args, rng):
+	"""Runs consume-by-type requests from concurrent clients against wallets/types that have available tickets."""
+	db = app_module.db
+	with app_module.app.app_context():
+		issued_ticket = app_module.IssuedTicket.__table__
+		pairs = db.session.execute(
+			db.select(issued_ticket.c.wallet_id, issued_ticket.c.ticket_type_id).where(
+				issued_ticket.c.consumed_date.is_(None)
+			).distinct().limit(args.consume_ops)
+		).all()
+	rng.shuffle(pairs)
+	total_ops = args.consume_ops // args.consume_clients * args.consume_clients
+	paths = [f"/api/wallets/{wallet_id}/ticket-types/{ticket_type_id}/consume" for wallet_id, ticket_type_id in (
+		pairs[op % len(pairs)] for op in range(total_ops)
+	)]
+
+	size_before = database_size(app_module)
+	elapsed, status_counts = run_consume_clients(app_module, args, paths)
+	return {
+		'consume_ops_per_second': total_ops / elapsed,
+		'consume_seconds': elapsed,
+		'consume_status_counts': status_counts,
+		'db_growth_consume_bytes': database_size(app_module) - size_before,
+	}
+
+def benchmark_consume_by_id(app_module, args, rng):
+	"""Runs POST /api/tickets/<id>/consume from concurrent clients, each on a different pre-selected available ticket."""
+	db = app_module.db
+	with app_module.app.app_context():
+		issued_ticket = app_module.IssuedTicket.__table__
+		# Random picks, so clients don't all touch the same few pages of issued_ticket
+		ticket_ids = [ticket_id for (ticket_id,) in db.session.execute(
+			db.select(issued_ticket.c.id).where(
+				issued_ticket.c.consumed_date.is_(None)
+			).order_by(db.func.random()).limit(args.consume_ops)
+		)]
+	rng.shuffle(ticket_ids)
+	total_ops = len(ticket_ids) // args.consume_clients * args.consume_clients
+	paths = [f"/api/tickets/{ticket_id}/consume" for ticket_id in ticket_ids[:total_ops]]
+
+	elapsed, status_counts = run_consume_clients(app_module, args, paths)
+	return {
+		'consume_by_id_ops_per_second': total_ops / elapsed,
+		'consume_by_id_seconds': elapsed,
+		'consume_by_id_status_counts': status_counts,
+	}
+
+def benchmark_startup(args):
+	"""Times import-to-ready in fresh processes; imports must not start threads (the scheduler starts lazily)."""
+	env = dict(os.environ, INIT_DB_ON_STARTUP='1', START_SCHEDULER_ON_STARTUP='0')
+	runs = []
+	for _ in range(args.startup_runs):
+		completed = subprocess.run(
+			[sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, check=True, env=env,
+			cwd=os.path.dirname(os.path.abspath(__file__))
+		)
+		run = json.loads(completed.stdout.strip().splitlines()[-1])
+		if run['status'] != 200:
+			raise RuntimeError(f"Startup probe got HTTP {run['status']}:\n{completed.stderr}")
+		runs.append(run)
+	return {
+		'startup_import_ms': statistics.median(run['import_ms'] for run in runs),
+		'startup_ready_ms': statistics.median(run['ready_ms'] for run in runs),
+		'startup_ready_max_ms': max(run['ready_ms'] for run in runs),
+		'startup_threads_after_import': max(run['threads_after_import'] for run in runs),
+	}
+
+def check_startup_budget(results, budget_ms):
+	"""Returns a list of startup guard failures."""
+	failures = []
+	if results['startup_ready_ms'] > budget_ms:
+		failures.append(f"median import-to-ready {results['startup_ready_ms']:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+	if results['startup_threads_after_import'] > 1:
+		failures.append(f"importing the app started {results['startup_threads_after_import'] - 1} background thread(s)")
+	return failures
+
+def git_revision():
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+			cwd=os.path.dirname(os.path.abspath(__file__))
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def compare_to_baseline(results, baseline_results, max_regression):
+	"""Prints each numeric result next to the baseline. Returns the names of results that regressed past max_regression."""
+	regressions = []
+	print(f"{'result':40} {'baseline':>14} {'current':>14} {'change':>9}")
+	for name, value in results.items():
+		baseline = baseline_results.get(name)
+		if not isinstance(value, (int, float)) or not isinstance(baseline, (int, float)):
+			continue
+		change = (value - baseline) / baseline * 100 if baseline else 0.0
+		worse = -change if name in HIGHER_IS_BETTER else change
+		flag = ''
+		if max_regression is not None and name not in DESCRIPTIVE and worse > max_regression:
+			regressions.append(name)
+			flag = ' REGRESSION'
+		print(f"{name:40} {baseline:14.3f} {value:14.3f} {change:+8.1f}%{flag}")
+	return regressions
+
+def main():
+	args = parse_args()
+	rng = random.Random(args.seed)
+	workdir = args.workdir or tempfile.mkdtemp(prefix='impulse-bench-')
+	os.makedirs(workdir, exist_ok=True)
+	try:
+		app_module = load_app(workdir)
+		# A fixed, recent 'now' keeps the schedule (and so the tick's work) identical between runs
+		now = datetime.utcnow().replace(microsecond=0)
+
+		results = {}
+		if not args.startup_only:
+			print(f"Seeding {args.wallets} wallets, {args.ticket_types} ticket types, {args.tickets} tickets in {workdir}...")
+			started = time.perf_counter()
+			with app_module.app.app_context():
+				wallet_ids, _ = seed_dataset(app_module, args, rng, now)
+			results['seed_seconds'] = time.perf_counter() - started
+			results['db_size_seeded_bytes'] = database_size(app_module)
+
+			print("Distribution tick...")
+			results.update(benchmark_distribution(app_module))
+			print("Wallet tickets latency...")
+			results.update(benchmark_wallet_tickets(app_module, args, rng, wallet_ids))
+			print("Concurrent consume...")
+			results.update(benchmark_consume(app_module, args, rng))
+			print("Concurrent consume by ticket ID...")
+			results.update(benchmark_consume_by_id(app_module, args, rng))
+			results['db_size_final_bytes'] = database_size(app_module)
+			results['process_max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # KiB on Linux
+
+		print("Startup...")
+		results.update(benchmark_startup(args))
+
+		report = {
+			'meta': {
+				'created_at': datetime.utcnow().isoformat() + 'Z',
+				'git_revision': git_revision(),
+				'python': platform.python_version(),
+				'sqlite': sqlite3.sqlite_version,
+				'platform': platform.platform(),
+				'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'baseline', 'max_regression', 'startup_budget_ms', 'workdir')},
+			},
+			'results': results,
+		}
+		print(json.dumps(report, indent=2))
+		if args.output:
+			with open(args.output, 'w') as f:
+				json.dump(report, f, indent=2)
+
+		exit_code = 0
+		startup_failures = check_startup_budget(results, args.startup_budget_ms)
+		for failure in startup_failures:
+			print(f"Startup guard: {failure}")
+			exit_code = 1
+
+		if args.baseline:
+			with open(args.baseline) as f:
+				baseline = json.load(f)
+			if baseline['meta'].get('parameters') != report['meta']['parameters']:
+				print("Warning: baseline was run with different parameters; the comparison is not like for like.")
+			regressions = compare_to_baseline(results, baseline['results'], args.max_regression)
+			if regressions:
+				print(f"Regressed beyond {args.max_regression}%: {', '.join(regressions)}")
+				exit_code = 1
+		return exit_code
+	finally:
+		if not args.workdir:
+			shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+	sys.exit(main())
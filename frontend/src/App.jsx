@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import WalletList from './components/WalletList';
 import WalletView from './components/WalletView';
 import TicketTypeManager from './components/TicketTypeManager'; // Placeholder
@@ -185,6 +185,33 @@ function App() {
     fetchWallets();
   }, []);
 
+  // --- Live Updates (Server-Sent Events) ---
+  // One stream per tab, shared by every view: under gunicorn each open stream holds a server thread.
+  // It carries every wallet's events, so the selected wallet is read from a ref instead of reconnecting.
+  const selectedWalletIdRef = useRef(null);
+  selectedWalletIdRef.current = selectedWallet ? selectedWallet.id : null;
+  const [ticketTypesVersion, setTicketTypesVersion] = useState(0); // Bumped when TicketTypeManager should refetch
+  useEffect(() => {
+    const events = new EventSource(`${API_BASE_URL}/events`);
+    // wallet_id null means the event concerns every wallet
+    const isForSelectedWallet = (data) =>
+      selectedWalletIdRef.current !== null && (data.wallet_id === null || data.wallet_id === selectedWalletIdRef.current);
+    // New tickets: reload the list. Consumed tickets: drop them locally, no request needed.
+    events.addEventListener('tickets_issued', (event) => {
+      setTicketTypesVersion(version => version + 1); // Last/next distribution times changed
+      if (isForSelectedWallet(JSON.parse(event.data))) {
+        fetchTickets(selectedWalletIdRef.current);
+      }
+    });
+    events.addEventListener('ticket_consumed', (event) => {
+      const data = JSON.parse(event.data);
+      if (!isForSelectedWallet(data)) return;
+      setTickets(currentTickets => currentTickets.filter(t => !data.ticket_ids.includes(t.id)));
+    });
+    events.addEventListener('ticket_type_changed', () => setTicketTypesVersion(version => version + 1));
+    return () => events.close();
+  }, []);
+
   // --- Navigation Handlers ---
   const handleSelectWallet = (wallet) => {
     setSelectedWallet(wallet);
@@ -269,6 +296,7 @@ function App() {
             apiBaseUrl={API_BASE_URL}
             wallets={wallets} // Pass wallets for the dropdown
             onTicketTypesUpdated={fetchWallets} // Optional: Refresh wallets if needed after TT changes
+            ticketTypesVersion={ticketTypesVersion} // Changes when the event stream reports a distribution or type change
           />
         )}
       </main>
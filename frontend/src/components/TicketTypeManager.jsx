@@ -4,7 +4,7 @@ import styles from './TicketTypeManager.module.css';
 // Placeholder frequencies - match your API's FrequencyUnit enum
 const frequencyUnits = ['minutes', 'hours', 'days', 'weeks', 'months'];
 
-function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated }) {
+function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated, ticketTypesVersion }) {
     const [ticketTypes, setTicketTypes] = useState([]);
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState(null);
@@ -29,11 +29,10 @@ function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated }) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
-            // Calculate next distribution time for each type upon fetching
+            // The server computes the next distribution time (calendar months, schedules, time zones)
             const typesWithNextDist = data.map(tt => ({
                 ...tt,
-                // Call the helper function here
-                nextDistributionTime: calculateNextDistribution(tt)
+                nextDistributionTime: tt.next_distribution_at ? new Date(tt.next_distribution_at) : null
             }));
             // Set the state with the augmented data
             setTicketTypes(typesWithNextDist);
@@ -146,10 +145,11 @@ function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated }) {
         setError(null); // Clear previous errors
     };
 
-    // Fetch on mount
+    // Fetch on mount, and again whenever App's event stream reports a distribution or a ticket type
+    // change (instead of guessing with timers or opening a second stream)
     useEffect(() => {
         fetchTicketTypes();
-    }, []); // Run only once on mount
+    }, [ticketTypesVersion]);
 
     // --- Helper Function for Time Difference Formatting ---
     const formatTimeDifference = (diffMs) => {
@@ -179,46 +179,6 @@ function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated }) {
         return parts.join(' ');
     };
 
-    // --- Helper Function to Calculate Next Distribution Time ---
-    const calculateNextDistribution = (ticketType) => {
-        if (!ticketType.last_distributed)
-            return null; // Never distributed before, maybe show "Ready"? Or calculate based on creation? For now, null.
-
-        const lastDistributedDate = new Date(ticketType.last_distributed);
-        if (isNaN(lastDistributedDate)) {
-            console.error("Invalid last_distributed date:", ticketType.last_distributed);
-            return null; // Invalid date
-        }
-
-        const value = ticketType.frequency_value;
-        const unit = ticketType.frequency_unit;
-        let nextDistributionDate = new Date(lastDistributedDate);
-
-        // Note: 'months' is tricky due to variable days. This is an approximation.
-        // Consider using a date library like date-fns or moment for more robust calculations.
-        switch (unit) {
-            case 'minutes':
-                nextDistributionDate.setMinutes(nextDistributionDate.getMinutes() + value);
-                break;
-            case 'hours':
-                nextDistributionDate.setHours(nextDistributionDate.getHours() + value);
-                break;
-            case 'days':
-                nextDistributionDate.setDate(nextDistributionDate.getDate() + value);
-                break;
-            case 'weeks':
-                nextDistributionDate.setDate(nextDistributionDate.getDate() + value * 7);
-                break;
-            case 'months': // Approximation
-                nextDistributionDate.setMonth(nextDistributionDate.getMonth() + value);
-                break;
-            default:
-                console.error("Unknown frequency unit:", unit);
-                return null; // Unknown unit
-        }
-        return nextDistributionDate;
-    }
-
     // --- Countdown Display Component ---
     function CountdownTimer({ nextDistributionTime }) {
         const [now, setNow] = useState(new Date());
@@ -306,7 +266,7 @@ function TicketTypeManager({ apiBaseUrl, wallets, onTicketTypesUpdated }) {
                     {ticketTypes.map(tt => (
                         <li key={tt.id} className={styles.typeItem}>
                             <div className={styles.typeDetails}>
-                                <strong>{tt.name}</strong> ({tt.distribute_quantity} every {tt.frequency_value} {tt.frequency_unit})
+                                <strong>{tt.name}</strong> ({tt.distribute_quantity} {tt.schedule ? `on schedule "${tt.schedule}"` : `every ${tt.frequency_value} ${tt.frequency_unit}`}{tt.timezone ? `, ${tt.timezone}` : ''})
                                 {tt.description && <span className={styles.description}> - {tt.description}</span>}
                                 <br />
                                 <span className={styles.targetWallet}>
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+# app.py reads DATABASE_PATH (and derives the archive path) at import time,
+# so point it at a throwaway directory before the module is first imported
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='impulse-tickets-tests-'), 'tickets.db')
+
+import app as app_module # noqa: E402
+
+
+class QueryRecorder:
+	"""Context manager that records the SQL statements (with their first parameter set) sent to the database while it is active."""
+
+	def __init__(self, engine):
+		self.engine = engine
+		self.executions = [] # (statement, parameters)
+
+	@property
+	def statements(self):
+		return [statement for statement, _ in self.executions]
+
+	@property
+	def count(self):
+		return len(self.executions)
+
+	def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		self.executions.append((statement, parameters[0] if executemany else parameters))
+
+	def __enter__(self):
+		event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+		return False
+
+
+@pytest.fixture(scope='session')
+def app():
+	"""The Flask app, backed by a fresh temporary database with the current schema."""
+	app_module.initialize_database()
+	return app_module.app
+
+
+@pytest.fixture(scope='session')
+def seeded(app):
+	"""
+	Several wallets and ticket types with tickets in every wallet, so per-row lazy loads (N+1 queries)
+	show up in query counts. Returns {'wallet_ids': [...], 'ticket_type_ids': [...]}.
+	"""
+	client = app.test_client()
+	wallet_ids = [
+		client.post('/api/wallets', json={'name': f"Seed Wallet {n}"}).get_json()['id'] for n in range(4)
+	]
+	ticket_type_ids = [
+		client.post('/api/ticket-types', json={
+			'name': f"Seed Type {n}",
+			'distribute_quantity': 1,
+			'frequency_value': 1,
+			'frequency_unit': 'days',
+			'target_wallet_id': wallet_ids[n] if n % 2 else None,
+		}).get_json()['id'] for n in range(3)
+	]
+	issued_dates = [datetime(2024, 1, day) for day in range(1, 4)]
+	with app.app_context():
+		for ticket_type_id in ticket_type_ids:
+			app_module.issue_tickets_bulk(ticket_type_id, wallet_ids, 2, issued_dates)
+		app_module.db.session.commit()
+	return {'wallet_ids': wallet_ids, 'ticket_type_ids': ticket_type_ids}
+
+
+@pytest.fixture
+def record_queries(app):
+	"""Returns a factory for QueryRecorder context managers on the app's engine."""
+	with app.app_context():
+		engine = app_module.db.engine
+	return lambda: QueryRecorder(engine)
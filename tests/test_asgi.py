@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import io
+
+from asgi import RequestBody, application
+
+
+def call_asgi(method, path, body_chunks, headers=(), query_string=b''):
+	"""Runs one HTTP request through the ASGI app. Returns (status, body, messages received by the app)."""
+	messages = [
+		{'type': 'http.request', 'body': chunk, 'more_body': index < len(body_chunks) - 1}
+		for index, chunk in enumerate(body_chunks)
+	]
+	received = []
+	sent = []
+
+	async def receive():
+		if len(received) < len(messages):
+			received.append(messages[len(received)])
+			return received[-1]
+		await asyncio.sleep(3600) # No disconnect until the response is done
+
+	async def send(message):
+		sent.append(message)
+
+	scope = {
+		'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+		'query_string': query_string, 'headers': [(name.encode(), value.encode()) for name, value in headers],
+	}
+	asyncio.run(application(scope, receive, send))
+	status = next(message['status'] for message in sent if message['type'] == 'http.response.start')
+	body = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+	return status, body, received
+
+
+def test_chunked_import_streams_the_body(app):
+	# No Content-Length (chunked upload); every line arrives in its own message
+	lines = [json.dumps({'name': f"ASGI Wallet {n}"}).encode() + b'\n' for n in range(50)]
+	status, body, received = call_asgi(
+		'POST', '/api/wallets/import', lines, headers=[('content-type', 'application/x-ndjson')]
+	)
+	assert status == 200, body
+	assert json.loads(body)['created'] == 50
+	assert len(received) == len(lines)
+
+
+def test_json_body_with_content_length(app):
+	payload = json.dumps({'name': "ASGI Single"}).encode()
+	status, body, _ = call_asgi('POST', '/api/wallets', [payload[:5], payload[5:]], headers=[
+		('content-type', 'application/json'), ('content-length', str(len(payload))),
+	])
+	assert status == 201, body
+	assert json.loads(body)['name'] == "ASGI Single"
+
+
+def test_request_body_pulls_messages_on_demand():
+	chunks = [b'a' * 10, b'b' * 10, b'c' * 10]
+	received = []
+
+	async def receive():
+		received.append(chunks[len(received)])
+		return {'type': 'http.request', 'body': received[-1], 'more_body': len(received) < len(chunks)}
+
+	async def read_in_two_steps():
+		loop = asyncio.get_running_loop()
+		body = RequestBody(receive, loop)
+		first = await loop.run_in_executor(None, body.read, 4)
+		pulled_after_first_read = len(received)
+		rest = await loop.run_in_executor(None, io.BufferedReader(body).read)
+		return first, pulled_after_first_read, rest
+
+	first, pulled_after_first_read, rest = asyncio.run(read_in_two_steps())
+	assert first == b'aaaa'
+	assert pulled_after_first_read == 1 # Later messages stay with the server until they are needed
+	assert first + rest == b''.join(chunks)
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from app import TicketType, WalletBalance, archive_consumed_tickets, db, distribute_ticket_type, find_balance_drift
+
+
+@pytest.fixture
+def client(app):
+	return app.test_client()
+
+
+def test_balances_follow_distribution_consumption_and_archival(app, client):
+	wallet_ids = [client.post('/api/wallets', json={'name': f"Balance Wallet {n}"}).get_json()['id'] for n in range(3)]
+	type_id = client.post('/api/ticket-types', json={
+		'name': "Balance Type", 'distribute_quantity': 4, 'frequency_value': 1, 'frequency_unit': 'days',
+	}).get_json()['id']
+	with app.app_context():
+		assert distribute_ticket_type(db.session.get(TicketType, type_id), wallet_ids, datetime.utcnow()) == 12
+
+	first_wallet_tickets = client.get(f'/api/wallets/{wallet_ids[0]}/tickets').get_json()
+	assert client.post(f'/api/tickets/{first_wallet_tickets[0]["id"]}/consume').status_code == 200
+	assert client.post('/api/tickets/consume', json={'ticket_ids': [first_wallet_tickets[1]['id']]}).status_code == 200
+	assert client.post('/api/tickets/consume', json={'wallet_id': wallet_ids[1], 'ticket_type_id': type_id, 'count': 3}).status_code == 200
+	assert client.post(f'/api/wallets/{wallet_ids[2]}/ticket-types/{type_id}/consume').status_code == 200
+
+	with app.app_context():
+		assert find_balance_drift() == []
+		assert archive_consumed_tickets(older_than_days=0) >= 6
+		assert find_balance_drift() == [] # Archived tickets are counted from the daily rollups
+		balances = {
+			balance.wallet_id: (balance.available, balance.issued_total, balance.consumed_total)
+			for balance in WalletBalance.query.filter_by(ticket_type_id=type_id)
+		}
+	assert balances == {wallet_ids[0]: (2, 4, 2), wallet_ids[1]: (1, 4, 3), wallet_ids[2]: (3, 4, 1)}
+
+	# Deleting a wallet takes its balances with it
+	assert client.delete(f'/api/wallets/{wallet_ids[2]}').status_code == 200
+	with app.app_context():
+		assert find_balance_drift() == []
+
+
+def test_check_balances_repairs_drift(app, seeded):
+	wallet_id, type_id = seeded['wallet_ids'][0], seeded['ticket_type_ids'][0]
+	with app.app_context():
+		db.session.execute(db.update(WalletBalance).filter_by(wallet_id=wallet_id, ticket_type_id=type_id).values(
+			available=WalletBalance.available + 5
+		))
+		db.session.commit()
+		assert [(row[0], row[1]) for row in find_balance_drift()] == [(wallet_id, type_id)]
+
+	runner = app.test_cli_runner()
+	result = runner.invoke(args=['check-balances'])
+	assert result.exit_code != 0
+	assert f"Wallet {wallet_id}, type {type_id}" in result.output
+
+	result = runner.invoke(args=['check-balances', '--repair'])
+	assert result.exit_code == 0, result.output
+	with app.app_context():
+		assert find_balance_drift() == []
+	assert runner.invoke(args=['check-balances']).exit_code == 0
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+from app import IssuedTicket, WalletBalance, db, issue_tickets_bulk
+
+
+@pytest.fixture
+def client(app):
+	return app.test_client()
+
+
+@pytest.fixture
+def wallet_tickets(app, client, request):
+	"""One wallet holding three tickets of a fresh type, issued a day apart. Returns (wallet_id, type_id, ticket_ids oldest first)."""
+	name = request.node.name
+	wallet_id = client.post('/api/wallets', json={'name': f"{name} wallet"}).get_json()['id']
+	type_id = client.post('/api/ticket-types', json={
+		'name': f"{name} type", 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'days',
+	}).get_json()['id']
+	with app.app_context():
+		issue_tickets_bulk(type_id, [wallet_id], 1, [datetime(2024, 3, day) for day in (1, 2, 3)])
+		db.session.commit()
+		ticket_ids = [ticket_id for (ticket_id,) in db.session.query(IssuedTicket.id).filter_by(
+			ticket_type_id=type_id
+		).order_by(IssuedTicket.issued_date)]
+	return wallet_id, type_id, ticket_ids
+
+
+def available_balance(app, wallet_id, type_id):
+	with app.app_context():
+		return db.session.get(WalletBalance, (wallet_id, type_id)).available
+
+
+def test_consume_ticket_twice_conflicts_without_double_decrement(app, client, wallet_tickets):
+	wallet_id, type_id, ticket_ids = wallet_tickets
+
+	response = client.post(f'/api/tickets/{ticket_ids[0]}/consume')
+	assert response.status_code == 200
+	assert response.get_json()['consumed_date'] is not None
+	assert available_balance(app, wallet_id, type_id) == 2
+
+	assert client.post(f'/api/tickets/{ticket_ids[0]}/consume').status_code == 409
+	assert available_balance(app, wallet_id, type_id) == 2
+	assert client.post('/api/tickets/999999999/consume').status_code == 404
+
+
+def test_batch_consume_reports_each_ticket_once(app, client, wallet_tickets):
+	wallet_id, type_id, ticket_ids = wallet_tickets
+	client.post(f'/api/tickets/{ticket_ids[0]}/consume')
+
+	response = client.post('/api/tickets/consume', json={
+		'ticket_ids': [ticket_ids[1], ticket_ids[0], 999999999, ticket_ids[1], ticket_ids[2]]
+	})
+	assert response.status_code == 200
+	body = response.get_json()
+	assert body['consumed_count'] == 2
+	assert body['results'] == [ # Duplicates collapse onto their first position
+		{'ticket_id': ticket_ids[1], 'status': 'consumed'},
+		{'ticket_id': ticket_ids[0], 'status': 'already_consumed'},
+		{'ticket_id': 999999999, 'status': 'not_found'},
+		{'ticket_id': ticket_ids[2], 'status': 'consumed'},
+	]
+	assert available_balance(app, wallet_id, type_id) == 0
+
+
+def test_batch_consume_by_count_takes_oldest_first(app, client, wallet_tickets):
+	wallet_id, type_id, ticket_ids = wallet_tickets
+
+	response = client.post('/api/tickets/consume', json={'wallet_id': wallet_id, 'ticket_type_id': type_id, 'count': 2})
+	assert response.status_code == 200
+	body = response.get_json()
+	assert (body['requested_count'], body['consumed_count']) == (2, 2)
+	assert [result['ticket_id'] for result in body['results']] == ticket_ids[:2]
+
+	# Only one ticket is left; the rest of the request is simply not fulfilled
+	body = client.post('/api/tickets/consume', json={'wallet_id': wallet_id, 'ticket_type_id': type_id, 'count': 2}).get_json()
+	assert (body['requested_count'], body['consumed_count']) == (2, 1)
+	assert [result['ticket_id'] for result in body['results']] == ticket_ids[2:]
+	assert available_balance(app, wallet_id, type_id) == 0
+
+
+@pytest.mark.parametrize('payload', [
+	{'ticket_ids': []},
+	{'ticket_ids': [1, 2, 3, 4]},
+	{'ticket_ids': [1, True]},
+	{'ticket_ids': '1'},
+	{'wallet_id': 1, 'ticket_type_id': 1, 'count': 0},
+	{'wallet_id': 1, 'ticket_type_id': 1, 'count': 4},
+	{'wallet_id': 1, 'ticket_type_id': True},
+	{},
+])
+def test_batch_consume_rejects_out_of_bounds_requests(app, client, monkeypatch, payload):
+	monkeypatch.setitem(app.config, 'CONSUME_BATCH_MAX', 3)
+	response = client.post('/api/tickets/consume', json=payload)
+	assert response.status_code == 400
+	assert 'errors' in response.get_json()
+
+
+def test_batch_consume_accepts_the_configured_maximum(app, client, monkeypatch, wallet_tickets):
+	_, _, ticket_ids = wallet_tickets
+	monkeypatch.setitem(app.config, 'CONSUME_BATCH_MAX', 3)
+	response = client.post('/api/tickets/consume', json={'ticket_ids': ticket_ids})
+	assert response.status_code == 200
+	assert response.get_json()['consumed_count'] == 3
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import DistributionRun, IssuedTicket, TicketType, db, distribute_ticket_type
+
+
+@pytest.fixture
+def client(app):
+	return app.test_client()
+
+
+def create_wallets(client, prefix, count):
+	return [client.post('/api/wallets', json={'name': f"{prefix} {n}"}).get_json()['id'] for n in range(count)]
+
+
+def create_ticket_type(client, name, **fields):
+	data = {'name': name, 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'minutes', **fields}
+	response = client.post('/api/ticket-types', json=data)
+	assert response.status_code == 201, response.get_json()
+	return response.get_json()['id']
+
+
+def tickets_per_wallet(ticket_type_id, wallet_ids):
+	counts = dict(db.session.query(IssuedTicket.wallet_id, db.func.count()).filter(
+		IssuedTicket.ticket_type_id == ticket_type_id
+	).group_by(IssuedTicket.wallet_id))
+	return [counts.get(wallet_id, 0) for wallet_id in wallet_ids]
+
+
+def test_interrupted_first_distribution_resumes_without_reissuing(app, client, monkeypatch):
+	wallet_ids = create_wallets(client, "Resume Wallet", 6)
+	type_id = create_ticket_type(client, "Resume Type") # Unanchored, never distributed
+	monkeypatch.setitem(app.config, 'DISTRIBUTION_CHUNK_SIZE', 2)
+
+	real_issue = app_module.issue_tickets_bulk
+	calls = []
+
+	def failing_second_chunk(*args, **kwargs):
+		calls.append(args)
+		if len(calls) == 2:
+			raise RuntimeError("chunk failed")
+		return real_issue(*args, **kwargs)
+
+	with app.app_context():
+		monkeypatch.setattr(app_module, 'issue_tickets_bulk', failing_second_chunk)
+		ticket_type = db.session.get(TicketType, type_id)
+		with pytest.raises(RuntimeError):
+			distribute_ticket_type(ticket_type, wallet_ids, datetime.utcnow())
+		db.session.rollback()
+		assert tickets_per_wallet(type_id, wallet_ids) == [1, 1, 0, 0, 0, 0]
+
+		# The next tick comes later; it must resume the same period after wallet 2
+		monkeypatch.setattr(app_module, 'issue_tickets_bulk', real_issue)
+		ticket_type = db.session.get(TicketType, type_id)
+		distribute_ticket_type(ticket_type, wallet_ids, datetime.utcnow() + timedelta(seconds=30))
+		assert tickets_per_wallet(type_id, wallet_ids) == [1] * 6
+
+		runs = DistributionRun.query.filter_by(ticket_type_id=type_id).all()
+		assert len(runs) == 1
+		assert runs[0].completed_at is not None
+		assert runs[0].tickets_issued == 6
+		assert ticket_type.last_distributed == runs[0].period_start
+
+
+ANCHOR = datetime(2024, 1, 1)
+
+
+def make_overdue(type_id, last_distributed, **fields):
+	"""Puts a ticket type's last distribution in the past, as after downtime. Returns the reloaded type."""
+	ticket_type = db.session.get(TicketType, type_id)
+	ticket_type.anchor_at = ANCHOR
+	ticket_type.last_distributed = last_distributed
+	for name, value in fields.items():
+		setattr(ticket_type, name, value)
+	ticket_type.update_next_due_at()
+	db.session.commit()
+	return ticket_type
+
+
+@pytest.fixture
+def overdue_type(client):
+	"""Creates ticket types for a test and deletes them afterwards, so later distribution ticks don't catch up years of their periods."""
+	type_ids = []
+
+	def create(name, **fields):
+		type_ids.append(create_ticket_type(client, name, **fields))
+		return type_ids[-1]
+	yield create
+	for type_id in type_ids:
+		client.delete(f'/api/ticket-types/{type_id}')
+
+
+def issued_dates(type_id):
+	return [issued_date for (issued_date,) in db.session.query(IssuedTicket.issued_date).filter_by(
+		ticket_type_id=type_id
+	).order_by(IssuedTicket.issued_date)]
+
+
+def test_catch_up_issues_each_missed_period_at_its_start(app, client, overdue_type):
+	wallet_ids = create_wallets(client, "Catch-up Wallet", 2)
+	type_id = overdue_type("Catch-up Type", frequency_unit='hours')
+	with app.app_context():
+		ticket_type = make_overdue(type_id, ANCHOR)
+		assert ticket_type.next_due_at == datetime(2024, 1, 1, 1)
+
+		assert distribute_ticket_type(ticket_type, wallet_ids, datetime(2024, 1, 1, 5, 30)) == 10
+		period_starts = [datetime(2024, 1, 1, hour) for hour in range(1, 6)]
+		assert issued_dates(type_id) == sorted(period_starts * 2)
+		assert ticket_type.last_distributed == datetime(2024, 1, 1, 5)
+		assert ticket_type.next_due_at == datetime(2024, 1, 1, 6)
+
+
+def test_catch_up_boundaries_are_exclusive_of_last_distributed(app, overdue_type):
+	type_id = overdue_type("Boundary Type", frequency_unit='hours')
+	with app.app_context():
+		ticket_type = make_overdue(type_id, datetime(2024, 1, 1, 5))
+		# last_distributed itself is never owed again; a period is due from its first instant
+		assert app_module.get_due_periods(ticket_type, datetime(2024, 1, 1, 5, 59, 59)) == ([], 0)
+		assert app_module.get_due_periods(ticket_type, datetime(2024, 1, 1, 6)) == ([datetime(2024, 1, 1, 6)], 0)
+		assert app_module.get_due_periods(ticket_type, datetime(2024, 1, 1, 8)) == (
+			[datetime(2024, 1, 1, 6), datetime(2024, 1, 1, 7), datetime(2024, 1, 1, 8)], 0
+		)
+
+
+def test_catch_up_is_capped_at_the_newest_periods(app, client, overdue_type, caplog):
+	wallet_ids = create_wallets(client, "Capped Wallet", 1)
+	type_id = overdue_type("Capped Type", frequency_unit='hours')
+	with app.app_context():
+		ticket_type = make_overdue(type_id, ANCHOR, max_catch_up_periods=3)
+		now = datetime(2024, 1, 1, 10, 15)
+		assert app_module.get_due_periods(ticket_type, now) == ([datetime(2024, 1, 1, hour) for hour in (8, 9, 10)], 7)
+
+		with caplog.at_level('WARNING'):
+			assert distribute_ticket_type(ticket_type, wallet_ids, now) == 3
+		assert "Skipping 7 missed period(s)" in caplog.text
+		assert issued_dates(type_id) == [datetime(2024, 1, 1, hour) for hour in (8, 9, 10)]
+		assert ticket_type.last_distributed == datetime(2024, 1, 1, 10)
+
+
+def test_catch_up_cap_defaults_to_config(app, overdue_type, monkeypatch):
+	type_id = overdue_type("Default Cap Type", frequency_unit='days')
+	monkeypatch.setitem(app.config, 'DISTRIBUTION_MAX_CATCH_UP_PERIODS', 2)
+	with app.app_context():
+		ticket_type = make_overdue(type_id, ANCHOR)
+		assert app_module.get_due_periods(ticket_type, datetime(2024, 1, 31)) == ([datetime(2024, 1, 30), datetime(2024, 1, 31)], 28)
+
+
+def test_distribute_once_fails_while_another_process_holds_the_lease(app):
+	with app.app_context():
+		db.session.execute(db.delete(app_module.SchedulerLease).filter_by(name=app_module.DISTRIBUTOR_LEASE_NAME))
+		db.session.add(app_module.SchedulerLease(
+			name=app_module.DISTRIBUTOR_LEASE_NAME, holder='other-host:1', expires_at=datetime.utcnow() + timedelta(minutes=5)
+		))
+		db.session.commit()
+	try:
+		result = app.test_cli_runner().invoke(args=['distribute', '--once'])
+		assert result.exit_code != 0
+		assert "held by other-host:1" in result.output
+	finally:
+		with app.app_context():
+			db.session.execute(db.delete(app_module.SchedulerLease).filter_by(name=app_module.DISTRIBUTOR_LEASE_NAME))
+			db.session.commit()
+
+
+def test_distribute_dry_run_neither_migrates_nor_writes(app, client):
+	create_wallets(client, "Dry Run Wallet", 1)
+	create_ticket_type(client, "Dry Run Type")
+	runner = app.test_cli_runner()
+	with app.app_context():
+		ticket_count = IssuedTicket.query.count()
+		with db.engine.begin() as conn:
+			conn.exec_driver_sql(f"PRAGMA main.user_version={app_module.SCHEMA_VERSION - 1}")
+	try:
+		result = runner.invoke(args=['distribute', '--dry-run'])
+		assert result.exit_code != 0
+		assert "flask init-db" in result.output
+		with app.app_context():
+			assert app_module.read_schema_versions()[0] == app_module.SCHEMA_VERSION - 1
+	finally:
+		with app.app_context(), db.engine.begin() as conn:
+			conn.exec_driver_sql(f"PRAGMA main.user_version={app_module.SCHEMA_VERSION}")
+
+	result = runner.invoke(args=['distribute', '--dry-run'])
+	assert result.exit_code == 0, result.output
+	assert "Would issue" in result.output
+	with app.app_context():
+		assert IssuedTicket.query.count() == ticket_count
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import scheduler, watch_ticket_type_changes
+
+
+@pytest.fixture
+def distribution_job(app):
+	"""The distribution job as `flask distribute` registers it, without starting the scheduler."""
+	job = scheduler.add_job(
+		func=app_module.distribute_tickets_job, trigger='interval', seconds=3600,
+		id='distribute_tickets', replace_existing=True
+	)
+	yield job
+	scheduler.remove_job('distribute_tickets')
+
+
+def test_new_ticket_type_from_another_process_rearms_the_job(app, distribution_job):
+	watch_ticket_type_changes() # Catch up with the types created so far
+	assert watch_ticket_type_changes() is None # Unchanged version: no re-arm
+
+	# The web process creates a type; its own arm_distribution_job() call has no job to move
+	response = app.test_client().post('/api/ticket-types', json={
+		'name': "Every Minute", 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'minutes',
+	})
+	assert response.status_code == 201
+
+	next_run = watch_ticket_type_changes()
+	assert next_run is not None
+	assert next_run <= datetime.utcnow() + timedelta(minutes=1)
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from app import HTTP_REQUEST_SECONDS, TICKETS_CONSUMED, flush_metrics_snapshot, get_metrics_snapshot_path
+
+
+@pytest.fixture
+def metrics_dir(app, tmp_path, monkeypatch):
+	monkeypatch.setitem(app.config, 'METRICS_MULTIPROCESS_DIR', str(tmp_path))
+	return tmp_path
+
+
+def metric_value(body, line_prefix):
+	return sum(float(line.rsplit(' ', 1)[1]) for line in body.splitlines() if line.startswith(line_prefix + ' '))
+
+
+def test_metrics_are_summed_across_workers(app, metrics_dir):
+	# Another worker's snapshot, as flush_metrics_snapshot() writes it
+	(metrics_dir / 'metrics-999999.json').write_text(json.dumps({
+		'tickets_consumed_total': [[[], 5]],
+		'http_request_duration_seconds': [[[['method', 'GET'], ['route', '/api/wallets'], ['status', 200]], [1] * 15 + [0.5, 1]]],
+	}))
+	own_consumed = TICKETS_CONSUMED.snapshot().get((), 0)
+	own_series = HTTP_REQUEST_SECONDS.snapshot().get((('method', 'GET'), ('route', '/api/wallets'), ('status', 200)))
+	client = app.test_client()
+	body = client.get('/metrics').get_data(as_text=True)
+	assert metric_value(body, 'tickets_consumed_total') == own_consumed + 5
+	route_count = 'http_request_duration_seconds_count{method="GET",route="/api/wallets",status="200"}'
+	assert metric_value(body, route_count) == (own_series[-1] if own_series else 0) + 1
+
+
+def test_snapshot_round_trips(app, metrics_dir):
+	flush_metrics_snapshot(force=True)
+	with open(get_metrics_snapshot_path()) as f:
+		snapshot = json.load(f)
+	assert 'http_request_duration_seconds' in snapshot
+	assert 'tickets_consumed_total' in snapshot
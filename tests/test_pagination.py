@@ -0,0 +1,40 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+	return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+@pytest.mark.parametrize('path, after', [
+	('/api/wallets/{wallet_id}/tickets', [1, 2]), # issued_date must be an ISO string
+	('/api/wallets/{wallet_id}/tickets', ["2024-01-01T00:00:00", "7"]), # id must be an integer
+	('/api/wallets/{wallet_id}/tickets', ["not a date", 7]),
+	('/api/wallets', [{'a': 1}]),
+	('/api/wallets', [1, 2]),
+	('/api/ticket-types', [None]),
+	('/api/balances', [1, True]),
+	('/api/wallets', 'not base64!'),
+])
+def test_invalid_cursor_is_a_bad_request(app, seeded, path, after):
+	path = path.format(wallet_id=seeded['wallet_ids'][0])
+	after = after if isinstance(after, str) else cursor(after)
+	response = app.test_client().get(path, query_string={'limit': 2, 'after': after})
+	assert response.status_code == 400, response.get_data(as_text=True)
+
+
+def test_pages_cover_the_list_once(app, seeded):
+	client = app.test_client()
+	path = f"/api/wallets/{seeded['wallet_ids'][0]}/tickets"
+	everything = [ticket['id'] for ticket in client.get(path).get_json()]
+	paged = []
+	after = None
+	while True:
+		response = client.get(path, query_string={'limit': 4, **({'after': after} if after else {})})
+		paged.extend(ticket['id'] for ticket in response.get_json())
+		after = response.headers.get('X-Next-Cursor')
+		if after is None:
+			break
+	assert paged == everything
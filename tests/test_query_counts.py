@@ -0,0 +1,39 @@
+import pytest
+
+from app import response_cache
+
+
+def count_request_queries(app, record_queries, path):
+	"""GETs `path` with an empty response cache and returns (response, QueryRecorder)."""
+	response_cache.clear() # A cache hit would skip the view and hide an N+1
+	with record_queries() as counter:
+		response = app.test_client().get(path)
+		response.get_data() # Drain streamed responses so their queries are counted too
+	return response, counter
+
+
+def list_endpoint_bounds(seeded):
+	"""(path, max statements) - bounds must not depend on the number of rows returned."""
+	# Cached lists: one version lookup plus the list query on a miss
+	checks = [('/api/wallets', 2), ('/api/ticket-types', 2), ('/api/balances', 1)]
+	for wallet_id in seeded['wallet_ids']:
+		checks.append((f'/api/wallets/{wallet_id}/tickets', 2))
+		checks.append((f'/api/wallets/{wallet_id}/tickets?limit=5', 2))
+		checks.append((f'/api/wallets/{wallet_id}/tickets?group=type', 2))
+		checks.append((f'/api/wallets/{wallet_id}/balances', 2)) # Wallet lookup only when it has no balances
+	return checks
+
+
+def test_list_endpoints_use_constant_queries(app, seeded, record_queries):
+	for path, max_queries in list_endpoint_bounds(seeded):
+		response, counter = count_request_queries(app, record_queries, path)
+		assert response.status_code == 200, path
+		assert len(response.get_json()) > 1, f"{path} returned too few rows to expose an N+1"
+		assert counter.count <= max_queries, f"{path}: {counter.count} statements\n" + '\n'.join(counter.statements)
+
+
+@pytest.mark.parametrize('path', ['/api/wallets?format=ndjson', '/api/ticket-types?format=ndjson'])
+def test_streamed_lists_use_constant_queries(app, seeded, record_queries, path):
+	response, counter = count_request_queries(app, record_queries, path)
+	assert len(response.get_data(as_text=True).splitlines()) > 1
+	assert counter.count <= 1, '\n'.join(counter.statements)
@@ -0,0 +1,96 @@
+import re
+
+import pytest
+
+from app import (
+	archive_consumed_tickets, db, distribute_tickets_job, fetch_events, prune_distribution_runs,
+	prune_event_log, scheduler
+)
+
+# Tables that grow with use; filtered statements on them must reach their rows through an index
+HOT_TABLES = ('issued_ticket', 'wallet_balance', 'distribution_run', 'event_log', 'ticket_type', 'ticket_history_daily')
+HOT_TABLE_SCAN = re.compile(r'^SCAN (?:\w+\.)?(?:%s)\b' % '|'.join(HOT_TABLES))
+
+
+def explain(statement, parameters):
+	"""Returns the EXPLAIN QUERY PLAN detail lines for a captured statement."""
+	with db.engine.connect() as conn:
+		return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()]
+
+
+def exercise_hot_paths(app, seeded):
+	"""Drives the API and distributor paths that run on every request or tick, against the seeded database."""
+	client = app.test_client()
+	wallet_id = seeded['wallet_ids'][0]
+	type_id = seeded['ticket_type_ids'][0]
+
+	first_page = client.get(f'/api/wallets/{wallet_id}/tickets?limit=2')
+	client.get(f'/api/wallets/{wallet_id}/tickets', query_string={'limit': 2, 'after': first_page.headers['X-Next-Cursor']})
+	client.get(f'/api/wallets/{wallet_id}/tickets?group=type')
+	client.get(f'/api/wallets/{wallet_id}/balances')
+	client.get('/api/balances?limit=2')
+	client.get(f'/api/wallets/{wallet_id}/history')
+	client.get('/api/wallets')
+	client.get('/api/ticket-types')
+	assert client.post(f'/api/wallets/{wallet_id}/ticket-types/{type_id}/consume').status_code == 200
+	ticket_ids = [ticket['id'] for ticket in first_page.get_json()]
+	client.post(f'/api/tickets/{ticket_ids[0]}/consume')
+	client.post('/api/tickets/consume', json={'ticket_ids': ticket_ids + [10 ** 9]})
+	client.post('/api/tickets/consume', json={'wallet_id': wallet_id, 'ticket_type_id': type_id, 'count': 2})
+
+	# A wallet without target types and a ticket type can be deleted (cascades through their tickets)
+	spare_wallet_id = client.post('/api/wallets', json={'name': "Plan Spare Wallet"}).get_json()['id']
+	assert client.delete(f'/api/wallets/{spare_wallet_id}').status_code == 200
+	spare_type_id = client.post('/api/ticket-types', json={
+		'name': "Plan Spare Type", 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'days',
+	}).get_json()['id']
+	assert client.delete(f'/api/ticket-types/{spare_type_id}').status_code == 200
+
+	client.post('/api/ticket-types', json={
+		'name': "Plan Due Type", 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'minutes',
+	})
+	job = scheduler.add_job(func=distribute_tickets_job, trigger='interval', seconds=3600, id='distribute_tickets', replace_existing=True)
+	try:
+		distribute_tickets_job() # Also prunes events and ledger rows and re-arms the job
+	finally:
+		scheduler.remove_job(job.id)
+	with app.app_context():
+		fetch_events(0, wallet_id)
+		prune_event_log()
+		prune_distribution_runs()
+		archive_consumed_tickets(older_than_days=0, max_batches=1)
+
+
+def test_hot_paths_use_indexes(app, seeded, record_queries):
+	with record_queries() as recorder:
+		exercise_hot_paths(app, seeded)
+	assert recorder.count > 20
+
+	scans = {}
+	with app.app_context():
+		for statement, parameters in recorder.executions:
+			if statement.lstrip().upper().startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK')):
+				continue
+			plan = explain(statement, parameters)
+			# Unfiltered listings (e.g. /api/balances pages) walk an index by design; a filter must SEARCH
+			if ' WHERE ' in ' '.join(statement.split()) and any(HOT_TABLE_SCAN.match(line) for line in plan):
+				scans[statement] = plan
+	assert scans == {}, '\n\n'.join(f"{statement}\n  {' | '.join(plan)}" for statement, plan in scans.items())
+
+
+def test_foreign_keys_are_indexed(app):
+	"""ON DELETE CASCADE and FK checks look up the child column; without an index each parent delete scans the child table."""
+	with app.app_context(), db.engine.connect() as conn:
+		tables = [name for (name,) in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")]
+		unindexed = []
+		for table in tables:
+			leading_columns = {
+				conn.exec_driver_sql(f"PRAGMA index_info('{index[1]}')").first()[2]
+				for index in conn.exec_driver_sql(f"PRAGMA index_list('{table}')")
+			}
+			primary_key = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info('{table}')") if row[5] == 1]
+			leading_columns.update(primary_key)
+			for foreign_key in conn.exec_driver_sql(f"PRAGMA foreign_key_list('{table}')"):
+				if foreign_key[3] not in leading_columns:
+					unindexed.append(f"{table}.{foreign_key[3]}")
+	assert unindexed == []
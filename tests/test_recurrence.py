@@ -0,0 +1,133 @@
+from datetime import datetime
+
+import pytest
+
+from app import (
+	CalendarSchedule, FrequencyUnit, TicketType, add_months, db, get_zone, local_to_utc, refresh_next_due_at, utc_to_local
+)
+
+BERLIN = get_zone('Europe/Berlin')
+
+
+def interval_type(unit, value=1, anchor_at=None, timezone=None, last_distributed=None):
+	return TicketType(
+		frequency_unit=unit, frequency_value=value, anchor_at=anchor_at, timezone=timezone, last_distributed=last_distributed
+	)
+
+
+def test_add_months_clamps_to_the_end_of_shorter_months():
+	assert add_months(datetime(2024, 1, 31, 9), 1) == datetime(2024, 2, 29, 9)
+	assert add_months(datetime(2023, 1, 31, 9), 1) == datetime(2023, 2, 28, 9)
+	assert add_months(datetime(2024, 11, 30), 3) == datetime(2025, 2, 28)
+
+
+def test_monthly_interval_stays_on_the_anchor_day():
+	monthly = interval_type(FrequencyUnit.MONTHS, anchor_at=datetime(2024, 1, 31, 9))
+	assert [monthly.get_interval_occurrence(index) for index in range(4)] == [
+		datetime(2024, 1, 31, 9), datetime(2024, 2, 29, 9), datetime(2024, 3, 31, 9), datetime(2024, 4, 30, 9)
+	]
+	assert monthly.get_interval_index(datetime(2024, 3, 31, 8, 59)) == 1
+	assert monthly.get_interval_index(datetime(2024, 3, 31, 9)) == 2
+
+
+def test_local_time_conversions_around_dst():
+	# Clocks go forward in Berlin at 02:00 local on 31 March 2024; 02:30 does not exist and moves forward
+	assert local_to_utc(datetime(2024, 3, 31, 2, 30), BERLIN) == datetime(2024, 3, 31, 1, 30)
+	assert utc_to_local(datetime(2024, 3, 31, 1, 30), BERLIN) == datetime(2024, 3, 31, 3, 30)
+	# They go back at 03:00 on 27 October; the repeated 02:30 resolves to its first occurrence (CEST)
+	assert local_to_utc(datetime(2024, 10, 27, 2, 30), BERLIN) == datetime(2024, 10, 27, 0, 30)
+
+
+def test_daily_local_type_keeps_its_wall_clock_time_across_dst():
+	# 08:00 in Berlin: 07:00 UTC in winter, 06:00 UTC in summer
+	daily = interval_type(FrequencyUnit.DAYS, anchor_at=datetime(2024, 3, 30, 7), timezone='Europe/Berlin')
+	assert daily.get_next_occurrence(datetime(2024, 3, 30, 7)) == datetime(2024, 3, 31, 6)
+	assert daily.get_next_occurrence(datetime(2024, 3, 31, 6)) == datetime(2024, 4, 1, 6)
+	# The estimate (local days elapsed) is corrected to the period that actually started
+	assert daily.get_interval_index(datetime(2024, 3, 31, 5, 59)) == 0
+	assert daily.get_interval_index(datetime(2024, 3, 31, 6)) == 1
+	assert daily.get_interval_index(datetime(2024, 4, 30, 6)) == 31
+
+
+def test_hourly_type_counts_exact_durations():
+	hourly = interval_type(FrequencyUnit.HOURS, value=6, anchor_at=datetime(2024, 3, 30, 22), timezone='Europe/Berlin')
+	assert hourly.get_next_occurrence(datetime(2024, 3, 31, 1)) == datetime(2024, 3, 31, 4)
+
+
+@pytest.mark.parametrize('zone, after, expected', [
+	# Monday 09:00 in New York is 14:00 UTC in winter
+	('America/New_York', datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 14, 0)),
+	# Monday 08:00 in Auckland is still Sunday in UTC
+	('Pacific/Auckland', datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 7, 19, 0)),
+])
+def test_cron_weekday_is_matched_in_the_type_zone(zone, after, expected):
+	hours = {'America/New_York': 9, 'Pacific/Auckland': 8}[zone]
+	weekly = TicketType(schedule=f"0 {hours} * * MON", timezone=zone)
+	assert weekly.get_next_occurrence(after) == expected
+
+
+def test_cron_fields():
+	schedule = CalendarSchedule.parse('*/15 9-17 * * MON-FRI')
+	assert schedule.next_after(datetime(2024, 1, 5, 17, 45)) == datetime(2024, 1, 8, 9, 0) # Friday evening -> Monday
+	assert schedule.next_after(datetime(2024, 1, 8, 9, 0)) == datetime(2024, 1, 8, 9, 15)
+	# Both day fields restricted: the 13th or any Friday
+	either = CalendarSchedule.parse('0 0 13 * FRI')
+	assert either.next_after(datetime(2024, 9, 1)) == datetime(2024, 9, 6)
+	assert either.next_after(datetime(2024, 9, 6)) == datetime(2024, 9, 13)
+
+
+def test_rrule_last_day_of_month():
+	schedule = CalendarSchedule.parse('RRULE:FREQ=MONTHLY;BYMONTHDAY=-1;BYHOUR=0;BYMINUTE=0')
+	assert schedule.next_after(datetime(2024, 1, 31)) == datetime(2024, 2, 29)
+	assert schedule.next_after(datetime(2024, 2, 29)) == datetime(2024, 3, 31)
+	assert schedule.next_after(datetime(2024, 4, 1)) == datetime(2024, 4, 30)
+
+
+def test_rrule_defaults_come_from_the_anchor():
+	weekly = CalendarSchedule.parse('FREQ=WEEKLY', anchor=datetime(2024, 1, 3, 18, 30)) # A Wednesday
+	assert weekly.next_after(datetime(2024, 1, 3, 18, 30)) == datetime(2024, 1, 10, 18, 30)
+
+
+@pytest.mark.parametrize('expression', [
+	'0 9 * *', # Four fields
+	'61 * * * *',
+	'*/0 * * * *',
+	'0 9 * * FUNDAY',
+	'0 0 30 2 *', # 30 February never happens
+	'FREQ=BOGUS',
+	'FREQ=DAILY;INTERVAL=2',
+	'FREQ=WEEKLY;BYDAY=1MO',
+	'FREQ=MONTHLY;BYMONTHDAY=32',
+	'FREQ=DAILY;COUNT=3',
+])
+def test_invalid_schedules_are_rejected(expression):
+	with pytest.raises(ValueError):
+		CalendarSchedule.parse(expression)
+
+
+def test_unknown_time_zone_is_rejected():
+	with pytest.raises(ValueError):
+		get_zone('Mars/Olympus_Mons')
+
+
+def test_refresh_computes_each_recurrence_once(app, monkeypatch):
+	calls = []
+	compute = TicketType.compute_next_due_at
+
+	def counting_compute(self, now=None):
+		calls.append(self.id)
+		return compute(self, now)
+
+	ticket_types = [
+		TicketType(id=index, schedule='0 9 * * MON', timezone='Europe/Berlin', last_distributed=datetime(2024, 1, 1, 8))
+		for index in range(1, 6)
+	] + [interval_type(FrequencyUnit.DAYS, anchor_at=datetime(2024, 1, 1), last_distributed=datetime(2024, 1, 1))]
+	executed = []
+	monkeypatch.setattr(TicketType, 'compute_next_due_at', counting_compute)
+	with app.app_context():
+		monkeypatch.setattr(db.session, 'execute', lambda statement, rows=None: executed.extend(rows or []))
+		monkeypatch.setattr(db.session, 'commit', lambda: None)
+		assert refresh_next_due_at(ticket_types, now=datetime(2024, 1, 2)) == 6
+	assert len(calls) == 2
+	assert {row['next_due_at'] for row in executed[:5]} == {datetime(2024, 1, 8, 8)}
+	assert executed[5]['next_due_at'] == datetime(2024, 1, 2)
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import TicketType, bump_table_versions, db, distribute_ticket_type, response_cache
+
+
+@pytest.mark.parametrize('path', ['/api/wallets?limit=2', '/api/ticket-types?limit=1'])
+def test_cached_page_keeps_next_cursor(app, seeded, path):
+	response_cache.clear()
+	client = app.test_client()
+	first = client.get(path)
+	second = client.get(path) # Served from the response cache
+	assert first.headers.get('X-Next-Cursor')
+	assert second.headers.get('X-Next-Cursor') == first.headers['X-Next-Cursor']
+	assert second.get_json() == first.get_json()
+
+
+def test_last_page_has_no_cursor_when_cached(app, seeded):
+	response_cache.clear()
+	client = app.test_client()
+	for _ in range(2):
+		assert 'X-Next-Cursor' not in client.get('/api/wallets?limit=1000').headers
+
+
+def test_if_none_match_returns_not_modified(app, seeded):
+	client = app.test_client()
+	etag = client.get('/api/wallets?limit=2').headers['ETag']
+	assert client.get('/api/wallets?limit=2', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_schedule_resync_invalidates_cached_ticket_types(app, seeded):
+	client = app.test_client()
+	type_id = client.post('/api/ticket-types', json={
+		'name': "Resync Type", 'distribute_quantity': 1, 'frequency_value': 1, 'frequency_unit': 'hours',
+	}).get_json()['id']
+	now = datetime.utcnow()
+	with app.app_context():
+		# Due according to a stale next_due_at, but no whole period has passed since the last distribution
+		ticket_type = db.session.get(TicketType, type_id)
+		ticket_type.anchor_at = ticket_type.last_distributed = now - timedelta(minutes=30)
+		ticket_type.next_due_at = now - timedelta(minutes=1)
+		bump_table_versions('ticket_type')
+		db.session.commit()
+
+	def listed_next_distribution():
+		types = client.get('/api/ticket-types?limit=1000').get_json()
+		return next(item['next_distribution_at'] for item in types if item['id'] == type_id)
+
+	stale = listed_next_distribution() # Now cached
+	with app.app_context():
+		assert distribute_ticket_type(db.session.get(TicketType, type_id), seeded['wallet_ids'], now) == 0
+	assert listed_next_distribution() != stale
+	assert listed_next_distribution() == (now + timedelta(minutes=30)).isoformat() + 'Z'
+	client.delete(f'/api/ticket-types/{type_id}')